@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Dump the calibration coefficients (pedestal and gain) of every telescope of a
+simtel file into one compact table.
+
+The simtel file is read only once: pedestals and gains are stored in the
+blocks that precede the first event, thus only the header blocks and the
+first event (see simtel_index.py) are decoded.
+
+The table is a Numpy ".npz" file containing:
+
+- "tel_id": the ID of the telescopes (1D array)
+- "cam_id": the camera ID of the telescopes (1D array)
+- "foclen": the focal length of the telescopes in meters (1D array)
+- "TELxxx_pedestal": the pedestal of telescope xxx (2D array: channel x pixel)
+- "TELxxx_gain": the PE/DC ratios of telescope xxx (2D array: channel x pixel)
+- "TELxxx_pixel_pos_x" and "TELxxx_pixel_pos_y": the pixels position of
+  telescope xxx in meters (1D arrays)
+
+Usage: ./calibration_table.py [-o TABLE_FILE] SIMTEL_FILE
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+
+from ctapipe.io.hessio import hessio_event_source
+import pyhessio
+
+import numpy as np
+
+import simtel_index
+import simtel_instrument
+import telescope_registry
+
+TABLE_FILE_EXTENSION = ".npz"
+
+
+def get_calibration_table_file_path(simtel_file_path):
+    """Return the default path of the calibration table of the
+    'simtel_file_path' file."""
+    return simtel_file_path + ".calibration" + TABLE_FILE_EXTENSION
+
+
+def is_calibration_table(file_path):
+    """Return True if 'file_path' is a calibration table (and not a simtel
+    file)."""
+    return file_path.endswith(TABLE_FILE_EXTENSION)
+
+
+def read_calibration(simtel_file_path, tel_id_list=None):
+    """
+    Read the calibration coefficients of the telescopes of a simtel file.
+
+    Parameters
+    ----------
+    simtel_file_path : str
+        The path of the simtel file to read.
+    tel_id_list : list of int
+        The telescopes to read (all the telescopes of the instrument if None).
+
+    Returns
+    -------
+    dict
+        The calibration of each telescope (key=telescope ID, value=a
+        dictionary with the "cam_id", "foclen", "pedestal", "gain",
+        "pixel_pos_x" and "pixel_pos_y" items).
+    """
+
+    instrument = simtel_instrument.read_instrument(simtel_file_path)
+
+    if tel_id_list is None:
+        tel_id_list = sorted(instrument.pixel_pos)
+
+    index = simtel_index.load_event_index(simtel_file_path)
+
+    calibration_dict = {}
+    tmp_dir = tempfile.mkdtemp(prefix="simtel_calibration_")
+
+    try:
+        # pyhessio only gives access to the calibration blocks once an event
+        # has been read: read the first one only
+        tmp_file_path = os.path.join(tmp_dir, "calibration.simtel")
+        simtel_index.write_event_file(simtel_file_path, index["events"][:1], tmp_file_path)
+
+        for event in hessio_event_source(tmp_file_path):
+            for tel_id in tel_id_list:
+                if tel_id in calibration_dict:
+                    continue
+
+                x, y = instrument.pixel_pos[tel_id]
+                foclen = instrument.optical_foclen[tel_id]
+                camera = telescope_registry.get_camera(simtel_file_path, tel_id)
+
+                calibration_dict[tel_id] = {
+                        "cam_id": camera["camera_id"],
+                        "foclen": float(foclen.value),
+                        "pedestal": np.array(pyhessio.get_pedestal(tel_id)),
+                        "gain": np.array(pyhessio.get_calibration(tel_id)),
+                        "pixel_pos_x": np.array(x.value),
+                        "pixel_pos_y": np.array(y.value)
+                    }
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return calibration_dict
+
+
+def save_calibration_table(calibration_dict, output_file_path):
+    """
+    Write the calibration table 'output_file_path' (see ``read_calibration()``
+    for the content of 'calibration_dict').
+    """
+
+    tel_id_list = sorted(calibration_dict)
+
+    array_dict = {
+            "tel_id": np.array(tel_id_list, dtype=np.int32),
+            "cam_id": np.array([calibration_dict[tel_id]["cam_id"] for tel_id in tel_id_list]),
+            "foclen": np.array([calibration_dict[tel_id]["foclen"] for tel_id in tel_id_list])
+        }
+
+    for tel_id in tel_id_list:
+        for key in ("pedestal", "gain", "pixel_pos_x", "pixel_pos_y"):
+            array_dict["TEL{:03d}_{}".format(tel_id, key)] = calibration_dict[tel_id][key]
+
+    with open(output_file_path, "wb") as fd:
+        np.savez_compressed(fd, **array_dict)
+
+
+def load_calibration_table(table_file_path):
+    """
+    Read the calibration table 'table_file_path'.
+
+    Returns
+    -------
+    dict
+        The calibration of each telescope (see ``read_calibration()``).
+    """
+
+    calibration_dict = {}
+
+    with np.load(table_file_path) as data:
+        for tel_id, cam_id, foclen in zip(data["tel_id"], data["cam_id"], data["foclen"]):
+            tel_id = int(tel_id)
+            prefix = "TEL{:03d}_".format(tel_id)
+            calibration_dict[tel_id] = {
+                    "cam_id": str(cam_id),
+                    "foclen": float(foclen),
+                    "pedestal": data[prefix + "pedestal"],
+                    "gain": data[prefix + "gain"],
+                    "pixel_pos_x": data[prefix + "pixel_pos_x"],
+                    "pixel_pos_y": data[prefix + "pixel_pos_y"]
+                }
+
+    return calibration_dict
+
+
+def get_telescope_calibration(file_path, tel_id):
+    """
+    Get the calibration of the telescope 'tel_id' from a calibration table or
+    from a simtel file (see ``read_calibration()`` for the returned
+    dictionary).
+    """
+
+    if is_calibration_table(file_path):
+        calibration_dict = load_calibration_table(file_path)
+    else:
+        calibration_dict = read_calibration(file_path, [tel_id])
+
+    if tel_id not in calibration_dict:
+        raise Exception("Error: telescope '{}' not found in {}.".format(tel_id, file_path))
+
+    return calibration_dict[tel_id]
+
+
+def main():
+    """Parse command options (sys.argv) and dump the calibration table of the
+    given simtel file."""
+
+    # PARSE OPTIONS ###########################################################
+
+    desc = "Dump the pedestal and gain of all telescopes of a simtel file into one table."
+    parser = argparse.ArgumentParser(description=desc)
+
+    parser.add_argument("--output", "-o", default=None,
+                        metavar="FILE",
+                        help="The output file path (default: SIMTEL_FILE.calibration.npz)")
+
+    parser.add_argument("fileargs", nargs=1, metavar="FILE",
+                        help="The simtel file to process")
+
+    args = parser.parse_args()
+
+    simtel_file_path = args.fileargs[0]
+
+    if args.output is None:
+        output_file_path = get_calibration_table_file_path(simtel_file_path)
+    else:
+        output_file_path = args.output
+
+    # DUMP THE TABLE ##########################################################
+
+    calibration_dict = read_calibration(simtel_file_path)
+    save_calibration_table(calibration_dict, output_file_path)
+
+    print("{}: {} telescopes".format(output_file_path, len(calibration_dict)))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,40 +2,42 @@
 # -*- coding: utf-8 -*-
 
 """
-Count the number of events in a simtel file.
+Count the number of events in simtel files.
 """
 
 import argparse
 
-import ctapipe
-from ctapipe.io.hessio import hessio_event_source
+import simtel_index
+import trigger_matrix
 
 
 def count_simtel_events(simtel_file_path):
 
-    # GET EVENT #############################################################
+    # GET THE TRIGGER MATRIX ################################################
 
-    # hessio_event_source returns a Python generator that streams data from an
-    # EventIO/HESSIO MC data file (e.g. a standard CTA data file).
-    # This generator contains ctapipe.core.Container instances ("event").
-    #
-    # Parameters:
-    # - max_events: maximum number of events to read
-    # - allowed_tels: select only a subset of telescope, if None, all are read.
-    source = hessio_event_source(simtel_file_path,
-                                 allowed_tels=None,
-                                 max_events=None)
+    # The event x telescope trigger matrix is built with a trigger-only scan
+    # of the simtel file and cached next to it (see trigger_matrix.py).
+    event_matrix = trigger_matrix.load_trigger_matrix(simtel_file_path)
+
+    num_event_dict = event_matrix.num_events_per_telescope()   # Number of events per telescope
+    total_num_events = len(event_matrix.event_ids)             # Total number of events
+
+    return num_event_dict, total_num_events
+
+
+def count_simtel_files_events(simtel_file_path_list, jobs=1):
+    """Count the events of several simtel files (scanned by 'jobs' worker
+    processes) and merge the results (see count_simtel_events)."""
 
     num_event_dict = {}   # Number of events per telescope
     total_num_events = 0  # Total number of events
 
-    for event in source:
-        total_num_events += 1
+    result_list = simtel_index.map_simtel_files(count_simtel_events, simtel_file_path_list, jobs)
 
-        for telescope_id in event["trig"]["tels_with_trigger"]:
-            if telescope_id not in num_event_dict:
-                num_event_dict[telescope_id] = 0
-            num_event_dict[telescope_id] += 1
+    for file_num_event_dict, file_total_num_events in result_list:
+        total_num_events += file_total_num_events
+        for telescope_id, num_events in file_num_event_dict.items():
+            num_event_dict[telescope_id] = num_event_dict.get(telescope_id, 0) + num_events
 
     return num_event_dict, total_num_events
 
@@ -46,18 +48,22 @@ if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description="List simtel content.")
 
-    parser.add_argument("fileargs", nargs=1, metavar="FILE",
-                        help="The simtel file to process")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        metavar="INTEGER",
+                        help="The number of files to scan in parallel (0 for all CPU cores)")
+
+    parser.add_argument("fileargs", nargs="+", metavar="FILE",
+                        help="The simtel files to process")
 
     args = parser.parse_args()
-    simtel_file_path = args.fileargs[0]
+    simtel_file_path_list = args.fileargs
 
     # DISPLAY IMAGES ##########################################################
 
-    num_event_dict, total_num_events = count_simtel_events(simtel_file_path)
+    num_event_dict, total_num_events = count_simtel_files_events(simtel_file_path_list, args.jobs)
 
     print("Number of events per telescope:")
-    for telescope_id, num_events in num_event_dict.items():
+    for telescope_id, num_events in sorted(num_event_dict.items()):
         print("- Telescope {:03}: {} event{}".format(telescope_id, num_events, "s" if num_events > 1 else ""))
 
     print()
@@ -10,7 +10,8 @@ import numpy as np
 import sys
 
 import ctapipe
-from ctapipe.io.hessio import hessio_event_source
+
+import simtel_index
 
 
 def recursive_print(var, level=0):
@@ -33,21 +34,9 @@ def list_simtel_content(simtel_file_path, tel_num, event_id):
 
     # GET EVENT #############################################################
 
-    # hessio_event_source returns a Python generator that streams data from an
-    # EventIO/HESSIO MC data file (e.g. a standard CTA data file).
-    # This generator contains ctapipe.core.Container instances ("event").
-    # 
-    # Parameters:
-    # - max_events: maximum number of events to read
-    # - allowed_tels: select only a subset of telescope, if None, all are read.
-    source = hessio_event_source(simtel_file_path, allowed_tels=[tel_num])
-
-    event = None
-
-    for ev in source:
-        if int(ev.dl0.event_id) == event_id:
-            event = ev
-            break
+    # The event is read through the simtel file's event index (see
+    # simtel_index.py): the events before it are not decoded.
+    event = simtel_index.get_event(simtel_file_path, event_id, allowed_tels=[tel_num])
 
     if event is None:
         print("Error: event '{}' not found for telescope '{}'.".format(event_id, tel_num))
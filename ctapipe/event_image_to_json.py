@@ -2,92 +2,78 @@
 # -*- coding: utf-8 -*-
 
 """
-Export a simtel camera image to a JSON file.
+Export a simtel camera image to a JSON file (or to a binary ".npz" file, see
+image_io.py).
 """
 
 import argparse
 
-import ctapipe
-from ctapipe.io.hessio import hessio_event_source
-import pyhessio
-
 from matplotlib import pyplot as plt
 
-import json
+import numpy as np
 
 import sys
 
-
-def get_mc_calibration_coeffs(tel_id):
-    """
-    Get the calibration coefficients from the MC data file to the
-    data. This is ahack (until we have a real data structure for the
-    calibrated data), it should move into `ctapipe.io.hessio_event_source`.
-
-    RETURNS
-    -------
-    (pedestal, gains) : arrays of the pedestal and pe/dc ratios.
-    """
-    pedestal = pyhessio.get_pedestal(tel_id)[0]
-    gains = pyhessio.get_calibration(tel_id)[0]
-
-    return pedestal, gains
-
-
-def apply_mc_calibration(adcs, tel_id):
-    """
-    Apply basic calibration
-    """
-    peds, gains = get_mc_calibration_coeffs(tel_id)
-
-    if adcs.ndim > 1:  # if it's per-sample need to correct the peds
-        # TODO ???
-        calibrated_image = ((adcs - peds[:, np.newaxis] / adcs.shape[1]) * gains[:, np.newaxis])
-    else:
-        calibrated_image = (adcs - peds) * gains
-
-    return calibrated_image
+import image_io
+import mc_calibration
+import simtel_index
+import telescope_registry
+import waveform
 
 
 def get_image_array(simtel_file_path, tel_id, event_id):
 
     # GET EVENT ###############################################################
 
-    # hessio_event_source returns a Python generator that streams data from an
-    # EventIO/HESSIO MC data file (e.g. a standard CTA data file).
-    # This generator contains ctapipe.core.Container instances ("event").
-    # 
-    # Parameters:
-    # - max_events: maximum number of events to read
-    # - allowed_tels: select only a subset of telescope, if None, all are read.
-    source = hessio_event_source(simtel_file_path, allowed_tels=[tel_id])
-
-    event = None
-
-    for ev in source:
-        if int(ev.dl0.event_id) == event_id:
-            event = ev
-            break
+    # The event is read through the simtel file's event index (see
+    # simtel_index.py): the events before it are not decoded.
+    event = simtel_index.get_event(simtel_file_path, event_id, allowed_tels=[tel_id])
 
     if event is None:
         print("Error: event '{}' not found for telescope '{}'.".format(event_id, tel_id))
         sys.exit(1)
 
-    # GET IMAGE ###############################################################
+    return event_to_image_dict(event, simtel_file_path, tel_id, event_id)
 
-    # GET TIME-VARYING EVENT
 
-    #data = event.dl0.tel[tel_id].adc_samples[channel]
-    #for ii in range(data.shape[1]):
-    #    image = data[:, ii]
+def event_to_image_dict(event, simtel_file_path, tel_id, event_id):
+    """
+    Make the image dictionary (exported in JSON or binary files, see
+    image_io.py) of the telescope 'tel_id' for the (already read) 'event'.
+
+    Images and pixels position are numpy arrays (converted to lists in JSON
+    files).
+    """
+
+    # GET IMAGE ###############################################################
 
     # GET INTEGRATED EVENT
 
     channel = 0       # TODO: save all channels
     image = event.dl0.tel[tel_id].adc_sums[channel]
 
-    pedestal_image, gains_image = get_mc_calibration_coeffs(tel_id)
-    calibrated_image = apply_mc_calibration(image, tel_id)
+    run_key = mc_calibration.get_run_key(event)
+    pedestals, gains = mc_calibration.get_mc_calibration_coeffs(tel_id, run_key)
+    pedestal_image, gains_image = pedestals[channel], gains[channel]
+    calibrated_image = mc_calibration.apply_channel_calibration(image, tel_id, run_key, channel)
+
+    # GET TIME-VARYING EVENT
+
+    # The charge and the pulse time of all pixels are extracted at once from
+    # the (channel x pixel x sample) waveforms (see waveform.py)
+    waveforms = waveform.get_waveforms(event, tel_id)
+
+    if waveforms.size > 0:
+        waveforms = waveform.subtract_pedestal(waveforms, pedestals)
+
+        width = min(waveform.DEFAULT_WINDOW_WIDTH, waveforms.shape[-1])
+        charges, times = waveform.integrate_sliding_window(waveforms, width)
+
+        sliding_window_image = charges[channel] * gains[channel]
+        peak_time_image = times[channel]
+    else:
+        sliding_window_image = None
+        peak_time_image = None
 
     # GET PHOTOELECTRON IMAGE #################################################
 
@@ -98,25 +84,27 @@ def get_image_array(simtel_file_path, tel_id, event_id):
     x, y = event.meta.pixel_pos[tel_id]
     foclen = event.meta.optical_foclen[tel_id]
 
-    geom = ctapipe.io.CameraGeometry.guess(x, y, foclen)
+    geom = telescope_registry.get_event_camera_geometry(event, tel_id)
 
     # MAKE THE IMAGE DICT #####################################################
 
     image_dict = {
             "event_id": event_id,
             "tel_id": tel_id,
-            "image": image.tolist(),
-            "calibrated_image": calibrated_image.tolist(),
-            "photoelectron_image": pe_image.tolist(),
-            "pedestal_image": pedestal_image.tolist(),
-            "gains_image": gains_image.tolist(),
+            "image": np.asarray(image),
+            "calibrated_image": np.asarray(calibrated_image),
+            "photoelectron_image": np.asarray(pe_image),
+            "pedestal_image": np.asarray(pedestal_image),
+            "gains_image": np.asarray(gains_image),
+            "sliding_window_image": sliding_window_image,
+            "peak_time_image": peak_time_image,
             "camera_id": geom.cam_id,
             "pixel_type": geom.pix_type,
             "foclen": float(foclen.value),
             "telescope_position": [float(v) for v in event.meta.tel_pos],
-            "pixel_pos_x": [float(v.value) for v in x],
-            "pixel_pos_y": [float(v.value) for v in y],
-            "simtel_file": event.meta.hessio__input
+            "pixel_pos_x": np.asarray(x.value, dtype=np.float64),
+            "pixel_pos_y": np.asarray(y.value, dtype=np.float64),
+            "simtel_file": simtel_file_path
             }
 
     return image_dict
@@ -126,7 +114,7 @@ if __name__ == '__main__':
 
     # PARSE OPTIONS ###########################################################
 
-    desc = "Export a simtel camera image to a JSON file."
+    desc = "Export a simtel camera image to a JSON file (or to a binary file)."
     parser = argparse.ArgumentParser(description=desc)
 
     parser.add_argument("--telescope", "-t", type=int, required=True,
@@ -139,7 +127,10 @@ if __name__ == '__main__':
 
     parser.add_argument("--output", "-o", default=None,
                         metavar="FILE",
-                        help="The output file path")
+                        help="The output file path (a binary file if it ends with '.npz', a JSON file otherwise)")
+
+    parser.add_argument("--binary", "-b", action="store_true",
+                        help="Write a binary '.npz' file instead of a JSON file (if --output is not set)")
 
     parser.add_argument("fileargs", nargs=1, metavar="FILE",
                         help="The simtel file to process")
@@ -151,15 +142,14 @@ if __name__ == '__main__':
     simtel_file_path = args.fileargs[0]
 
     if args.output is None:
-        output_file_path = "TEL{:03d}_EV{:05d}.json".format(tel_id, event_id)
+        extension = image_io.BINARY_EXTENSION if args.binary else image_io.JSON_EXTENSION
+        output_file_path = "TEL{:03d}_EV{:05d}{}".format(tel_id, event_id, extension)
     else:
         output_file_path = args.output
 
-    # EXPORT THE IMAGE AND METAS TO A JSON FILE ###############################
+    # EXPORT THE IMAGE AND METAS TO A JSON (OR BINARY) FILE ##################
 
     image_dict = get_image_array(simtel_file_path, tel_id, event_id)
 
-    with open(output_file_path, "w") as fd:
-        #json.dump(image_dict, fd)                           # no pretty print
-        json.dump(image_dict, fd, sort_keys=True, indent=4)  # pretty print format
+    image_io.save_image_dict(image_dict, output_file_path)
 
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Select the events of simtel files on their MC truth and their triggered
+telescopes before decoding them.
+
+The selection predicates (MC energy, core position, direction, trigger
+multiplicity and triggered telescopes) are evaluated on the event index of the
+simtel file (see simtel_index.py): the events that don't match are never
+decoded. The matching events are copied in a temporary simtel file that is
+then read with hessio_event_source.
+
+The selection options are added to the command line of the extraction and
+plotting tools with ``add_selection_arguments()``.
+
+Usage: ./event_selection.py [SELECTION OPTIONS] FILE [FILE ...]
+       (print the ID of the selected events)
+"""
+
+import argparse
+import math
+import os
+import shutil
+import tempfile
+
+from ctapipe.io.hessio import hessio_event_source
+
+import simtel_index
+
+
+def parse_range(range_str):
+    """
+    Parse a "MIN,MAX" command line range (either bound can be omitted, e.g.
+    "1.5," or ",10").
+
+    Returns
+    -------
+    tuple
+        The lower and the upper bound of the range (None for an omitted bound).
+    """
+    bound_list = range_str.split(",")
+
+    if len(bound_list) != 2:
+        raise argparse.ArgumentTypeError("'{}' is not a MIN,MAX range".format(range_str))
+
+    try:
+        return tuple(float(bound) if bound.strip() != "" else None for bound in bound_list)
+    except ValueError:
+        raise argparse.ArgumentTypeError("'{}' is not a MIN,MAX range".format(range_str))
+
+
+def _in_range(value, value_range):
+    if value_range is None:
+        return True
+
+    lower_bound, upper_bound = value_range
+
+    return ((lower_bound is None) or (value >= lower_bound)) and \
+           ((upper_bound is None) or (value <= upper_bound))
+
+
+class EventSelection(object):
+    """
+    Selection predicates on the events of a simtel file.
+
+    Each predicate is ignored if it is None.
+
+    Attributes
+    ----------
+    energy_range : tuple
+        The (min, max) MC energy of the primary particle (in TeV).
+    core_x_range : tuple
+        The (min, max) x position of the shower core (in meters).
+    core_y_range : tuple
+        The (min, max) y position of the shower core (in meters).
+    alt_range : tuple
+        The (min, max) altitude of the primary particle (in radians).
+    az_range : tuple
+        The (min, max) azimuth of the primary particle (in radians).
+    min_multiplicity : int
+        The minimum number of triggered telescopes.
+    tel_id_list : list of int
+        The telescopes that must have triggered.
+    """
+
+    def __init__(self,
+                 energy_range=None,
+                 core_x_range=None,
+                 core_y_range=None,
+                 alt_range=None,
+                 az_range=None,
+                 min_multiplicity=None,
+                 tel_id_list=None):
+        self.energy_range = energy_range
+        self.core_x_range = core_x_range
+        self.core_y_range = core_y_range
+        self.alt_range = alt_range
+        self.az_range = az_range
+        self.min_multiplicity = min_multiplicity
+        self.tel_id_list = tel_id_list
+
+    @property
+    def mc_ranges(self):
+        """The MC truth predicates (a dictionary: key=index "mc" item,
+        value=range)."""
+        return {"energy": self.energy_range,
+                "core_x": self.core_x_range,
+                "core_y": self.core_y_range,
+                "alt": self.alt_range,
+                "az": self.az_range}
+
+    def is_empty(self):
+        """Return True if all the events are selected."""
+        return all(value_range is None for value_range in self.mc_ranges.values()) and \
+               (self.min_multiplicity is None) and (self.tel_id_list is None)
+
+    def match(self, entry):
+        """
+        Return True if the event described by the index 'entry' (see
+        ``simtel_index.build_event_index()``) is selected.
+        """
+
+        tels_with_trigger = entry["tels_with_trigger"]
+
+        if (self.min_multiplicity is not None) and (len(tels_with_trigger) < self.min_multiplicity):
+            return False
+
+        if (self.tel_id_list is not None) and not set(self.tel_id_list).issubset(tels_with_trigger):
+            return False
+
+        for key, value_range in self.mc_ranges.items():
+            if value_range is not None:
+                if (entry["mc"] is None) or not _in_range(entry["mc"][key], value_range):
+                    return False
+
+        return True
+
+
+def add_selection_arguments(parser):
+    """Add the event selection options to the 'parser' argparse parser."""
+
+    group = parser.add_argument_group("event selection",
+                                      "Events that don't match are not decoded (ranges are 'MIN,MAX', either bound can be omitted)")
+
+    group.add_argument("--energy", type=parse_range, metavar="MIN,MAX",
+                       help="Select events by MC energy (in TeV)")
+
+    group.add_argument("--core-x", type=parse_range, metavar="MIN,MAX",
+                       help="Select events by MC shower core x position (in meters)")
+
+    group.add_argument("--core-y", type=parse_range, metavar="MIN,MAX",
+                       help="Select events by MC shower core y position (in meters)")
+
+    group.add_argument("--alt", type=parse_range, metavar="MIN,MAX",
+                       help="Select events by MC altitude (in degrees)")
+
+    group.add_argument("--az", type=parse_range, metavar="MIN,MAX",
+                       help="Select events by MC azimuth (in degrees)")
+
+    group.add_argument("--min-multiplicity", type=int, metavar="INTEGER",
+                       help="Select events with at least this number of triggered telescopes")
+
+    group.add_argument("--triggered", metavar="INTEGER LIST",
+                       help="Select events where all these telescopes have triggered (telescopes number separated by a comma)")
+
+
+def _degrees_to_radians(value_range):
+    if value_range is None:
+        return None
+    return tuple(math.radians(bound) if bound is not None else None for bound in value_range)
+
+
+def get_selection(args):
+    """Make the EventSelection defined by the parsed command line 'args' (see
+    ``add_selection_arguments()``)."""
+
+    if args.triggered is None:
+        tel_id_list = None
+    else:
+        tel_id_list = [int(tel_id_str) for tel_id_str in args.triggered.split(",")]
+
+    return EventSelection(energy_range=args.energy,
+                          core_x_range=args.core_x,
+                          core_y_range=args.core_y,
+                          alt_range=_degrees_to_radians(args.alt),
+                          az_range=_degrees_to_radians(args.az),
+                          min_multiplicity=args.min_multiplicity,
+                          tel_id_list=tel_id_list)
+
+
+def select_entries(simtel_file_path, selection=None, event_id_filter_list=None):
+    """
+    Return the index entries (see ``simtel_index.build_event_index()``) of the
+    events of 'simtel_file_path' that match 'selection' and whose ID is in
+    'event_id_filter_list' (all events if None).
+    """
+
+    index = simtel_index.load_event_index(simtel_file_path)
+
+    if event_id_filter_list is not None:
+        event_id_filter_set = set(event_id_filter_list)      # O(1) membership tests
+
+    return [entry for entry in index["events"]
+            if ((event_id_filter_list is None) or (entry["event_id"] in event_id_filter_set))
+            and ((selection is None) or selection.match(entry))]
+
+
+def iter_selected_events(simtel_file_path, selection=None, event_id_filter_list=None, allowed_tels=None):
+    """
+    Iterate over the (decoded) events of 'simtel_file_path' that match
+    'selection' and whose ID is in 'event_id_filter_list'.
+
+    The events that don't match are not decoded: the matching events are
+    copied in a temporary simtel file (unless all events match, then
+    'simtel_file_path' is read directly).
+
+    Parameters
+    ----------
+    simtel_file_path : str
+        The path of the simtel file to read.
+    selection : EventSelection
+        The selection predicates (all events are selected if None).
+    event_id_filter_list : list of int
+        The events to select (all events if None).
+    allowed_tels : list of int
+        Select only a subset of telescope, if None, all are read
+        (see ``hessio_event_source``).
+
+    Yields
+    ------
+    ctapipe.core.Container
+        The selected events.
+    """
+
+    if ((selection is None) or selection.is_empty()) and (event_id_filter_list is None):
+        yield from hessio_event_source(simtel_file_path, allowed_tels=allowed_tels)
+        return
+
+    entry_list = select_entries(simtel_file_path, selection, event_id_filter_list)
+
+    if len(entry_list) == 0:
+        return
+
+    tmp_dir = tempfile.mkdtemp(prefix="simtel_selection_")
+
+    try:
+        tmp_file_path = os.path.join(tmp_dir, "selection.simtel")
+        simtel_index.write_event_file(simtel_file_path, entry_list, tmp_file_path)
+
+        yield from hessio_event_source(tmp_file_path, allowed_tels=allowed_tels)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main():
+    """Parse command options (sys.argv) and print the ID of the selected
+    events of the given simtel files."""
+
+    # PARSE OPTIONS ###########################################################
+
+    desc = "Print the ID of the selected events of the given simtel files (events are not decoded)."
+    parser = argparse.ArgumentParser(description=desc)
+
+    add_selection_arguments(parser)
+
+    parser.add_argument("fileargs", nargs="+", metavar="FILE",
+                        help="The simtel files to process")
+
+    args = parser.parse_args()
+
+    selection = get_selection(args)
+
+    # PRINT THE SELECTED EVENTS ###############################################
+
+    for simtel_file_path in args.fileargs:
+        for entry in select_entries(simtel_file_path, selection):
+            print(simtel_file_path, entry["event_id"])
+
+
+if __name__ == '__main__':
+    main()
@@ -8,35 +8,24 @@ Export to a JSON file the camera's geometry defined in a given simtel file.
 import argparse
 
 import ctapipe
-from ctapipe.io.hessio import hessio_event_source
 
 from matplotlib import pyplot as plt
 
 import json
 
-def export_cameras_geometry(simtel_file_path, tel_id):
+import simtel_instrument
 
-    source = hessio_event_source(simtel_file_path)
 
-    for event in source:
-        #######################################################################
-        # CAUTION:                                                            #
-        # event.meta.optical_foclen and event.meta.tel_pos are only filled    #
-        # when source is traversed !                                          #
-        # The current value of these two variables is not the actual value    #
-        # for the current event but the cumulated value of past events !      #
-        #######################################################################
+def export_cameras_geometry(simtel_file_path, tel_id):
 
-        print("Event", event.dl0.event_id)
-        #print("tels_with_trigger", event.trig.tels_with_trigger)
-        #print("tels_with_data", event.dl0.tels_with_data)
-        #print("optical_foclen", event.meta.optical_foclen)
-        #print("tel_pos", event.meta.tel_pos)
+    # The instrument description is read from the run header and camera
+    # settings blocks only (events are not read)
+    instrument = simtel_instrument.read_instrument(simtel_file_path)
 
     # GET CAMERAS GEOMETRY ################################
     
-    x, y = event.meta.pixel_pos[tel_id]
-    foclen = event.meta.optical_foclen[tel_id]
+    x, y = instrument.pixel_pos[tel_id]
+    foclen = instrument.optical_foclen[tel_id]
 
     geom = ctapipe.io.CameraGeometry.guess(x, y, foclen)
 
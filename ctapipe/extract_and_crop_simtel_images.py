@@ -25,92 +25,63 @@
 """
 
 __all__ = ['extract_image',
+           'crop_event_images',
            'crop_sctcam_image',
+           'crop_camera_image',
            'crop_astri_image']
 
 import argparse
-from astropy.io import fits
-import numpy as np
 import os
 
-import ctapipe
-from ctapipe.io.hessio import hessio_event_source
-import pyhessio
-
-def get_mc_calibration_coeffs(tel_id):
-    """
-    Get the calibration coefficients from the MC data file to the
-    data. This is ahack (until we have a real data structure for the
-    calibrated data), it should move into `ctapipe.io.hessio_event_source`.
-
-    RETURNS
-    -------
-    (pedestal, gains) : arrays of the pedestal and pe/dc ratios.
-    """
-    pedestal = pyhessio.get_pedestal(tel_id)[0]
-    gains = pyhessio.get_calibration(tel_id)[0]
-
-    return pedestal, gains
-
-
-def apply_mc_calibration(adcs, tel_id):
-    """
-    Apply basic calibration
-    """
-    peds, gains = get_mc_calibration_coeffs(tel_id)
-
-    if adcs.ndim > 1:  # if it's per-sample need to correct the peds
-        # TODO ???
-        calibrated_image = ((adcs - peds[:, np.newaxis] / adcs.shape[1]) * gains[:, np.newaxis])
-    else:
-        calibrated_image = (adcs - peds) * gains
-
-    return calibrated_image
-
+import fits_io
+import image_crop
+from image_crop import crop_astri_image
+import mc_calibration
+import simtel_index
+import telescope_registry
 
 def extract_image(simtel_file_path, tel_num, event_id, channel=0):
 
     # GET EVENT #############################################################
 
-    # hessio_event_source returns a Python generator that streams data from an
-    # EventIO/HESSIO MC data file (e.g. a standard CTA data file).
-    # This generator contains ctapipe.core.Container instances ("event").
-    # 
-    # Parameters:
-    # - max_events: maximum number of events to read
-    # - allowed_tels: select only a subset of telescope, if None, all are read.
-    source = hessio_event_source(simtel_file_path, allowed_tels=[tel_num])
-
-    event = None
-
-    for ev in source:
-        if int(ev.dl0.event_id) == event_id:
-            event = ev
-            break
+    # The event is read through the simtel file's event index (see
+    # simtel_index.py): the events before it are not decoded.
+    event = simtel_index.get_event(simtel_file_path, event_id, allowed_tels=[tel_num])
 
     if event is None:
         raise Exception("Error: event '{}' not found for telescope '{}'.".format(event_id, tel_num))
 
-    # CHECK THE IMAGE GEOMETRY (ASTRI AND SCTCAM ONLY) ######################
+    return crop_event_images(event, tel_num, channel)
+
+
+def crop_event_images(event, tel_num, channel=0):
+    """
+    Get the cropped calibrated image and the cropped photoelectron image of
+    the telescope 'tel_num' for the (already read) 'event'.
+
+    Returns
+    -------
+    tuple of numpy.array
+        The cropped calibrated image and the cropped photoelectron image.
+    """
+
+    # CHECK THE IMAGE GEOMETRY (RECTANGULAR PIXELS ONLY) ####################
 
     x, y = event.meta.pixel_pos[tel_num]
-    foclen = event.meta.optical_foclen[tel_num]
-    geom = ctapipe.io.CameraGeometry.guess(x, y, foclen)
+    geom = telescope_registry.get_event_camera_geometry(event, tel_num)
 
     if geom.pix_type != "rectangular":
-        raise ValueError("The input image is not a valide ASTRI or SCTCam telescope image.")
+        raise ValueError("The input image is not a valide rectangular pixels camera image (e.g. ASTRI or SCTCam).")
 
     # GET AND CROP THE IMAGE ################################################
 
     uncalibrated_image = event.dl0.tel[tel_num].adc_sums[channel]         # 1D numpy array
-    calibrated_image = apply_mc_calibration(uncalibrated_image, tel_num)
+    calibrated_image = mc_calibration.apply_channel_calibration(uncalibrated_image, tel_num, mc_calibration.get_run_key(event), channel)
 
     if geom.cam_id == "ASTRI":
         cropped_img = crop_astri_image(calibrated_image)
-    elif geom.cam_id == "SCTCam":
-        cropped_img = crop_sctcam_image(calibrated_image)
     else:
-        raise ValueError("The input image is not a valide ASTRI or SCTCam telescope image.")
+        cropped_img = crop_camera_image(calibrated_image, geom.cam_id, x, y)
 
     # GET AND CROP THE PHOTOELECTRON IMAGE ##################################
 
@@ -118,15 +89,13 @@ def extract_image(simtel_file_path, tel_num, event_id, channel=0):
 
     if geom.cam_id == "ASTRI":
         cropped_pe_img = crop_astri_image(pe_image)
-    elif geom.cam_id == "SCTCam":
-        cropped_pe_img = crop_sctcam_image(pe_image)
     else:
-        raise ValueError("The input image is not a valide ASTRI or SCTCam telescope image.")
+        cropped_pe_img = crop_camera_image(pe_image, geom.cam_id, x, y)
 
     return (cropped_img, cropped_pe_img)
 
 
-def crop_sctcam_image(input_img):
+def crop_sctcam_image(input_img, pixel_pos_x, pixel_pos_y):
     """
     Crop images comming form "SCTCam" telescopes in order to get regular 2D "rectangular"
     images directly usable with most image processing tools.
@@ -135,86 +104,56 @@ def crop_sctcam_image(input_img):
     ----------
     input_img : numpy.array
         The image to crop
+    pixel_pos_x, pixel_pos_y : numpy.array
+        The position of the camera pixels (e.g. ``event.meta.pixel_pos[tel_id]``).
 
     Returns
     -------
     A numpy.array containing the cropped image.
     """
 
-    raise Exception("Not yet implemented")
+    return crop_camera_image(input_img, "SCTCam", pixel_pos_x, pixel_pos_y)
 
 
-def crop_astri_image(input_img):
+def crop_camera_image(input_img, cam_id, pixel_pos_x, pixel_pos_y):
     """
-    Crop images comming form "ASTRI" telescopes in order to get regular 2D "rectangular"
-    images directly usable with most image processing tools.
+    Map images comming from any rectangular pixels camera on a regular 2D
+    grid derived from the pixels position (see ``image_crop.make_grid_map()``).
+    Grid cells without pixel are set to 0.
 
     Parameters
     ----------
     input_img : numpy.array
         The image to crop
+    cam_id : str
+        The camera ID (the grid map is cached for each camera).
+    pixel_pos_x, pixel_pos_y : numpy.array
+        The position of the camera pixels (e.g. ``event.meta.pixel_pos[tel_id]``).
 
     Returns
     -------
     A numpy.array containing the cropped image.
     """
 
-    # Check the image
-    if len(input_img) != (37*64):
-        raise ValueError("The input image is not a valide ASTRI telescope image.")
-
-    # Make the transformation map
-    img_map = np.zeros([8*5, 8*5], dtype=int)
-
-    img_map[0*8:1*8, 0*8:1*8] = np.arange(64).reshape([8,8])[::-1,:] + 29 * 64
-    img_map[0*8:1*8, 1*8:2*8] = np.arange(64).reshape([8,8])[::-1,:] + 30 * 64
-    img_map[0*8:1*8, 2*8:3*8] = np.arange(64).reshape([8,8])[::-1,:] + 31 * 64
-    img_map[0*8:1*8, 3*8:4*8] = np.arange(64).reshape([8,8])[::-1,:] + 32 * 64
-    img_map[0*8:1*8, 4*8:5*8] = np.arange(64).reshape([8,8])[::-1,:] + 33 * 64
+    return image_crop.get_grid_map(cam_id, pixel_pos_x, pixel_pos_y).crop(input_img)
 
-    img_map[1*8:2*8, 0*8:1*8] = np.arange(64).reshape([8,8])[::-1,:] + 23 * 64
-    img_map[1*8:2*8, 1*8:2*8] = np.arange(64).reshape([8,8])[::-1,:] + 24 * 64
-    img_map[1*8:2*8, 2*8:3*8] = np.arange(64).reshape([8,8])[::-1,:] + 25 * 64
-    img_map[1*8:2*8, 3*8:4*8] = np.arange(64).reshape([8,8])[::-1,:] + 26 * 64
-    img_map[1*8:2*8, 4*8:5*8] = np.arange(64).reshape([8,8])[::-1,:] + 27 * 64
 
-    img_map[2*8:3*8, 0*8:1*8] = np.arange(64).reshape([8,8])[::-1,:] + 16 * 64
-    img_map[2*8:3*8, 1*8:2*8] = np.arange(64).reshape([8,8])[::-1,:] + 17 * 64
-    img_map[2*8:3*8, 2*8:3*8] = np.arange(64).reshape([8,8])[::-1,:] + 18 * 64
-    img_map[2*8:3*8, 3*8:4*8] = np.arange(64).reshape([8,8])[::-1,:] + 19 * 64
-    img_map[2*8:3*8, 4*8:5*8] = np.arange(64).reshape([8,8])[::-1,:] + 20 * 64
-
-    img_map[3*8:4*8, 0*8:1*8] = np.arange(64).reshape([8,8])[::-1,:] +  9 * 64
-    img_map[3*8:4*8, 1*8:2*8] = np.arange(64).reshape([8,8])[::-1,:] + 10 * 64
-    img_map[3*8:4*8, 2*8:3*8] = np.arange(64).reshape([8,8])[::-1,:] + 11 * 64
-    img_map[3*8:4*8, 3*8:4*8] = np.arange(64).reshape([8,8])[::-1,:] + 12 * 64
-    img_map[3*8:4*8, 4*8:5*8] = np.arange(64).reshape([8,8])[::-1,:] + 13 * 64
-
-    img_map[4*8:5*8, 0*8:1*8] = np.arange(64).reshape([8,8])[::-1,:] +  3 * 64
-    img_map[4*8:5*8, 1*8:2*8] = np.arange(64).reshape([8,8])[::-1,:] +  4 * 64
-    img_map[4*8:5*8, 2*8:3*8] = np.arange(64).reshape([8,8])[::-1,:] +  5 * 64
-    img_map[4*8:5*8, 3*8:4*8] = np.arange(64).reshape([8,8])[::-1,:] +  6 * 64
-    img_map[4*8:5*8, 4*8:5*8] = np.arange(64).reshape([8,8])[::-1,:] +  7 * 64
-
-    # Make the output image
-    cropped_img = input_img[[img_map.ravel()]].reshape([8*5, 8*5])
-
-    return cropped_img
-
-
-def save_fits(img, pe_img, output_file_path):
+def save_fits(img, pe_img, output_file_path, compression=None):
     """
     img is the image and it should be a 2D or a 3D numpy array with values.
+
+    Images are written in tile-compressed HDUs if 'compression' is given
+    (see ``fits_io.get_compression()``).
     """
 
     if img.ndim not in (2, 3):
         raise Exception("The input image should be a 2D or a 3D numpy array.")
 
     # http://docs.astropy.org/en/stable/io/fits/appendix/faq.html#how-do-i-create-a-multi-extension-fits-file-from-scratch
-    hdu0 = fits.PrimaryHDU(img)
-    hdu1 = fits.ImageHDU(pe_img)
+    hdu0 = fits_io.make_hdu(img, primary=True, compression=compression)
+    hdu1 = fits_io.make_hdu(pe_img, compression=compression)
 
-    hdu_list = fits.HDUList([hdu0, hdu1])
+    hdu_list = fits_io.make_hdu_list([hdu0, hdu1], compression)
 
     if os.path.isfile(output_file_path):
         os.remove(output_file_path)
@@ -245,11 +184,15 @@ def main():
                         metavar="FILE",
                         help="The output file path")
 
+    fits_io.add_compression_arguments(parser)
+
     parser.add_argument("fileargs", nargs=1, metavar="FILE",
                         help="The simtel file to process")
 
     args = parser.parse_args()
 
+    compression = fits_io.get_compression(args, parser)
+
     tel_num = args.telescope
     channel = args.channel
     event_id = args.event
@@ -266,7 +209,7 @@ def main():
 
     # SAVE THE IMAGE ##########################################################
 
-    save_fits(cropped_img, cropped_pe_img, output_file_path)
+    save_fits(cropped_img, cropped_pe_img, output_file_path, compression)
 
 
 if __name__ == "__main__":
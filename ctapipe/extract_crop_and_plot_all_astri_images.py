@@ -21,11 +21,39 @@
 # THE SOFTWARE.
 
 """
-... TODO
+Extract the images of the ASTRI telescopes of simtel files, calibrate them
+and crop them in 40x40 images (see image_crop.py), for the cleaning
+benchmark.
+
+Only the ASTRI telescopes can be cropped: by default all the ASTRI
+telescopes of each simtel file are processed (``--camera ASTRI``);
+telescopes explicitly given with ``--telescope`` must be ASTRI telescopes.
+
+By default, one FITS file is written per image (calibrated image in the
+primary HDU, photoelectron image in the second HDU, metadata in the primary
+header). With ``--cube``, one FITS file is written per simtel file and
+telescope ("<simtel_file>_TELxxx.fits"):
+
+- primary HDU: the calibrated images (3D array: image x 40 x 40);
+- "PE_IMAGES" HDU: the photoelectron images (3D array: image x 40 x 40);
+- "EVENTS" HDU: a binary table with the metadata of each image (one row per
+  image, in the cube order).
+
+Images can be written in tile-compressed HDUs (``--compress``, see
+fits_io.py): the primary HDU is then empty (it only holds the header
+metadata) and the images are in the following HDUs.
+
+With ``--hdf5 FILE``, the images of all the simtel files are appended to one
+chunked and compressed HDF5 file (see hdf5_io.py) instead of FITS files.
+
+Usage: ./extract_crop_and_plot_all_astri_images.py [-t INTEGER LIST] [--camera STRING LIST]
+           [-e INTEGER LIST] [-o DIRECTORY] [--cube] [FITS COMPRESSION OPTIONS] [--hdf5 FILE]
+           [SELECTION OPTIONS] FILE [FILE ...]
 """
 
 __all__ = ['extract_images',
-           'crop_astri_image']
+           'crop_astri_image',
+           'TelescopeCube']
 
 import argparse
 from astropy.io import fits
@@ -33,13 +61,26 @@ import numpy as np
 import os
 import sys
 
-import ctapipe
-from ctapipe.io.hessio import hessio_event_source
-import pyhessio
-
-DEFAULT_TEL_FILTER = list(range(1, 34))   # TODO
-
-def get_mc_calibration_coeffs(tel_id):
+import event_selection
+import fits_io
+import hdf5_io
+import image_crop
+from image_crop import crop_astri_image
+import mc_calibration
+import telescope_registry
+
+DEFAULT_CAMERA_FILTER = ["ASTRI"]
+
+# The columns (name, FITS format, unit) of the metadata table of cubes
+CUBE_METADATA_COLUMNS = [("event_id", "K", None),
+                         ("energy", "D", "TeV"),
+                         ("mc_az", "D", "rad"),
+                         ("mc_alt", "D", "rad"),
+                         ("mc_corex", "D", "m"),
+                         ("mc_corey", "D", "m"),
+                         ("foclen", "D", "m")]
+
+def get_mc_calibration_coeffs(tel_id, run_key=None):
     """
     Get the calibration coefficients from the MC data file to the data.
     This is ahack (until we have a real data structure for the calibrated
@@ -49,6 +90,9 @@ def get_mc_calibration_coeffs(tel_id):
     ----------
     tel_id : int
         The ID of the telescope to process.
+    run_key : hashable
+        The run of the current event (see ``mc_calibration.get_run_key()``):
+        the coefficients are read once per run and telescope.
 
     Returns
     -------
@@ -57,209 +101,292 @@ def get_mc_calibration_coeffs(tel_id):
         (one dimension for each channel) and ``gain`` a 2D arrays of the PE/DC
         ratios (one dimension for each channel).
     """
-    pedestal = pyhessio.get_pedestal(tel_id)
-    gains = pyhessio.get_calibration(tel_id)
-
-    return pedestal, gains
+    return mc_calibration.get_mc_calibration_coeffs(tel_id, run_key)
 
 
-def apply_mc_calibration(adcs, tel_id, adc_treshold=3500.):
+def apply_mc_calibration(adcs, tel_id, adc_treshold=mc_calibration.DEFAULT_ADC_THRESHOLD, run_key=None):
     """
     Apply basic calibration.
 
+    The low gain channel is used for the pixels where the high gain channel
+    reaches 'adc_treshold' (see mc_calibration.py).
+
     Parameters
     ----------
     adc : Numpy array
         The uncalibrated ADC signal (one dimension per channel).
     tel_id : int
         The ID of the telescope to process.
+    adc_treshold : float or Numpy array
+        The high gain ADC value from which the low gain channel is used (a
+        single value or one value per pixel).
+    run_key : hashable
+        The run of the current event (see ``mc_calibration.get_run_key()``).
 
     Returns
     -------
     Numpy array
-        A tuble containing 2 elements: ``pedestal`` a 2D arrays of the pedestal
-        (one dimension for each channel) and ``gain`` a 2D arrays of the PE/DC
-        ratios (one dimension for each channel).
+        The calibrated image (1D array).
     """
 
-    peds, gains = get_mc_calibration_coeffs(tel_id)
+    peds, gains = get_mc_calibration_coeffs(tel_id, run_key)
 
-    peds_ch0 = peds[0]
-    peds_ch1 = peds[1]
+    return mc_calibration.apply_gain_switch(adcs, peds, gains, adc_treshold)
 
-    # TODO ???
-    #calibrated_image = ((adc - peds[:, np.newaxis] / adc.shape[1]) * gains[:, np.newaxis])
-    # calibrated_image = (adc - peds) * gains
 
-    calibrated_image = [ (adc0 - ped0) * gain0 if adc0 < adc_treshold else (adc1 - ped1) * gain1
-                         for adc0, adc1, ped0, ped1, gain0, gain1
-                         in zip(adcs[0], adcs[1], peds[0], peds[1], gains[0], gains[1]) ]
+class TelescopeCube(object):
+    """
+    The cropped images (calibrated and photoelectron) of one telescope and
+    their metadata, stored in preallocated cubes.
 
-    return np.array(calibrated_image)
+    Parameters
+    ----------
+    tel_id : int
+        The ID of the telescope.
+    num_images : int
+        The expected number of images (the cubes grow if more images are
+        added).
+    """
 
+    def __init__(self, tel_id, num_images):
+        self.tel_id = tel_id
+        self.num_images = 0
 
-def extract_images(simtel_file_path,
-                   tel_id_filter_list=None,
-                   event_id_filter_list=None,
-                   output_directory=None):
+        capacity = max(num_images, 1)
 
-    # EXTRACT IMAGES ##########################################################
+        self.images = np.empty((capacity,) + image_crop.ASTRI_CROPPED_SHAPE)
+        self.pe_images = None
+        self.metadata = {name: np.zeros(capacity, dtype=np.int64 if fits_format == "K" else np.float64)
+                         for name, fits_format, unit in CUBE_METADATA_COLUMNS}
 
-    # hessio_event_source returns a Python generator that streams data from an
-    # EventIO/HESSIO MC data file (e.g. a standard CTA data file).
-    # This generator contains ctapipe.core.Container instances ("event").
-    #
-    # Parameters:
-    # - max_events: maximum number of events to read
-    # - allowed_tels: select only a subset of telescope, if None, all are read.
-    source = hessio_event_source(simtel_file_path, allowed_tels=tel_id_filter_list)
+    def _grow(self):
+        capacity = 2 * len(self.images)
+        self.images = np.resize(self.images, (capacity,) + self.images.shape[1:])
+        if self.pe_images is not None:
+            self.pe_images = np.resize(self.pe_images, (capacity,) + self.pe_images.shape[1:])
+        self.metadata = {name: np.resize(column, capacity) for name, column in self.metadata.items()}
 
-    # ITERATE OVER EVENTS #####################################################
+    def add(self, metadata, pe_dtype):
+        """
+        Add a row to the cubes.
 
-    for event in source:
+        Parameters
+        ----------
+        metadata : dict
+            The metadata of the image (see ``CUBE_METADATA_COLUMNS``, values
+            may be (value, unit) tuples).
+        pe_dtype : numpy dtype
+            The type of the photoelectron images.
 
-        event_id = int(event.dl0.event_id)
+        Returns
+        -------
+        tuple of numpy.array
+            The slots (2D arrays) where the calibrated image and the
+            photoelectron image have to be written.
+        """
 
-        if (event_id_filter_list is None) or (event_id in event_id_filter_list):
+        if self.num_images == len(self.images):
+            self._grow()
 
-            print("event", event_id)
+        if self.pe_images is None:
+            self.pe_images = np.empty(self.images.shape, dtype=pe_dtype)
 
-            # ITERATE OVER IMAGES #############################################
+        row = self.num_images
+        self.num_images += 1
 
-            for tel_id in event.trig.tels_with_trigger:
+        for name in self.metadata:
+            value = metadata[name]
+            self.metadata[name][row] = value[0] if type(value) is tuple else value
 
-                tel_id = int(tel_id)
+        return self.images[row], self.pe_images[row]
 
-                if tel_id in tel_id_filter_list:
+    def save(self, output_file_path, compression=None):
+        """Write the cubes and the metadata table in the 'output_file_path'
+        FITS file (see the module documentation and, for 'compression',
+        ``fits_io.get_compression()``)."""
 
-                    print("telescope", tel_id)
+        num_images = self.num_images
 
-                    # CHECK THE IMAGE GEOMETRY (ASTRI ONLY) ###################
+        hdu0 = fits_io.make_hdu(self.images[:num_images], primary=True, compression=compression)
+        hdu1 = fits_io.make_hdu(self.pe_images[:num_images], compression=compression, name="PE_IMAGES")
 
-                    # TODO
+        columns = [fits.Column(name=name, format=fits_format, unit=unit, array=self.metadata[name][:num_images])
+                   for name, fits_format, unit in CUBE_METADATA_COLUMNS]
+        hdu2 = fits.BinTableHDU.from_columns(columns, name="EVENTS")
 
-                    print("checking geometry")
+        if os.path.isfile(output_file_path):
+            os.remove(output_file_path)
 
-                    x, y = event.meta.pixel_pos[tel_id]
-                    foclen = event.meta.optical_foclen[tel_id]
-                    geom = ctapipe.io.CameraGeometry.guess(x, y, foclen)
+        hdu_list = fits_io.make_hdu_list([hdu0, hdu1, hdu2], compression)
+        hdu_list[0].header['tel_id'] = self.tel_id
 
-                    if (geom.pix_type != "rectangular") or (geom.cam_id != "ASTRI"):
-                        raise ValueError("Telescope {}: error (the input image is not a valide ASTRI telescope image)".format(tel_id))
+        hdu_list.writeto(output_file_path)
 
-                    # GET AND CROP THE IMAGE ##################################
 
-                    # uncalibrated_image = [1D numpy array of channel1, 1D numpy array of channel2]
-                    # calibrated_image = 1D numpy array
+def extract_images(simtel_file_path,
+                   tel_id_filter_list=None,
+                   event_id_filter_list=None,
+                   output_directory=None,
+                   selection=None,
+                   cam_id_filter_list=DEFAULT_CAMERA_FILTER,
+                   cube=False,
+                   compression=None,
+                   hdf5_writer=None):
+
+    # SELECT TELESCOPES #######################################################
+
+    # Telescopes are classified once per simtel file (see
+    # telescope_registry.py): only the ASTRI ones can be cropped.
+    registry = telescope_registry.load_registry(simtel_file_path)
+
+    # Telescopes given explicitly are not silently dropped by the camera
+    # filter
+    if tel_id_filter_list is not None:
+        for tel_id in tel_id_filter_list:
+            if tel_id not in registry:
+                print("Warning: telescope {} is not defined in {}".format(tel_id, simtel_file_path), file=sys.stderr)
+            elif (registry[tel_id]["pixel_type"] != "rectangular") or (registry[tel_id]["camera_id"] != "ASTRI"):
+                raise ValueError("Telescope {}: error (the input image is not a valide ASTRI telescope image)".format(tel_id))
+
+    tel_id_filter_list = telescope_registry.resolve_tel_ids(simtel_file_path, tel_id_filter_list, cam_id_filter_list)
+
+    for tel_id in tel_id_filter_list:
+        if (registry[tel_id]["pixel_type"] != "rectangular") or (registry[tel_id]["camera_id"] != "ASTRI"):
+            raise ValueError("Telescope {}: error (the input image is not a valide ASTRI telescope image)".format(tel_id))
 
-                    print("calibrating")
+    print("Telescopes:", tel_id_filter_list)
 
-                    adc_channel_0 = event.dl0.tel[tel_id].adc_sums[0]      # TODO
-                    adc_channel_1 = event.dl0.tel[tel_id].adc_sums[1]      # TODO
-                    uncalibrated_image = np.array([adc_channel_0, adc_channel_1])
+    tel_id_filter_set = set(tel_id_filter_list)       # O(1) membership tests
 
-                    calibrated_image = apply_mc_calibration(uncalibrated_image, tel_id)
+    # SELECT EVENTS ###########################################################
 
-                    print("cropping ADC image")
+    # Only the events that are in event_id_filter_list and that match the
+    # selection predicates are decoded: they are selected on the event index
+    # of the simtel file (see event_selection.py and simtel_index.py).
+    #
+    # Parameters:
+    # - allowed_tels: select only a subset of telescope, if None, all are read.
+    source = event_selection.iter_selected_events(simtel_file_path,
+                                                  selection=selection,
+                                                  event_id_filter_list=event_id_filter_list,
+                                                  allowed_tels=tel_id_filter_list)
 
-                    cropped_img = crop_astri_image(calibrated_image)
+    if output_directory is not None:
+        simtel_basename = os.path.basename(simtel_file_path)
+        prefix = os.path.join(output_directory, simtel_basename)
+    else:
+        prefix = simtel_file_path
 
-                    # GET AND CROP THE PHOTOELECTRON IMAGE ####################
+    if hdf5_writer is not None:
+        hdf5_writer.start_file(simtel_file_path)
 
-                    pe_image = event.mc.tel[tel_id].photo_electrons   # 1D np array
+    # MAKE THE CUBES ##########################################################
 
-                    print("cropping PE image")
+    # In cube mode, the images of each telescope are written in one FITS
+    # file: cubes are preallocated with the number of images given by the
+    # event index.
+    cube_dict = {}
 
-                    cropped_pe_img = crop_astri_image(pe_image)
+    if cube:
+        num_images_dict = {tel_id: 0 for tel_id in tel_id_filter_list}
 
-                    # SAVE THE IMAGE ##########################################
+        for entry in event_selection.select_entries(simtel_file_path, selection, event_id_filter_list):
+            for tel_id in entry["tels_with_trigger"]:
+                if tel_id in tel_id_filter_set:
+                    num_images_dict[tel_id] += 1
 
-                    output_file_path_template = "{}_EV{:05d}_TEL{:03d}.fits"
+        cube_dict = {tel_id: TelescopeCube(tel_id, num_images)
+                     for tel_id, num_images in num_images_dict.items() if num_images > 0}
 
-                    if output_directory is not None:
-                        simtel_basename = os.path.basename(simtel_file_path)
-                        prefix = os.path.join(output_directory, simtel_basename)
-                    else:
-                        prefix = simtel_file_path
+    # ITERATE OVER EVENTS #####################################################
 
-                    output_file_path = output_file_path_template.format(prefix,
-                                                                        event_id,
-                                                                        tel_id)
+    mc_calibration.clear_cache()
 
-                    print("saving", output_file_path)
+    # The images are calibrated and cropped in one pass, directly in these
+    # buffers (reused for each image: they are written to disk before the
+    # next image is processed) or in the rows of the cubes (or of the HDF5
+    # writer)
+    crop_calibrator = mc_calibration.CropCalibrator(image_crop.ASTRI_GRID_MAP)
 
-                    metadata = {}
-                    metadata['tel_id'] = tel_id
-                    metadata['foclen'] = quantity_to_tuple(event.meta.optical_foclen[tel_id], 'm')
-                    metadata['event_id'] = event_id
-                    metadata['energy'] =  quantity_to_tuple(event.mc.energy, 'TeV')
-                    metadata['mc_az'] = quantity_to_tuple(event.mc.az, 'rad')
-                    metadata['mc_alt'] = quantity_to_tuple(event.mc.alt, 'rad')
-                    metadata['mc_corex'] = quantity_to_tuple(event.mc.core_x, 'm')
-                    metadata['mc_corey'] = quantity_to_tuple(event.mc.core_y, 'm')
+    cropped_img = np.empty(image_crop.ASTRI_CROPPED_SHAPE)
+    cropped_pe_img = None
 
-                    save_fits(cropped_img, cropped_pe_img, output_file_path, metadata)
+    for event in source:
 
+        event_id = int(event.dl0.event_id)
 
-def crop_astri_image(input_img):
-    """
-    Crop images comming form "ASTRI" telescopes in order to get regular 2D "rectangular"
-    images directly usable with most image processing tools.
+        print("event", event_id)
 
-    Parameters
-    ----------
-    input_img : numpy.array
-        The image to crop
+        # ITERATE OVER IMAGES #############################################
 
-    Returns
-    -------
-    A numpy.array containing the cropped image.
-    """
+        for tel_id in event.trig.tels_with_trigger:
+
+            tel_id = int(tel_id)
+
+            if tel_id in tel_id_filter_set:
+
+                print("telescope", tel_id)
+
+                metadata = {}
+                metadata['tel_id'] = tel_id
+                metadata['foclen'] = quantity_to_tuple(event.meta.optical_foclen[tel_id], 'm')
+                metadata['event_id'] = event_id
+                metadata['energy'] =  quantity_to_tuple(event.mc.energy, 'TeV')
+                metadata['mc_az'] = quantity_to_tuple(event.mc.az, 'rad')
+                metadata['mc_alt'] = quantity_to_tuple(event.mc.alt, 'rad')
+                metadata['mc_corex'] = quantity_to_tuple(event.mc.core_x, 'm')
+                metadata['mc_corey'] = quantity_to_tuple(event.mc.core_y, 'm')
+
+                pe_image = event.mc.tel[tel_id].photo_electrons   # 1D np array
+
+                if hdf5_writer is not None:
+                    cropped_img, cropped_pe_img = hdf5_writer.add(metadata, pe_image.dtype)
+                elif cube:
+                    cropped_img, cropped_pe_img = cube_dict[tel_id].add(metadata, pe_image.dtype)
+                elif cropped_pe_img is None:
+                    cropped_pe_img = np.empty(image_crop.ASTRI_CROPPED_SHAPE, dtype=pe_image.dtype)
 
-    # Check the image
-    if len(input_img) != (37*64):
-        raise ValueError("The input image is not a valide ASTRI telescope image.")
+                # GET, CALIBRATE AND CROP THE IMAGE ######################
 
-    # Make the transformation map
-    img_map = np.zeros([8*5, 8*5], dtype=int)
+                # adc_sums = [1D numpy array of channel1, 1D numpy array of channel2]
+                # cropped_img = 2D numpy array
 
-    img_map[0*8:1*8, 0*8:1*8] = np.arange(64).reshape([8,8])[::-1,:] + 29 * 64
-    img_map[0*8:1*8, 1*8:2*8] = np.arange(64).reshape([8,8])[::-1,:] + 30 * 64
-    img_map[0*8:1*8, 2*8:3*8] = np.arange(64).reshape([8,8])[::-1,:] + 31 * 64
-    img_map[0*8:1*8, 3*8:4*8] = np.arange(64).reshape([8,8])[::-1,:] + 32 * 64
-    img_map[0*8:1*8, 4*8:5*8] = np.arange(64).reshape([8,8])[::-1,:] + 33 * 64
+                print("calibrating and cropping ADC image")
+
+                peds, gains = get_mc_calibration_coeffs(tel_id, mc_calibration.get_run_key(event))
+
+                crop_calibrator.calibrate(event.dl0.tel[tel_id].adc_sums, peds, gains, out=cropped_img)
+
+                # GET AND CROP THE PHOTOELECTRON IMAGE ####################
+
+                print("cropping PE image")
+
+                crop_calibrator.crop(pe_image, out=cropped_pe_img)
+
+                # SAVE THE IMAGE ##########################################
+
+                if (not cube) and (hdf5_writer is None):
+                    output_file_path_template = "{}_EV{:05d}_TEL{:03d}.fits"
+
+                    output_file_path = output_file_path_template.format(prefix,
+                                                                        event_id,
+                                                                        tel_id)
 
-    img_map[1*8:2*8, 0*8:1*8] = np.arange(64).reshape([8,8])[::-1,:] + 23 * 64
-    img_map[1*8:2*8, 1*8:2*8] = np.arange(64).reshape([8,8])[::-1,:] + 24 * 64
-    img_map[1*8:2*8, 2*8:3*8] = np.arange(64).reshape([8,8])[::-1,:] + 25 * 64
-    img_map[1*8:2*8, 3*8:4*8] = np.arange(64).reshape([8,8])[::-1,:] + 26 * 64
-    img_map[1*8:2*8, 4*8:5*8] = np.arange(64).reshape([8,8])[::-1,:] + 27 * 64
+                    print("saving", output_file_path)
 
-    img_map[2*8:3*8, 0*8:1*8] = np.arange(64).reshape([8,8])[::-1,:] + 16 * 64
-    img_map[2*8:3*8, 1*8:2*8] = np.arange(64).reshape([8,8])[::-1,:] + 17 * 64
-    img_map[2*8:3*8, 2*8:3*8] = np.arange(64).reshape([8,8])[::-1,:] + 18 * 64
-    img_map[2*8:3*8, 3*8:4*8] = np.arange(64).reshape([8,8])[::-1,:] + 19 * 64
-    img_map[2*8:3*8, 4*8:5*8] = np.arange(64).reshape([8,8])[::-1,:] + 20 * 64
+                    save_fits(cropped_img, cropped_pe_img, output_file_path, metadata, compression)
 
-    img_map[3*8:4*8, 0*8:1*8] = np.arange(64).reshape([8,8])[::-1,:] +  9 * 64
-    img_map[3*8:4*8, 1*8:2*8] = np.arange(64).reshape([8,8])[::-1,:] + 10 * 64
-    img_map[3*8:4*8, 2*8:3*8] = np.arange(64).reshape([8,8])[::-1,:] + 11 * 64
-    img_map[3*8:4*8, 3*8:4*8] = np.arange(64).reshape([8,8])[::-1,:] + 12 * 64
-    img_map[3*8:4*8, 4*8:5*8] = np.arange(64).reshape([8,8])[::-1,:] + 13 * 64
+    # SAVE THE CUBES ##########################################################
 
-    img_map[4*8:5*8, 0*8:1*8] = np.arange(64).reshape([8,8])[::-1,:] +  3 * 64
-    img_map[4*8:5*8, 1*8:2*8] = np.arange(64).reshape([8,8])[::-1,:] +  4 * 64
-    img_map[4*8:5*8, 2*8:3*8] = np.arange(64).reshape([8,8])[::-1,:] +  5 * 64
-    img_map[4*8:5*8, 3*8:4*8] = np.arange(64).reshape([8,8])[::-1,:] +  6 * 64
-    img_map[4*8:5*8, 4*8:5*8] = np.arange(64).reshape([8,8])[::-1,:] +  7 * 64
+    for tel_id, tel_cube in sorted(cube_dict.items()):
+        output_file_path = "{}_TEL{:03d}.fits".format(prefix, tel_id)
 
-    # Make the output image
-    cropped_img = input_img[[img_map.ravel()]].reshape([8*5, 8*5])
+        print("saving", output_file_path, "({} images)".format(tel_cube.num_images))
 
-    return cropped_img
+        tel_cube.save(output_file_path, compression)
 
 
-def save_fits(img, pe_img, output_file_path, metadata):
+def save_fits(img, pe_img, output_file_path, metadata, compression=None):
     """
     Write a FITS file containing pe_img, output_file_path and metadata.
 
@@ -273,6 +400,9 @@ def save_fits(img, pe_img, output_file_path, metadata):
         The path of the output FITS file.
     metadata: tuple
         A dictionary containing all metadata to write in the FITS file.
+    compression: dict
+        The compression options (see ``fits_io.get_compression()``), None
+        to write uncompressed images.
     """
 
     if img.ndim != 2:
@@ -282,21 +412,24 @@ def save_fits(img, pe_img, output_file_path, metadata):
         raise Exception("The input image should be a 2D numpy array.")
 
     # http://docs.astropy.org/en/stable/io/fits/appendix/faq.html#how-do-i-create-a-multi-extension-fits-file-from-scratch
-    hdu0 = fits.PrimaryHDU(img)
-    hdu1 = fits.ImageHDU(pe_img)
+    hdu0 = fits_io.make_hdu(img, primary=True, compression=compression)
+    hdu1 = fits_io.make_hdu(pe_img, compression=compression)
+
+    hdu_list = fits_io.make_hdu_list([hdu0, hdu1], compression)
+
+    # The metadata are in the primary HDU (empty if images are compressed)
+    header = hdu_list[0].header
 
     for key, val in metadata.items():
         if type(val) is tuple :
-            hdu0.header[key] = val[0]
-            hdu0.header.comments[key] = val[1]
+            header[key] = val[0]
+            header.comments[key] = val[1]
         else:
-            hdu0.header[key] = val
+            header[key] = val
 
     if os.path.isfile(output_file_path):
         os.remove(output_file_path)
 
-    hdu_list = fits.HDUList([hdu0, hdu1])
-
     hdu_list.writeto(output_file_path)
 
 
@@ -333,7 +466,9 @@ def main():
 
     parser.add_argument("--telescope", "-t",
                         metavar="INTEGER LIST",
-                        help="The telescopes to query (telescopes number separated by a comma)")
+                        help="The telescopes to query (telescopes number separated by a comma, default: all the ASTRI telescopes)")
+
+    telescope_registry.add_camera_argument(parser)
 
     parser.add_argument("--event", "-e",
                         metavar="INTEGER LIST",
@@ -343,22 +478,44 @@ def main():
                         metavar="DIRECTORY",
                         help="The output directory")
 
+    parser.add_argument("--cube", action="store_true",
+                        help="Write one FITS cube per simtel file and telescope instead of one FITS file per image")
+
+    parser.add_argument("--hdf5",
+                        metavar="FILE",
+                        help="Write the images of all the simtel files in this HDF5 file instead of FITS files")
+
+    fits_io.add_compression_arguments(parser)
+
+    event_selection.add_selection_arguments(parser)
+
     parser.add_argument("fileargs", nargs="+", metavar="FILE",
                         help="The simtel files to process")
 
     args = parser.parse_args()
 
     if args.telescope is None:
-        tel_id_filter_list = DEFAULT_TEL_FILTER
+        tel_id_filter_list = None
     else:
         tel_id_filter_list = [int(tel_id_str) for tel_id_str in args.telescope.split(",")]
 
+    if args.camera is None:
+        cam_id_filter_list = DEFAULT_CAMERA_FILTER
+    else:
+        cam_id_filter_list = telescope_registry.parse_camera_list(args.camera)
+
     if args.event is None:
         event_id_filter_list = None
     else:
         event_id_filter_list = [int(event_id_str) for event_id_str in args.event.split(",")]
 
-    print("Telescopes:", tel_id_filter_list)
+    selection = event_selection.get_selection(args)
+
+    compression = fits_io.get_compression(args, parser)
+
+    if (args.hdf5 is not None) and (args.cube or (compression is not None)):
+        parser.error("--hdf5 can't be used with --cube or --compress (FITS output options)")
+
     print("Events:", event_id_filter_list)
 
     output_directory = args.output
@@ -368,15 +525,27 @@ def main():
         if not (os.path.exists(output_directory) and os.path.isdir(output_directory)):
             raise Exception("{} does not exist or is not a directory.".format(output_directory))
 
+    hdf5_writer = None
+
+    if args.hdf5 is not None:
+        hdf5_writer = hdf5_io.HDF5ImageWriter(args.hdf5)
+
     # ITERATE OVER SIMTEL FILES ###############################################
 
-    for simtel_file_path in simtel_file_path_list:
+    try:
+        for simtel_file_path in simtel_file_path_list:
+
+            print("Processing", simtel_file_path)
 
-        print("Processing", simtel_file_path)
+            # EXTRACT, CROP AND SAVE THE IMAGES ###############################
 
-        # EXTRACT, CROP AND SAVE THE IMAGES ###################################
+            extract_images(simtel_file_path, tel_id_filter_list, event_id_filter_list, output_directory, selection, cam_id_filter_list, args.cube, compression, hdf5_writer)
+    finally:
+        if hdf5_writer is not None:
+            print("saving", args.hdf5, "({} images)".format(hdf5_writer.num_images))
+            hdf5_writer.close()
 
-        extract_images(simtel_file_path, tel_id_filter_list, event_id_filter_list, output_directory)
+    print(mc_calibration.format_cache_stats())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Make several products (plots, JSON, binary and FITS files) for many images of simtel
+files in a single pass.
+
+Each simtel file is decoded only once: every selected (event, telescope) image
+is given to all the requested products. This replaces the shell scripts that
+ran one Python process per (event, telescope, product).
+
+Available products:
+
+- image       the ADC image (see plot_events_image.py)
+- calibrated  the calibrated image (see plot_events_calibrated_image.py)
+- pe          the photoelectron image (see plot_events_photoelectron_image.py)
+- hist        the histogram of the ADC image (see plot_events_image_histogram.py)
+- pe_hist     the histogram of the photoelectron image (see plot_events_photoelectron_image_histogram.py)
+- json        the JSON export of the image (see event_image_to_json.py)
+- npz         the binary export of the image (same fields, see image_io.py)
+- fits        the cropped ASTRI/SCTCam images (see extract_and_crop_simtel_images.py)
+
+Usage examples:
+
+    ./extract_event_products.py -p image,pe,json FILE [FILE ...]
+    ./extract_event_products.py -p fits --energy 1, --min-multiplicity 3 FILE
+    ./list_common_events.py FILE1 FILE2 | ./extract_event_products.py -p image --targets -
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+from ctapipe.io.hessio import hessio_event_source
+
+from matplotlib import pyplot as plt
+
+import event_image_to_json
+import event_selection
+import image_io
+import extract_and_crop_simtel_images
+import mc_calibration
+import plot_events_calibrated_image
+import plot_events_image
+import plot_events_image_histogram
+import plot_events_photoelectron_image
+import plot_events_photoelectron_image_histogram
+import simtel_index
+import telescope_registry
+
+DEFAULT_PRODUCTS = ("image", "pe", "hist", "pe_hist", "json")
+
+
+def _make_image_file(extension):
+    def make_image_file(event, simtel_file_path, output_prefix, tel_id, event_id, channel):
+        image_dict = event_image_to_json.event_to_image_dict(event, simtel_file_path, tel_id, event_id)
+        image_io.save_image_dict(image_dict, output_prefix + extension)
+    return make_image_file
+
+
+def _make_fits(event, simtel_file_path, output_prefix, tel_id, event_id, channel):
+    cropped_img, cropped_pe_img = extract_and_crop_simtel_images.crop_event_images(event, tel_id, channel)
+    extract_and_crop_simtel_images.save_fits(cropped_img, cropped_pe_img, output_prefix + ".fits")
+
+
+def _make_plot(plot_function, suffix):
+    def make_plot(event, simtel_file_path, output_prefix, tel_id, event_id, channel):
+        plot_function(event, output_prefix + suffix, tel_id, event_id, channel, quiet=True)
+        plt.close('all')
+    return make_plot
+
+
+PRODUCTS = {
+    "image": _make_plot(plot_events_image.plot_event_image, ".pdf"),
+    "calibrated": _make_plot(plot_events_calibrated_image.plot_event_calibrated_image, "_CALIB.pdf"),
+    "pe": _make_plot(plot_events_photoelectron_image.plot_event_photoelectron_image, "_PE.pdf"),
+    "hist": _make_plot(plot_events_image_histogram.plot_event_image_histogram, "_HIST.pdf"),
+    "pe_hist": _make_plot(plot_events_photoelectron_image_histogram.plot_event_photoelectron_image_histogram, "_PE_HIST.pdf"),
+    "json": _make_image_file(image_io.JSON_EXTENSION),
+    "npz": _make_image_file(image_io.BINARY_EXTENSION),
+    "fits": _make_fits
+}
+
+
+def make_targets(simtel_file_path, tel_id_filter_list=None, event_id_filter_list=None, selection=None, cam_id_filter_list=None):
+    """
+    Make the set of (event_id, tel_id) images of 'simtel_file_path' that
+    match the given filters (using the event index of the simtel file, see
+    event_selection.py).
+
+    Parameters
+    ----------
+    simtel_file_path : str
+        The path of the simtel file.
+    tel_id_filter_list : list of int
+        The telescopes to select (all telescopes if None).
+    event_id_filter_list : list of int
+        The events to select (all events if None).
+    selection : event_selection.EventSelection
+        The selection predicates on the MC truth and the triggered telescopes
+        of events (all events if None).
+    cam_id_filter_list : list of str
+        The cameras of the telescopes to select (all cameras if None, see
+        telescope_registry.py).
+
+    Returns
+    -------
+    set
+        The (event_id, tel_id) pairs of the selected images.
+    """
+
+    if cam_id_filter_list is not None:
+        tel_id_filter_list = telescope_registry.resolve_tel_ids(simtel_file_path, tel_id_filter_list, cam_id_filter_list)
+
+    targets = set()
+
+    for entry in event_selection.select_entries(simtel_file_path, selection, event_id_filter_list):
+        for tel_id in entry["tels_with_trigger"]:
+            if (tel_id_filter_list is None) or (tel_id in tel_id_filter_list):
+                targets.add((entry["event_id"], tel_id))
+
+    return targets
+
+
+def extract_products(simtel_file_path, targets, products, output_directory=None, channel=0):
+    """
+    Make the requested 'products' for each (event_id, tel_id) image of
+    'targets' with a single pass over 'simtel_file_path'.
+
+    Only the events containing a target image are decoded: they are copied in
+    a temporary simtel file using the event index of 'simtel_file_path'.
+
+    Parameters
+    ----------
+    simtel_file_path : str
+        The path of the simtel file to process.
+    targets : set
+        The (event_id, tel_id) pairs of the images to process.
+    products : list of str
+        The name of the products to make (keys of ``PRODUCTS``).
+    output_directory : str
+        The directory where products are written (the directory of the simtel
+        file if None).
+    channel : int
+        The channel number to process.
+    """
+
+    for product in products:
+        if product not in PRODUCTS:
+            raise ValueError("Unknown product '{}'.".format(product))
+
+    if len(targets) == 0:
+        return
+
+    if output_directory is not None:
+        prefix = os.path.join(output_directory, os.path.basename(simtel_file_path))
+    else:
+        prefix = simtel_file_path
+
+    entry_list = []
+    for event_id in sorted({event_id for (event_id, tel_id) in targets}):
+        entry = simtel_index.get_event_entry(simtel_file_path, event_id)
+        if entry is None:
+            print("Error: event '{}' not found in {}.".format(event_id, simtel_file_path), file=sys.stderr)
+        else:
+            entry_list.append(entry)
+
+    allowed_tels = sorted({tel_id for (event_id, tel_id) in targets})
+
+    tmp_dir = tempfile.mkdtemp(prefix="simtel_events_")
+
+    try:
+        tmp_file_path = os.path.join(tmp_dir, "events.simtel")
+        simtel_index.write_event_file(simtel_file_path, entry_list, tmp_file_path)
+
+        mc_calibration.clear_cache()
+
+        for event in hessio_event_source(tmp_file_path, allowed_tels=allowed_tels):
+
+            event_id = int(event.dl0.event_id)
+
+            for tel_id in event.trig.tels_with_trigger:
+
+                tel_id = int(tel_id)
+
+                if (event_id, tel_id) not in targets:
+                    continue
+
+                output_prefix = "{}_TEL{}_EV{}_CH{}".format(prefix, tel_id, event_id, channel)
+                print(output_prefix)
+
+                for product in products:
+                    try:
+                        PRODUCTS[product](event, simtel_file_path, output_prefix, tel_id, event_id, channel)
+                    except Exception as e:
+                        print("Error: cannot make the '{}' product of {} ({})".format(product, output_prefix, e), file=sys.stderr)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def read_targets(fd, simtel_file_path_list):
+    """
+    Read (event_id, tel_id) targets from 'fd'.
+
+    Each line contains "EVENT_ID TEL_ID" (the targets are then used for all
+    'simtel_file_path_list' files) or "SIMTEL_FILE EVENT_ID TEL_ID" (as
+    printed by list_common_events.py).
+
+    Returns
+    -------
+    dict
+        The set of (event_id, tel_id) targets for each simtel file.
+    """
+
+    targets_dict = {}
+
+    for line in fd:
+        fields = line.split()
+
+        if len(fields) == 2:
+            for simtel_file_path in simtel_file_path_list:
+                targets_dict.setdefault(simtel_file_path, set()).add((int(fields[0]), int(fields[1])))
+        elif len(fields) == 3:
+            targets_dict.setdefault(fields[0], set()).add((int(fields[1]), int(fields[2])))
+        elif len(fields) > 0:
+            raise ValueError("Wrong target line: {}".format(line))
+
+    return targets_dict
+
+
+def main():
+    """Parse command options (sys.argv) and make the requested products."""
+
+    # PARSE OPTIONS ###########################################################
+
+    desc = "Make plots, JSON and FITS files for images of simtel files in a single pass."
+    parser = argparse.ArgumentParser(description=desc)
+
+    parser.add_argument("--products", "-p", default=",".join(DEFAULT_PRODUCTS),
+                        metavar="STRING LIST",
+                        help="The products to make, separated by a comma (among {})".format(", ".join(sorted(PRODUCTS))))
+
+    parser.add_argument("--telescope", "-t",
+                        metavar="INTEGER LIST",
+                        help="The telescopes to query (telescopes number separated by a comma)")
+
+    telescope_registry.add_camera_argument(parser)
+
+    parser.add_argument("--event", "-e",
+                        metavar="INTEGER LIST",
+                        help="The events to extract (events ID separated by a comma)")
+
+    parser.add_argument("--targets",
+                        metavar="FILE",
+                        help="A file listing the images to process (one 'EVENT_ID TEL_ID' or 'SIMTEL_FILE EVENT_ID TEL_ID' per line, '-' for the standard input)")
+
+    parser.add_argument("--channel", "-c", type=int, default=0,
+                        metavar="INTEGER",
+                        help="The channel number to query")
+
+    parser.add_argument("--output", "-o",
+                        metavar="DIRECTORY",
+                        help="The output directory")
+
+    event_selection.add_selection_arguments(parser)
+
+    parser.add_argument("fileargs", nargs="*", metavar="FILE",
+                        help="The simtel files to process")
+
+    args = parser.parse_args()
+
+    products = args.products.split(",")
+    simtel_file_path_list = args.fileargs
+
+    if args.telescope is None:
+        tel_id_filter_list = None
+    else:
+        tel_id_filter_list = [int(tel_id_str) for tel_id_str in args.telescope.split(",")]
+
+    if args.event is None:
+        event_id_filter_list = None
+    else:
+        event_id_filter_list = [int(event_id_str) for event_id_str in args.event.split(",")]
+
+    cam_id_filter_list = telescope_registry.parse_camera_list(args.camera)
+
+    selection = event_selection.get_selection(args)
+
+    # MAKE THE TARGETS ########################################################
+
+    if args.targets is None:
+        targets_dict = {simtel_file_path: make_targets(simtel_file_path, tel_id_filter_list, event_id_filter_list, selection, cam_id_filter_list)
+                        for simtel_file_path in simtel_file_path_list}
+    elif args.targets == "-":
+        targets_dict = read_targets(sys.stdin, simtel_file_path_list)
+    else:
+        with open(args.targets, "r") as fd:
+            targets_dict = read_targets(fd, simtel_file_path_list)
+
+    # MAKE THE PRODUCTS #######################################################
+
+    for simtel_file_path, targets in sorted(targets_dict.items()):
+        print("Processing", simtel_file_path)
+        extract_products(simtel_file_path, targets, products, args.output, args.channel)
+
+    print(mc_calibration.format_cache_stats())
+
+
+if __name__ == '__main__':
+    main()
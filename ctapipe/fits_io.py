@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Write (optionally tile-compressed) FITS images and read them back.
+
+Extracted images can be written in ``CompImageHDU`` (see
+``add_compression_arguments()``):
+
+- "rice", "gzip" and "hcompress" compression (RICE_1, GZIP_1 and
+  HCOMPRESS_1 FITS tile compression);
+- images are compressed by tiles, by default one tile per 2D image (i.e. per
+  slice of a cube);
+- floating point images (calibrated images) are quantized; the quantization
+  level (``--quantize-level``, the noise of each tile divided by the
+  quantization step) defaults to 16; 0 means lossless (gzip only);
+- integer images (photoelectron images) are always compressed losslessly:
+  they are stored as int32.
+
+A compressed FITS file starts with an empty primary HDU (compressed images
+can't be stored in the primary HDU), thus readers should take the first HDU
+that contains data (see ``get_image_arrays()``).
+"""
+
+import inspect
+
+from astropy.io import fits
+import numpy as np
+
+COMPRESSION_TYPES = {"rice": "RICE_1",
+                     "gzip": "GZIP_1",
+                     "hcompress": "HCOMPRESS_1"}
+
+DEFAULT_QUANTIZE_LEVEL = 16.
+
+# Older astropy versions take the tile shape in the FITS axis order
+# ("tile_size") instead of the Numpy order ("tile_shape")
+_TILE_SHAPE_IN_NUMPY_ORDER = "tile_shape" in inspect.signature(fits.CompImageHDU.__init__).parameters
+
+
+def _parse_tile_shape(tile_shape_str):
+    """Convert a "ROWS,COLUMNS" string to a tuple of int."""
+    return tuple(int(size) for size in tile_shape_str.split(","))
+
+
+def add_compression_arguments(parser):
+    """Add the FITS compression options to the argparse 'parser' (see
+    ``get_compression()``)."""
+
+    group = parser.add_argument_group("FITS compression")
+
+    group.add_argument("--compress", choices=sorted(COMPRESSION_TYPES), default=None,
+                       help="Write tile-compressed FITS images (uncompressed images if not set)")
+
+    group.add_argument("--tile-shape", type=_parse_tile_shape, default=None,
+                       metavar="ROWS,COLUMNS",
+                       help="The shape of the compression tiles (default: one tile per image)")
+
+    group.add_argument("--quantize-level", type=float, default=DEFAULT_QUANTIZE_LEVEL,
+                       metavar="FLOAT",
+                       help="The quantization level of floating point images (default: {}, 0 for lossless gzip compression)".format(DEFAULT_QUANTIZE_LEVEL))
+
+
+def get_compression(args, parser=None):
+    """
+    Return the compression options (a dictionary given to ``make_hdu()``)
+    given on the command line, or None if images are not compressed.
+    """
+
+    if args.compress is None:
+        return None
+
+    if (args.quantize_level == 0) and (args.compress != "gzip"):
+        message = "lossless compression (--quantize-level 0) of floating point images requires --compress gzip"
+        if parser is not None:
+            parser.error(message)
+        raise ValueError(message)
+
+    return {"compression_type": COMPRESSION_TYPES[args.compress],
+            "tile_shape": args.tile_shape,
+            "quantize_level": args.quantize_level}
+
+
+def make_hdu(data, primary=False, compression=None, name=None):
+    """
+    Make an image HDU.
+
+    Parameters
+    ----------
+    data : numpy.array
+        The image (2D array) or the cube (3D array: image x row x column).
+    primary : bool
+        Make the primary HDU (ignored for compressed images: the primary
+        HDU of a compressed FITS file is empty).
+    compression : dict
+        The compression options (see ``get_compression()``), None for an
+        uncompressed HDU.
+    name : str
+        The name of the HDU.
+
+    Returns
+    -------
+    fits.PrimaryHDU, fits.ImageHDU or fits.CompImageHDU
+        The HDU.
+    """
+
+    if compression is None:
+        if primary:
+            return fits.PrimaryHDU(data)
+        return fits.ImageHDU(data, name=name)
+
+    data = np.asarray(data)
+
+    tile_shape = compression["tile_shape"]
+
+    if tile_shape is None:
+        tile_shape = data.shape[-2:]
+
+    tile_shape = (1,) * (data.ndim - len(tile_shape)) + tuple(tile_shape)
+
+    kwargs = {"compression_type": compression["compression_type"]}
+
+    if _TILE_SHAPE_IN_NUMPY_ORDER:
+        kwargs["tile_shape"] = tile_shape
+    else:
+        kwargs["tile_size"] = list(tile_shape[::-1])
+
+    if np.issubdtype(data.dtype, np.integer):
+        # Integer images are compressed losslessly
+        data = data.astype(np.int32)
+    else:
+        kwargs["quantize_level"] = compression["quantize_level"]
+
+    return fits.CompImageHDU(data, name=name, **kwargs)
+
+
+def make_hdu_list(hdu_list, compression=None):
+    """Return a fits.HDUList of 'hdu_list', prefixed by an empty primary
+    HDU if images are compressed."""
+
+    if compression is None:
+        return fits.HDUList(hdu_list)
+
+    return fits.HDUList([fits.PrimaryHDU()] + list(hdu_list))
+
+
+def get_image_arrays(file_path):
+    """Return the data (numpy arrays) of the image HDUs of the 'file_path'
+    FITS file that contain data, compressed or not."""
+
+    with fits.open(file_path) as hdu_list:
+        return [np.array(hdu.data) for hdu in hdu_list
+                if isinstance(hdu, (fits.PrimaryHDU, fits.ImageHDU, fits.CompImageHDU)) and (hdu.data is not None)]
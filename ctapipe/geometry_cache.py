@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Content-addressed cache of camera geometries.
+
+``ctapipe.io.CameraGeometry.guess()`` identifies the camera and computes the
+pixel neighbours and areas of a camera layout, which is expensive. This
+module resolves the geometry of each layout (pixels position and focal
+length) once:
+
+- geometries are identified by a hash of the pixels position and of the
+  focal length (in meters, see ``get_layout_key()``), thus images exported
+  from different simtel files (or JSON files, calibration tables, ...) that
+  have the same camera share the same geometry;
+- each resolved geometry (camera ID, pixel type, pixels position and area,
+  and the neighbour matrix in CSR form) is saved in a ``.npz`` file of the
+  ``geometries`` directory of the cache directory (see simtel_cache.py);
+- geometries already loaded are kept in memory, thus a process that renders
+  many images builds each geometry only once.
+
+Usage: ./geometry_cache.py [--list] [--clear]
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+
+import astropy.units as u
+import numpy as np
+
+import ctapipe
+import ctapipe.io
+
+import simtel_cache
+
+GEOMETRY_DIR_NAME = "geometries"
+
+_geometry_cache = {}    # Geometries already loaded by this process (key=layout key)
+
+
+def _to_meters(values):
+    """Return 'values' (a Quantity, an array, a list or a scalar in meters)
+    as a (1D) float64 array of values in meters."""
+    if hasattr(values, "unit"):
+        values = values.to(u.m).value
+    return np.asarray(values, dtype=np.float64).ravel()
+
+
+def get_layout_key(pixel_pos_x, pixel_pos_y, foclen):
+    """Return a key (hexadecimal string) identifying a camera layout, i.e.
+    its pixels position and its focal length (in meters)."""
+
+    digest = hashlib.sha1()
+
+    for values in (pixel_pos_x, pixel_pos_y, foclen):
+        digest.update(_to_meters(values).tobytes())
+
+    return digest.hexdigest()
+
+
+def get_geometry_dir():
+    """Return the path of the directory of the cached geometries."""
+    return os.path.join(simtel_cache.get_cache_dir(), GEOMETRY_DIR_NAME)
+
+
+def get_geometry_file_path(layout_key):
+    """Return the path of the cached geometry of 'layout_key'."""
+    return os.path.join(get_geometry_dir(), "{}.npz".format(layout_key))
+
+
+def save_geometry(geom, file_path):
+    """Write the CameraGeometry 'geom' in the 'file_path' .npz file."""
+
+    num_pixels = len(geom.pix_x)
+
+    neighbors = [np.asarray(pixel_neighbors, dtype=np.int64) for pixel_neighbors in geom.neighbors]
+    indptr = np.concatenate([[0], np.cumsum([len(pixel_neighbors) for pixel_neighbors in neighbors])])
+    indices = np.concatenate(neighbors) if num_pixels > 0 else np.empty(0, dtype=np.int64)
+
+    pix_area = np.broadcast_to(np.asarray(geom.pix_area.to(u.m**2).value, dtype=np.float64), (num_pixels,))
+
+    np.savez(file_path,
+             cam_id=np.array(geom.cam_id),
+             pix_type=np.array(geom.pix_type),
+             pix_id=np.asarray(geom.pix_id),
+             pix_x=_to_meters(geom.pix_x),
+             pix_y=_to_meters(geom.pix_y),
+             pix_area=pix_area,
+             neighbors_indptr=indptr.astype(np.int64),
+             neighbors_indices=indices.astype(np.int64))
+
+
+def load_geometry(file_path):
+    """Read a CameraGeometry written by ``save_geometry()``."""
+
+    with np.load(file_path) as data:
+        indptr = data["neighbors_indptr"]
+        indices = data["neighbors_indices"]
+        neighbors = [indices[indptr[pixel]:indptr[pixel + 1]].tolist() for pixel in range(len(indptr) - 1)]
+
+        return ctapipe.io.CameraGeometry(str(data["cam_id"]),
+                                         data["pix_id"],
+                                         data["pix_x"] * u.m,
+                                         data["pix_y"] * u.m,
+                                         data["pix_area"] * u.m**2,
+                                         neighbors,
+                                         str(data["pix_type"]))
+
+
+def get_geometry(pixel_pos_x, pixel_pos_y, foclen):
+    """
+    Get the CameraGeometry of a camera layout.
+
+    The geometry is taken from the memory cache, then from the disk cache;
+    it is guessed (and saved) only if it is in neither of them.
+
+    Parameters
+    ----------
+    pixel_pos_x, pixel_pos_y : Quantity, numpy.array or list
+        The position of each pixel (in meters if they are not Quantities).
+    foclen : Quantity or float
+        The focal length (in meters if it is not a Quantity).
+
+    Returns
+    -------
+    ctapipe.io.CameraGeometry
+        The geometry (the same object for all the calls with the same
+        layout).
+    """
+
+    layout_key = get_layout_key(pixel_pos_x, pixel_pos_y, foclen)
+
+    if layout_key in _geometry_cache:
+        return _geometry_cache[layout_key]
+
+    geometry_file_path = get_geometry_file_path(layout_key)
+    geom = None
+
+    if os.path.isfile(geometry_file_path):
+        try:
+            geom = load_geometry(geometry_file_path)
+        except (OSError, KeyError, ValueError) as e:
+            print("Warning: cannot read the cached geometry {} ({})".format(geometry_file_path, e), file=sys.stderr)
+
+    if geom is None:
+        geom = ctapipe.io.CameraGeometry.guess(_to_meters(pixel_pos_x) * u.m,
+                                               _to_meters(pixel_pos_y) * u.m,
+                                               float(_to_meters(foclen)[0]) * u.m)
+        try:
+            os.makedirs(get_geometry_dir(), exist_ok=True)
+            save_geometry(geom, geometry_file_path)
+        except OSError as e:
+            print("Warning: cannot save the geometry ({})".format(e), file=sys.stderr)
+
+    _geometry_cache[layout_key] = geom
+
+    return geom
+
+
+def get_image_geometry(image_dict):
+    """Get the CameraGeometry of an image dictionary (as exported in JSON
+    files by event_image_to_json.py)."""
+    return get_geometry(image_dict["pixel_pos_x"], image_dict["pixel_pos_y"], image_dict["foclen"])
+
+
+def main():
+    """Parse command options (sys.argv) and manage the geometry cache."""
+
+    # PARSE OPTIONS ###########################################################
+
+    desc = "Manage the cache of camera geometries."
+    parser = argparse.ArgumentParser(description=desc)
+
+    parser.add_argument("--list", "-l", action="store_true",
+                        help="List the cached geometries")
+
+    parser.add_argument("--clear", action="store_true",
+                        help="Remove all the cached geometries")
+
+    args = parser.parse_args()
+
+    geometry_dir = get_geometry_dir()
+    file_name_list = sorted(os.listdir(geometry_dir)) if os.path.isdir(geometry_dir) else []
+
+    # MANAGE THE CACHE ########################################################
+
+    if args.list:
+        for file_name in file_name_list:
+            geom = load_geometry(os.path.join(geometry_dir, file_name))
+            print("{}: {} ({} pixels, {} pixels)".format(file_name[:-4], geom.cam_id, len(geom.pix_x), geom.pix_type))
+
+    if args.clear:
+        for file_name in file_name_list:
+            os.remove(os.path.join(geometry_dir, file_name))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Write extracted images in a chunked HDF5 file (training datasets).
+
+Reading thousands of small FITS files is slow; ``HDF5ImageWriter`` appends
+the cropped images of any number of simtel files to one HDF5 file:
+
+- "images": the calibrated images (N x 40 x 40, float64);
+- "pe_images": the photoelectron images (N x 40 x 40, int32);
+- "metadata": a compound table with one row per image (see
+  ``METADATA_FIELDS``; the unit of each field is in the "units" attribute);
+  "file_index" is the index of the simtel file in the "simtel_files"
+  attribute of the file.
+
+Datasets are resizable along the first axis and chunked by
+``chunk_images`` images (64 images by default, i.e. 800KB of calibrated
+images: chunks fit in the default HDF5 chunk cache). Rows are buffered in
+memory and each chunk is written (and compressed) once, when it is full.
+
+A minibatch of ``chunk_images`` consecutive rows starting at a multiple of
+``chunk_images`` is one chunk of each dataset, thus it is read with one
+contiguous read per dataset: ``iter_minibatches()`` shuffles the order of
+the minibatches (and the rows of each minibatch) instead of the rows of the
+whole file.
+
+Usage: ./hdf5_io.py FILE
+"""
+
+import argparse
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+import numpy as np
+
+import image_crop
+
+DEFAULT_CHUNK_IMAGES = 64
+
+DEFAULT_COMPRESSION = "gzip"
+DEFAULT_COMPRESSION_LEVEL = 4
+
+# The fields (name, dtype, unit) of the metadata table
+METADATA_FIELDS = [("file_index", np.int32, None),
+                   ("event_id", np.int64, None),
+                   ("tel_id", np.int32, None),
+                   ("energy", np.float64, "TeV"),
+                   ("mc_az", np.float64, "rad"),
+                   ("mc_alt", np.float64, "rad"),
+                   ("mc_corex", np.float64, "m"),
+                   ("mc_corey", np.float64, "m"),
+                   ("foclen", np.float64, "m")]
+
+METADATA_DTYPE = np.dtype([(name, dtype) for name, dtype, unit in METADATA_FIELDS])
+
+
+def _check_h5py():
+    if h5py is None:
+        raise ImportError("h5py is required to read and write HDF5 files.")
+
+
+class HDF5ImageWriter(object):
+    """
+    Append cropped images and their metadata to a (new) HDF5 file.
+
+    Parameters
+    ----------
+    file_path : str
+        The path of the HDF5 file (overwritten if it exists).
+    image_shape : tuple of int
+        The shape of the images.
+    chunk_images : int
+        The number of images per chunk (i.e. the minibatch size for which
+        reads are contiguous).
+    compression : str
+        The HDF5 compression filter ("gzip", "lzf" or None).
+    compression_level : int
+        The gzip compression level.
+    """
+
+    def __init__(self,
+                 file_path,
+                 image_shape=image_crop.ASTRI_CROPPED_SHAPE,
+                 chunk_images=DEFAULT_CHUNK_IMAGES,
+                 compression=DEFAULT_COMPRESSION,
+                 compression_level=DEFAULT_COMPRESSION_LEVEL):
+
+        _check_h5py()
+
+        self.file_path = file_path
+        self.chunk_images = chunk_images
+        self.num_images = 0
+
+        self.simtel_file_list = []
+
+        self._file = h5py.File(file_path, "w")
+
+        compression_kwargs = {"compression": compression, "shuffle": compression is not None}
+        if compression == "gzip":
+            compression_kwargs["compression_opts"] = compression_level
+
+        def create_dataset(name, shape, dtype):
+            return self._file.create_dataset(name,
+                                             shape=(0,) + shape,
+                                             maxshape=(None,) + shape,
+                                             chunks=(chunk_images,) + shape,
+                                             dtype=dtype,
+                                             **compression_kwargs)
+
+        self._images = create_dataset("images", tuple(image_shape), np.float64)
+        self._pe_images = create_dataset("pe_images", tuple(image_shape), np.int32)
+        self._metadata = create_dataset("metadata", (), METADATA_DTYPE)
+
+        self._metadata.attrs["units"] = [unit or "" for name, dtype, unit in METADATA_FIELDS]
+
+        # The rows of the current chunk
+        self._image_buffer = np.empty((chunk_images,) + tuple(image_shape))
+        self._pe_image_buffer = np.empty((chunk_images,) + tuple(image_shape), dtype=np.int32)
+        self._metadata_buffer = np.zeros(chunk_images, dtype=METADATA_DTYPE)
+        self._num_buffered = 0
+
+    def start_file(self, simtel_file_path):
+        """Set the simtel file of the next images (its index is the
+        "file_index" metadata)."""
+        self.simtel_file_list.append(simtel_file_path)
+
+    def add(self, metadata, pe_dtype=None):
+        """
+        Add a row.
+
+        Parameters
+        ----------
+        metadata : dict
+            The metadata of the image (see ``METADATA_FIELDS``, values may be
+            (value, unit) tuples).
+        pe_dtype : numpy dtype
+            Ignored (photoelectron images are stored as int32), for
+            compatibility with ``TelescopeCube.add()``.
+
+        Returns
+        -------
+        tuple of numpy.array
+            The slots (2D arrays) where the calibrated image and the
+            photoelectron image have to be written (before the next call).
+        """
+
+        if self._num_buffered == self.chunk_images:
+            self.flush()
+
+        row = self._num_buffered
+        self._num_buffered += 1
+        self.num_images += 1
+
+        self._metadata_buffer["file_index"][row] = len(self.simtel_file_list) - 1
+
+        for name, dtype, unit in METADATA_FIELDS[1:]:
+            value = metadata[name]
+            self._metadata_buffer[name][row] = value[0] if type(value) is tuple else value
+
+        return self._image_buffer[row], self._pe_image_buffer[row]
+
+    def flush(self):
+        """Append the buffered rows to the datasets."""
+
+        num_rows = self._num_buffered
+
+        if num_rows == 0:
+            return
+
+        start = len(self._metadata)
+        stop = start + num_rows
+
+        for dataset, buffer in ((self._images, self._image_buffer),
+                                (self._pe_images, self._pe_image_buffer),
+                                (self._metadata, self._metadata_buffer)):
+            dataset.resize(stop, axis=0)
+            dataset[start:stop] = buffer[:num_rows]
+
+        self._num_buffered = 0
+
+    def close(self):
+        """Write the buffered rows and close the file."""
+
+        if self._file is None:
+            return
+
+        self.flush()
+        self._file.attrs["simtel_files"] = self.simtel_file_list
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def iter_minibatches(file_path, batch_size=None, shuffle=True, seed=None):
+    """
+    Iterate over the images of an HDF5 file written by ``HDF5ImageWriter``.
+
+    Parameters
+    ----------
+    file_path : str
+        The path of the HDF5 file.
+    batch_size : int
+        The number of images per minibatch (the chunk size of the file if
+        None: each minibatch is then read with one contiguous read per
+        dataset).
+    shuffle : bool
+        Shuffle the order of the minibatches and the rows of each minibatch.
+    seed : int
+        The seed of the random generator.
+
+    Yields
+    ------
+    tuple of numpy.array
+        The calibrated images, the photoelectron images and the metadata
+        (structured array) of each minibatch.
+    """
+
+    _check_h5py()
+
+    rng = np.random.RandomState(seed)
+
+    with h5py.File(file_path, "r") as hdf5_file:
+        images = hdf5_file["images"]
+        pe_images = hdf5_file["pe_images"]
+        metadata = hdf5_file["metadata"]
+
+        if batch_size is None:
+            batch_size = images.chunks[0]
+
+        starts = np.arange(0, len(images), batch_size)
+
+        if shuffle:
+            rng.shuffle(starts)
+
+        for start in starts:
+            batch = slice(start, start + batch_size)
+            batch_images, batch_pe_images, batch_metadata = images[batch], pe_images[batch], metadata[batch]
+
+            if shuffle:
+                permutation = rng.permutation(len(batch_images))
+                batch_images = batch_images[permutation]
+                batch_pe_images = batch_pe_images[permutation]
+                batch_metadata = batch_metadata[permutation]
+
+            yield batch_images, batch_pe_images, batch_metadata
+
+
+def main():
+    """Parse command options (sys.argv) and print the content of the given
+    HDF5 file."""
+
+    # PARSE OPTIONS ###########################################################
+
+    desc = "Print the content of an HDF5 file of extracted images."
+    parser = argparse.ArgumentParser(description=desc)
+
+    parser.add_argument("fileargs", nargs=1, metavar="FILE",
+                        help="The HDF5 file to read")
+
+    args = parser.parse_args()
+
+    _check_h5py()
+
+    # PRINT THE CONTENT #######################################################
+
+    with h5py.File(args.fileargs[0], "r") as hdf5_file:
+        for simtel_file_index, simtel_file_path in enumerate(hdf5_file.attrs["simtel_files"]):
+            print("File {}: {}".format(simtel_file_index, simtel_file_path))
+
+        for name in ("images", "pe_images", "metadata"):
+            dataset = hdf5_file[name]
+            print("{}: {} {} (chunks: {}, compression: {})".format(name, dataset.shape, dataset.dtype, dataset.chunks, dataset.compression))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Resample hexagonal camera images on regular 2D grids (and back).
+
+Our image processing tools (crop, FITS export, mr_transform, ...) need
+rectangular 2D arrays. Two resampling methods are available for hexagonal
+cameras:
+
+- "axial": each hexagonal pixel is put in one cell of a grid indexed by its
+  axial coordinates (q, r) on the hexagonal lattice. The grid is a sheared
+  view of the camera but no information is lost: the inverse is exact.
+- "area": the camera is rebinned on a square grid (cells have the same area
+  as the pixels); each pixel gives to each cell a part of its value
+  proportional to the area they share, thus the image integral is kept.
+  There is no exact inverse: ``unresample()`` gives the least-squares
+  solution (the camera image whose rebinning is the closest to the grid
+  image). The round trip is nearly exact (relative errors about 1e-6) when
+  the grid is tilted with respect to the lattice; when it is aligned with the
+  lattice, some pixel patterns (e.g. alternating columns) give the same
+  grid image and they are not recovered.
+
+Both resamplings are linear: they are precomputed once per camera layout
+(see ``geometry_cache.get_layout_key()``) as SciPy sparse matrices (forward:
+cell x pixel, inverse of the axial remap: pixel x cell) and applied to whole
+image stacks with one sparse-dense product. The operators are cached on disk
+(in the directory of simtel_cache.py).
+
+Usage: ./hex_resampling.py [--method {axial,area}] [-o FILE] JSON_FILE
+       (JSON_FILE, or a binary '.npz' file, is made by event_image_to_json.py)
+"""
+
+__all__ = ['HexResampler',
+           'make_resampler',
+           'get_resampler']
+
+import argparse
+import math
+import os
+import sys
+import tempfile
+
+import numpy as np
+import scipy.sparse
+import scipy.sparse.linalg
+import scipy.spatial
+
+from matplotlib import pyplot as plt
+
+import geometry_cache
+import image_io
+import simtel_cache
+
+METHODS = ("axial", "area")
+
+# The (relative) Tikhonov damping of the least-squares inverse: it keeps the
+# normal equations solvable when the grid is aligned with the lattice
+LEAST_SQUARES_DAMPING = 1e-9
+
+_resampler_cache = {}   # Resamplers already loaded by this process (key=(layout key, method))
+
+
+class HexResampler(object):
+    """
+    Resampling operators between a hexagonal camera and a 2D grid.
+
+    Attributes
+    ----------
+    shape : tuple
+        The shape (rows, columns) of the grid; the first row is the top of
+        the camera.
+    forward : scipy.sparse.csr_matrix
+        The (num_cells x num_pixels) resampling operator.
+    inverse : scipy.sparse.csr_matrix
+        The (num_pixels x num_cells) exact inverse operator, or None if
+        there is none (``unresample()`` then solves a least-squares
+        problem).
+    """
+
+    def __init__(self, shape, forward, inverse=None):
+        self.shape = tuple(int(size) for size in shape)
+        self.forward = scipy.sparse.csr_matrix(forward)
+        self.inverse = None if inverse is None else scipy.sparse.csr_matrix(inverse)
+
+        self._normal_solver = None  # The factorized normal equations (computed on demand)
+
+    @property
+    def num_pixels(self):
+        """The number of pixels of the camera."""
+        return self.forward.shape[1]
+
+    def resample(self, images):
+        """
+        Resample camera images on the grid.
+
+        Parameters
+        ----------
+        images : numpy.array
+            One camera image (1D array: pixel) or a stack of images (2D
+            array: image x pixel).
+
+        Returns
+        -------
+        numpy.array
+            The grid image (2D array: row x column) or the stack of grid
+            images (3D array: image x row x column).
+        """
+        images = np.asarray(images)
+        grid_images = (self.forward @ images.T).T
+        return grid_images.reshape(images.shape[:-1] + self.shape)
+
+    def unresample(self, grid_images):
+        """
+        Resample grid images back on the camera pixels.
+
+        This is the inverse of ``resample()`` if the resampler has an
+        ``inverse`` operator (axial remap). Otherwise (area rebinning), the
+        result is the least-squares solution ``argmin |forward @ image -
+        grid_image|`` (with a tiny damping): it is the original image when
+        the rebinning doesn't lose information, see the module
+        documentation.
+
+        Parameters
+        ----------
+        grid_images : numpy.array
+            One grid image (2D array) or a stack of grid images (3D array).
+
+        Returns
+        -------
+        numpy.array
+            The camera image (1D array) or the stack of camera images (2D
+            array: image x pixel).
+        """
+        grid_images = np.asarray(grid_images)
+        leading_shape = grid_images.shape[:-2]
+        flat_images = grid_images.reshape((-1, self.shape[0] * self.shape[1]))
+
+        if self.inverse is not None:
+            images = (self.inverse @ flat_images.T).T
+        else:
+            images = self._get_normal_solver().solve(self.forward.T @ flat_images.T).T
+
+        return images.reshape(leading_shape + (self.num_pixels,))
+
+    def _get_normal_solver(self):
+        """Return the LU factorization of the (damped) normal equations
+        'forward.T @ forward' (computed on the first call)."""
+
+        if self._normal_solver is None:
+            normal = (self.forward.T @ self.forward).tocsc()
+            damping = LEAST_SQUARES_DAMPING * normal.diagonal().mean()
+            self._normal_solver = scipy.sparse.linalg.splu(normal + damping * scipy.sparse.identity(self.num_pixels, format="csc"))
+
+        return self._normal_solver
+
+
+# LATTICE #####################################################################
+
+def _get_lattice(x, y):
+    """Return the pitch (distance between neighbour pixels) and the
+    orientation (angle of the lattice, modulo 60 degrees) of a hexagonal
+    camera."""
+
+    positions = np.column_stack([x, y])
+    tree = scipy.spatial.cKDTree(positions)
+
+    distances, indices = tree.query(positions, k=2)
+    pitch = np.median(distances[:, 1])
+
+    pairs = tree.query_pairs(1.1 * pitch, output_type="ndarray")
+    vectors = positions[pairs[:, 1]] - positions[pairs[:, 0]]
+
+    # Mean of the neighbour directions (the lattice is invariant by a 60
+    # degrees rotation)
+    angles = np.arctan2(vectors[:, 1], vectors[:, 0])
+    orientation = (np.angle(np.mean(np.exp(6j * angles))) / 6.) % (math.pi / 3.)
+
+    return pitch, orientation
+
+
+# AXIAL REMAP #################################################################
+
+def _make_axial_operators(x, y):
+    pitch, orientation = _get_lattice(x, y)
+
+    # The lattice basis
+    basis = pitch * np.array([[math.cos(orientation), math.cos(orientation + math.pi / 3.)],
+                              [math.sin(orientation), math.sin(orientation + math.pi / 3.)]])
+
+    q, r = np.rint(np.linalg.solve(basis, np.vstack([x - x[0], y - y[0]]))).astype(np.intp)
+
+    # The first row of the grid is the top of the camera
+    rows = r.max() - r
+    cols = q - q.min()
+    shape = (rows.max() + 1, cols.max() + 1)
+
+    cells = np.ravel_multi_index((rows, cols), shape)
+
+    if len(np.unique(cells)) != len(x):
+        raise ValueError("The camera pixels are not on a hexagonal lattice.")
+
+    num_pixels = len(x)
+    forward = scipy.sparse.csr_matrix((np.ones(num_pixels), (cells, np.arange(num_pixels))),
+                                      shape=(shape[0] * shape[1], num_pixels))
+
+    return shape, forward, forward.T.tocsr()
+
+
+# AREA-WEIGHTED REBINNING #####################################################
+
+def _clip_polygon(polygon, axis, bound, keep_greater):
+    """Clip a convex polygon (a list of (x, y) vertices) by the half plane
+    'coordinate[axis] >= bound' (or '<=')."""
+
+    def inside(vertex):
+        return vertex[axis] >= bound if keep_greater else vertex[axis] <= bound
+
+    clipped_polygon = []
+
+    for index, current in enumerate(polygon):
+        previous = polygon[index - 1]
+
+        if inside(current) != inside(previous):
+            ratio = (bound - previous[axis]) / (current[axis] - previous[axis])
+            clipped_polygon.append((previous[0] + ratio * (current[0] - previous[0]),
+                                    previous[1] + ratio * (current[1] - previous[1])))
+
+        if inside(current):
+            clipped_polygon.append(current)
+
+    return clipped_polygon
+
+
+def _polygon_area(polygon):
+    if len(polygon) < 3:
+        return 0.
+    vertices = np.array(polygon)
+    x, y = vertices[:, 0], vertices[:, 1]
+    return 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+def _make_area_operators(x, y):
+    pitch, orientation = _get_lattice(x, y)
+
+    pixel_area = math.sqrt(3.) / 2. * pitch**2
+    cell_size = math.sqrt(pixel_area)
+
+    # The vertices of each hexagon (the sides face the neighbour pixels)
+    radius = pitch / math.sqrt(3.)
+    vertex_angles = orientation + math.pi / 6. + np.arange(6) * math.pi / 3.
+    vertices_x = x[:, np.newaxis] + radius * np.cos(vertex_angles)
+    vertices_y = y[:, np.newaxis] + radius * np.sin(vertex_angles)
+
+    x_min, y_max = vertices_x.min(), vertices_y.max()
+    shape = (int(math.ceil((y_max - vertices_y.min()) / cell_size)),
+             int(math.ceil((vertices_x.max() - x_min) / cell_size)))
+
+    cell_list, pixel_list, area_list = [], [], []
+
+    for pixel in range(len(x)):
+        hexagon = list(zip(vertices_x[pixel], vertices_y[pixel]))
+
+        col_range = range(int((vertices_x[pixel].min() - x_min) / cell_size),
+                          min(int((vertices_x[pixel].max() - x_min) / cell_size) + 1, shape[1]))
+        row_range = range(int((y_max - vertices_y[pixel].max()) / cell_size),
+                          min(int((y_max - vertices_y[pixel].min()) / cell_size) + 1, shape[0]))
+
+        for row in row_range:
+            cell_top = y_max - row * cell_size
+            band = _clip_polygon(hexagon, 1, cell_top, keep_greater=False)
+            band = _clip_polygon(band, 1, cell_top - cell_size, keep_greater=True)
+
+            for col in col_range:
+                cell_left = x_min + col * cell_size
+                polygon = _clip_polygon(band, 0, cell_left, keep_greater=True)
+                polygon = _clip_polygon(polygon, 0, cell_left + cell_size, keep_greater=False)
+                area = _polygon_area(polygon)
+
+                if area > 0.:
+                    cell_list.append(row * shape[1] + col)
+                    pixel_list.append(pixel)
+                    area_list.append(area)
+
+    areas = scipy.sparse.csr_matrix((area_list, (cell_list, pixel_list)),
+                                    shape=(shape[0] * shape[1], len(x)))
+
+    # Forward: each pixel spreads its value on the cells it covers (there is
+    # no exact inverse, see HexResampler.unresample())
+    forward = areas / pixel_area
+
+    return shape, forward
+
+
+# OPERATORS CACHE #############################################################
+
+def make_resampler(pixel_pos_x, pixel_pos_y, method="axial"):
+    """
+    Make the resampling operators of a hexagonal camera.
+
+    Parameters
+    ----------
+    pixel_pos_x, pixel_pos_y : numpy.array or astropy Quantity
+        The position of each pixel (e.g. ``geom.pix_x`` and ``geom.pix_y``).
+    method : str
+        The resampling method ("axial" or "area").
+
+    Returns
+    -------
+    HexResampler
+        The resampling operators.
+    """
+
+    x = np.asarray(getattr(pixel_pos_x, "value", pixel_pos_x), dtype=np.float64)
+    y = np.asarray(getattr(pixel_pos_y, "value", pixel_pos_y), dtype=np.float64)
+
+    if method == "axial":
+        return HexResampler(*_make_axial_operators(x, y))
+    elif method == "area":
+        return HexResampler(*_make_area_operators(x, y))
+    else:
+        raise ValueError("Unknown resampling method '{}' (among {}).".format(method, ", ".join(METHODS)))
+
+
+def get_resampler_file_path(cam_id, layout_key, method):
+    """Return the path of the cached resampling operators of a camera
+    layout."""
+    return os.path.join(simtel_cache.get_cache_dir(), "hex_resampling",
+                        "{}_{}_{}.npz".format(cam_id, layout_key, method))
+
+
+def _save_resampler(resampler, file_path):
+    arrays = {"shape": np.array(resampler.shape)}
+    for name in ("forward", "inverse"):
+        matrix = getattr(resampler, name)
+        if matrix is not None:
+            arrays[name + "_data"] = matrix.data
+            arrays[name + "_indices"] = matrix.indices
+            arrays[name + "_indptr"] = matrix.indptr
+            arrays[name + "_shape"] = np.array(matrix.shape)
+
+    # Write a temporary file then rename it (concurrent processes never read
+    # a partial file)
+    tmp_fd, tmp_file_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix=".tmp")
+
+    with os.fdopen(tmp_fd, "wb") as fd:
+        np.savez_compressed(fd, **arrays)
+
+    os.replace(tmp_file_path, file_path)
+
+
+def _load_resampler(file_path):
+    with np.load(file_path) as data:
+        matrices = [scipy.sparse.csr_matrix((data[name + "_data"], data[name + "_indices"], data[name + "_indptr"]),
+                                            shape=tuple(data[name + "_shape"]))
+                    if name + "_data" in data.files else None
+                    for name in ("forward", "inverse")]
+        return HexResampler(data["shape"], *matrices)
+
+
+def get_resampler(cam_id, pixel_pos_x, pixel_pos_y, method="axial"):
+    """
+    Get the resampling operators of the camera 'cam_id' (see
+    ``make_resampler()``).
+
+    The operators are made on the first call for a camera layout (pixels
+    position) then they are read from the disk cache.
+    """
+
+    # The operators only depend on the pixels position (not on the focal
+    # length)
+    layout_key = geometry_cache.get_layout_key(pixel_pos_x, pixel_pos_y, 0.)
+    key = (layout_key, method)
+
+    if key in _resampler_cache:
+        return _resampler_cache[key]
+
+    resampler_file_path = get_resampler_file_path(cam_id, layout_key, method)
+
+    if os.path.isfile(resampler_file_path):
+        resampler = _load_resampler(resampler_file_path)
+    else:
+        resampler = make_resampler(pixel_pos_x, pixel_pos_y, method)
+        try:
+            os.makedirs(os.path.dirname(resampler_file_path), exist_ok=True)
+            _save_resampler(resampler, resampler_file_path)
+        except OSError as e:
+            print("Warning: cannot save the resampling operators ({})".format(e), file=sys.stderr)
+
+    _resampler_cache[key] = resampler
+
+    return resampler
+
+
+def main():
+    """Parse command options (sys.argv) and resample the image of a JSON
+    file."""
+
+    # PARSE OPTIONS ###########################################################
+
+    desc = "Resample the (hexagonal camera) image of a JSON file on a regular 2D grid."
+    parser = argparse.ArgumentParser(description=desc)
+
+    parser.add_argument("--method", "-m", choices=METHODS, default="axial",
+                        help="The resampling method")
+
+    parser.add_argument("--quiet", "-q", action="store_true",
+                        help="Don't show the plot, just save it")
+
+    parser.add_argument("--output", "-o", default=None,
+                        metavar="FILE",
+                        help="The output file path (a Numpy '.npy' file or a plot)")
+
+    parser.add_argument("fileargs", nargs=1, metavar="FILE",
+                        help="The JSON file to process")
+
+    args = parser.parse_args()
+
+    json_file_path = args.fileargs[0]
+
+    if args.output is None:
+        output_file_path = "{}_{}.pdf".format(os.path.splitext(json_file_path)[0], args.method)
+    else:
+        output_file_path = args.output
+
+    # RESAMPLE THE IMAGE ######################################################
+
+    # JSON or binary (".npz") file, see image_io.py
+    image_dict = image_io.load_image_dict(json_file_path)
+
+    resampler = get_resampler(image_dict["camera_id"],
+                              image_dict["pixel_pos_x"],
+                              image_dict["pixel_pos_y"],
+                              args.method)
+
+    grid_image = resampler.resample(np.array(image_dict["image"], dtype=np.float64))
+
+    # SAVE OR PLOT ############################################################
+
+    if output_file_path.endswith(".npy"):
+        np.save(output_file_path, grid_image)
+    else:
+        plt.imshow(grid_image, interpolation="nearest", cmap="gray")
+        plt.title("{} ({} resampling)".format(image_dict["camera_id"], args.method))
+        plt.savefig(output_file_path, bbox_inches='tight')
+
+        if not args.quiet:
+            plt.show()
+
+
+if __name__ == '__main__':
+    main()
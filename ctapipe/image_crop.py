@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Crop camera images into regular 2D "rectangular" images directly usable with
+most image processing tools (and the inverse operation).
+
+ASTRI cameras have 37 modules of 8x8 pixels; the 25 modules of the central
+5x5 square are kept. The mapping between the (40x40) cropped image and the
+camera pixels is computed once, at import, as a flat index array: cropping
+is a single ``take`` (for one image or for a stack of images) and the
+inverse is a single scatter.
+
+Other cameras with rectangular pixels (SCTCam, CHEC, ...) are mapped on a
+grid derived from their pixels position (see ``make_grid_map()``): positions
+are quantized in rows and columns (the gaps between modules are removed) and
+the grid cells without pixel (e.g. missing corner modules) are masked. The
+grid map of each camera layout (see ``geometry_cache.get_layout_key()``) is
+computed once and cached on disk (in the directory of simtel_cache.py).
+"""
+
+__all__ = ['crop_astri_image',
+           'crop_astri_images',
+           'uncrop_astri_image',
+           'uncrop_astri_images',
+           'GridMap',
+           'ASTRI_GRID_MAP',
+           'make_grid_map',
+           'get_grid_map']
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+import simtel_cache
+
+ASTRI_MODULE_SIZE = 8                                   # Modules are 8x8 pixels
+ASTRI_NUM_MODULES = 37
+ASTRI_NUM_PIXELS = ASTRI_NUM_MODULES * ASTRI_MODULE_SIZE**2
+ASTRI_CROPPED_SHAPE = (5 * ASTRI_MODULE_SIZE, 5 * ASTRI_MODULE_SIZE)
+
+# The camera module displayed in each 8x8 block of the cropped image (from the
+# top left block to the bottom right block)
+ASTRI_MODULE_MAP = [[29, 30, 31, 32, 33],
+                    [23, 24, 25, 26, 27],
+                    [16, 17, 18, 19, 20],
+                    [ 9, 10, 11, 12, 13],
+                    [ 3,  4,  5,  6,  7]]
+
+
+def _make_astri_crop_map():
+    """Return the camera pixel index of each pixel of the (flattened) cropped
+    image."""
+    size = ASTRI_MODULE_SIZE
+
+    # Pixels of a module, its first row is displayed at the bottom of the block
+    module_pixels = np.arange(size**2).reshape([size, size])[::-1, :]
+
+    img_map = np.zeros(ASTRI_CROPPED_SHAPE, dtype=np.intp)
+
+    for block_row, module_row in enumerate(ASTRI_MODULE_MAP):
+        for block_col, module in enumerate(module_row):
+            img_map[block_row*size:(block_row+1)*size,
+                    block_col*size:(block_col+1)*size] = module_pixels + module * size**2
+
+    img_map = img_map.ravel()
+    img_map.setflags(write=False)
+
+    return img_map
+
+
+ASTRI_CROP_MAP = _make_astri_crop_map()
+
+
+def crop_astri_image(input_img):
+    """
+    Crop images comming form "ASTRI" telescopes in order to get regular 2D "rectangular"
+    images directly usable with most image processing tools.
+
+    Parameters
+    ----------
+    input_img : numpy.array
+        The image to crop
+
+    Returns
+    -------
+    A numpy.array containing the cropped image.
+    """
+
+    # Check the image
+    if len(input_img) != ASTRI_NUM_PIXELS:
+        raise ValueError("The input image is not a valide ASTRI telescope image.")
+
+    return np.take(input_img, ASTRI_CROP_MAP).reshape(ASTRI_CROPPED_SHAPE)
+
+
+def crop_astri_images(input_imgs, out=None):
+    """
+    Crop a stack of "ASTRI" images (see ``crop_astri_image()``).
+
+    Parameters
+    ----------
+    input_imgs : numpy.array
+        The images to crop (2D array: image x pixel).
+    out : numpy.array
+        The (C contiguous) image x 40 x 40 array where cropped images are
+        written (a new array is made if None).
+
+    Returns
+    -------
+    A numpy.array containing the cropped images (3D array: image x 40 x 40).
+    """
+
+    input_imgs = np.asarray(input_imgs)
+
+    if input_imgs.ndim != 2 or input_imgs.shape[1] != ASTRI_NUM_PIXELS:
+        raise ValueError("The input images are not valide ASTRI telescope images.")
+
+    shape = (input_imgs.shape[0],) + ASTRI_CROPPED_SHAPE
+
+    if out is None:
+        out = np.empty(shape, dtype=input_imgs.dtype)
+    elif (out.shape != shape) or not out.flags.c_contiguous:
+        # The images are written through a flat view of 'out'
+        raise ValueError("The output array should be a contiguous {} array.".format(shape))
+
+    np.take(input_imgs, ASTRI_CROP_MAP, axis=1, out=out.reshape(input_imgs.shape[0], -1))
+
+    return out
+
+
+def uncrop_astri_image(cropped_img, fill_value=0):
+    """
+    Put back the pixels of a cropped "ASTRI" image in the camera pixel order
+    (the inverse of ``crop_astri_image()``).
+
+    Parameters
+    ----------
+    cropped_img : numpy.array
+        The cropped image (2D array: 40 x 40).
+    fill_value : float
+        The value of the camera pixels that are not in the cropped image.
+
+    Returns
+    -------
+    A numpy.array containing the camera image (1D array).
+    """
+
+    return uncrop_astri_images(np.asarray(cropped_img)[np.newaxis], fill_value)[0]
+
+
+def uncrop_astri_images(cropped_imgs, fill_value=0):
+    """
+    Put back the pixels of a stack of cropped "ASTRI" images in the camera
+    pixel order (the inverse of ``crop_astri_images()``).
+
+    Parameters
+    ----------
+    cropped_imgs : numpy.array
+        The cropped images (3D array: image x 40 x 40).
+    fill_value : float
+        The value of the camera pixels that are not in the cropped images.
+
+    Returns
+    -------
+    A numpy.array containing the camera images (2D array: image x pixel).
+    """
+
+    cropped_imgs = np.asarray(cropped_imgs)
+
+    if cropped_imgs.shape[1:] != ASTRI_CROPPED_SHAPE:
+        raise ValueError("The input images are not cropped ASTRI telescope images.")
+
+    num_images = cropped_imgs.shape[0]
+
+    camera_imgs = np.full((num_images, ASTRI_NUM_PIXELS), fill_value, dtype=cropped_imgs.dtype)
+    camera_imgs[:, ASTRI_CROP_MAP] = cropped_imgs.reshape(num_images, -1)
+
+    return camera_imgs
+
+
+# GEOMETRY-DRIVEN GRID MAPS ###################################################
+
+_grid_map_cache = {}    # Grid maps already loaded by this process (key=layout key)
+
+
+class GridMap(object):
+    """
+    The mapping between the pixels of a rectangular camera and a 2D grid.
+
+    Attributes
+    ----------
+    pixel_index : numpy.array
+        The camera pixel index of each grid cell (2D array: row x column, -1
+        for the cells without pixel).
+    """
+
+    def __init__(self, pixel_index):
+        self.pixel_index = np.asarray(pixel_index, dtype=np.intp)
+        self.pixel_index.setflags(write=False)
+
+        # Gather indices (masked cells read pixel 0 and are then filled)
+        flat_index = self.pixel_index.ravel()
+        self._mask = flat_index < 0
+        self._take_index = np.where(self._mask, 0, flat_index)
+        self._take_index.setflags(write=False)
+
+    @property
+    def shape(self):
+        """The shape of the grid."""
+        return self.pixel_index.shape
+
+    @property
+    def mask(self):
+        """The grid cells without pixel (2D boolean array)."""
+        return self._mask.reshape(self.shape)
+
+    @property
+    def take_index(self):
+        """The camera pixel index of each (flattened) grid cell, 0 for the
+        cells without pixel (1D read-only array)."""
+        return self._take_index
+
+    def crop(self, input_img, fill_value=0):
+        """Map the camera image 'input_img' (1D array) on the grid (2D array,
+        the cells without pixel are set to 'fill_value')."""
+        return self.crop_stack(np.asarray(input_img)[np.newaxis], fill_value)[0]
+
+    def crop_stack(self, input_imgs, fill_value=0, out=None):
+        """Map a stack of camera images (2D array: image x pixel) on the
+        grid (3D array: image x row x column, written in 'out' if it is
+        given: it must then be C contiguous)."""
+        input_imgs = np.asarray(input_imgs)
+        shape = (input_imgs.shape[0],) + self.shape
+
+        if out is None:
+            out = np.empty(shape, dtype=input_imgs.dtype)
+        elif (out.shape != shape) or not out.flags.c_contiguous:
+            # The images are written through a flat view of 'out'
+            raise ValueError("The output array should be a contiguous {} array.".format(shape))
+
+        flat_out = out.reshape(input_imgs.shape[0], -1)
+        np.take(input_imgs, self._take_index, axis=1, out=flat_out)
+        flat_out[:, self._mask] = fill_value
+
+        return out
+
+    def uncrop(self, cropped_img, num_pixels, fill_value=0):
+        """Put back the cells of a grid image in the camera pixel order (the
+        inverse of ``crop()``)."""
+        camera_img = np.full(num_pixels, fill_value, dtype=np.asarray(cropped_img).dtype)
+        flat_img = np.asarray(cropped_img).ravel()
+        camera_img[self._take_index[~self._mask]] = flat_img[~self._mask]
+        return camera_img
+
+
+def _quantize(coordinates):
+    """Return the rank of the row (or column) of each coordinate: coordinates
+    closer than half a pixel belong to the same row (or column), thus gaps
+    between modules are removed."""
+
+    order = np.argsort(coordinates, kind="mergesort")
+    steps = np.diff(coordinates[order])
+
+    # The pixel pitch is the smallest step between two distinct rows
+    significant_steps = steps[steps > 1e-3 * (coordinates.max() - coordinates.min())]
+
+    if len(significant_steps) == 0:
+        return np.zeros(len(coordinates), dtype=np.intp)
+
+    pitch = significant_steps.min()
+
+    ranks = np.empty(len(coordinates), dtype=np.intp)
+    ranks[order] = np.concatenate([[0], np.cumsum(steps > pitch / 2.)])
+
+    return ranks
+
+
+def make_grid_map(pixel_pos_x, pixel_pos_y):
+    """
+    Make the grid map of a rectangular camera from its pixels position.
+
+    Parameters
+    ----------
+    pixel_pos_x, pixel_pos_y : numpy.array or astropy Quantity
+        The position of each pixel (e.g. ``event.meta.pixel_pos[tel_id]``).
+
+    Returns
+    -------
+    GridMap
+        The grid map of the camera (the first row of the grid is the top of
+        the camera, i.e. the highest y).
+    """
+
+    x = np.asarray(getattr(pixel_pos_x, "value", pixel_pos_x), dtype=np.float64)
+    y = np.asarray(getattr(pixel_pos_y, "value", pixel_pos_y), dtype=np.float64)
+
+    cols = _quantize(x)
+    rows = _quantize(-y)
+
+    pixel_index = np.full((rows.max() + 1, cols.max() + 1), -1, dtype=np.intp)
+    pixel_index[rows, cols] = np.arange(len(x))
+
+    if np.count_nonzero(pixel_index >= 0) != len(x):
+        raise ValueError("The camera pixels can't be mapped on a grid (not a rectangular camera?).")
+
+    return GridMap(pixel_index)
+
+
+# The ASTRI crop as a grid map (see ``mc_calibration.CropCalibrator``)
+ASTRI_GRID_MAP = GridMap(ASTRI_CROP_MAP.reshape(ASTRI_CROPPED_SHAPE))
+
+
+def get_grid_map_file_path(cam_id, layout_key):
+    """Return the path of the cached grid map of a camera layout."""
+    return os.path.join(simtel_cache.get_cache_dir(), "grid_maps",
+                        "{}_{}.npy".format(cam_id, layout_key))
+
+
+def get_grid_map(cam_id, pixel_pos_x, pixel_pos_y):
+    """
+    Get the grid map of the camera 'cam_id' (see ``make_grid_map()``).
+
+    The grid map is made on the first call for a camera layout (pixels
+    position) then it is read from the disk cache.
+    """
+
+    # Imported here: geometry_cache needs ctapipe, the crop functions don't
+    import geometry_cache
+
+    # The grid only depends on the pixels position (not on the focal length)
+    key = geometry_cache.get_layout_key(pixel_pos_x, pixel_pos_y, 0.)
+
+    if key in _grid_map_cache:
+        return _grid_map_cache[key]
+
+    grid_map_file_path = get_grid_map_file_path(cam_id, key)
+
+    if os.path.isfile(grid_map_file_path):
+        grid_map = GridMap(np.load(grid_map_file_path))
+    else:
+        grid_map = make_grid_map(pixel_pos_x, pixel_pos_y)
+        try:
+            # Write a temporary file then rename it (concurrent processes
+            # never read a partial grid map)
+            grid_map_dir = os.path.dirname(grid_map_file_path)
+            os.makedirs(grid_map_dir, exist_ok=True)
+            tmp_fd, tmp_file_path = tempfile.mkstemp(dir=grid_map_dir, suffix=".tmp")
+
+            with os.fdopen(tmp_fd, "wb") as fd:
+                np.save(fd, grid_map.pixel_index)
+
+            os.replace(tmp_file_path, grid_map_file_path)
+        except OSError as e:
+            print("Warning: cannot save the grid map ({})".format(e), file=sys.stderr)
+
+    _grid_map_cache[key] = grid_map
+
+    return grid_map
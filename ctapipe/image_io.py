@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Read and write image dictionaries (see event_image_to_json.py) in JSON or in
+binary (NumPy ``.npz``) files.
+
+The format is given by the file extension:
+
+- ".json": pretty printed JSON (arrays are written as lists);
+- ".npz": NumPy archive (not compressed: it is read faster) with one array
+  per field; arrays keep their type (e.g. uint16 ADC images) and scalars
+  (IDs, camera ID, focal length, ...) are 0-d arrays. Fields set to None
+  (e.g. "sliding_window_image" when the readout has no samples) are listed
+  in the "null_fields" array.
+
+``load_image_dict()`` returns the same logical fields for both formats
+(lists for JSON files, numpy arrays for ".npz" files), thus readers don't
+depend on the format.
+"""
+
+import json
+
+import numpy as np
+
+BINARY_EXTENSION = ".npz"
+JSON_EXTENSION = ".json"
+
+NULL_FIELDS_KEY = "null_fields"
+
+
+def is_binary_file(file_path):
+    """Return True if 'file_path' is (or should be) a binary image file."""
+    return file_path.lower().endswith(BINARY_EXTENSION)
+
+
+def _to_json(value):
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    return value
+
+
+def save_image_dict(image_dict, file_path):
+    """Write 'image_dict' in 'file_path' (a JSON file or, if 'file_path'
+    ends with ".npz", a binary file)."""
+
+    if is_binary_file(file_path):
+        arrays = {key: np.asarray(value) for key, value in image_dict.items() if value is not None}
+        arrays[NULL_FIELDS_KEY] = np.array(sorted(key for key, value in image_dict.items() if value is None), dtype=str)
+
+        np.savez(file_path, **arrays)
+    else:
+        with open(file_path, "w") as fd:
+            json_dict = {key: _to_json(value) for key, value in image_dict.items()}
+            json.dump(json_dict, fd, sort_keys=True, indent=4)  # pretty print format
+
+
+def load_image_dict(file_path):
+    """Read an image dictionary written by ``save_image_dict()`` (or by an
+    older version of event_image_to_json.py)."""
+
+    if not is_binary_file(file_path):
+        with open(file_path, "r") as fd:
+            return json.load(fd)
+
+    image_dict = {}
+
+    with np.load(file_path) as data:
+        for key in data.files:
+            value = data[key]
+            image_dict[key] = value.item() if value.ndim == 0 else value
+
+    for key in image_dict.pop(NULL_FIELDS_KEY, []):
+        image_dict[str(key)] = None
+
+    return image_dict
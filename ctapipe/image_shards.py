@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Store camera images in memory-mapped NumPy shards.
+
+Loading thousands of JSON images (see event_image_to_json.py) parses every
+file. A shard set stores the images of one camera layout in a directory:
+
+- ``shard_00000_<kind>.npy``, ``shard_00001_<kind>.npy``, ...: (image x
+  pixel) arrays of each kind of image ("image", "calibrated_image" and
+  "photoelectron_image", see ``IMAGE_KINDS``); every shard has
+  ``shard_size`` images but the last one, which is trimmed to the remaining
+  images when the shard set is closed;
+- ``index.npy``: the (file_index, event_id, tel_id) of each image (image
+  ``i`` is the row ``i % shard_size`` of the shard ``i // shard_size``);
+- ``lookup.npy``: the same entries sorted by (file_index, event_id,
+  tel_id), with their image index: ``ShardSet.locate()`` finds the (shard,
+  row) of an image with a binary search;
+- ``manifest.json``: the shard size, the number of images, the camera
+  layout (camera ID, pixels position and focal length, see
+  geometry_cache.py) and the list of the simtel files ("file_index").
+
+The manifest is written last (and atomically) when the writer is closed
+without error: a directory without manifest is not a shard set.
+
+``ShardSet`` opens the shards with ``np.load(mmap_mode='r')``: opening a
+shard set doesn't depend on its number of images, and statistics (see
+``ShardSet.mean()`` and ``ShardSet.stats()``) are computed on the mapped
+arrays, shard by shard, thus only the pages that are read are loaded.
+
+Usage: ./image_shards.py --output DIRECTORY [--shard-size INTEGER] FILE [FILE ...]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+
+import geometry_cache
+import image_io
+
+SHARD_FORMAT_VERSION = 2
+
+DEFAULT_SHARD_SIZE = 16384      # Images per shard
+
+MANIFEST_FILE_NAME = "manifest.json"
+INDEX_FILE_NAME = "index.npy"
+LOOKUP_FILE_NAME = "lookup.npy"
+
+# The kinds of image (image dictionary key) stored in the shards and their type
+IMAGE_KINDS = {"image": np.int32,
+               "calibrated_image": np.float64,
+               "photoelectron_image": np.int32}
+
+INDEX_DTYPE = np.dtype([("file_index", np.int32),
+                        ("event_id", np.int64),
+                        ("tel_id", np.int32)])
+
+LOOKUP_DTYPE = np.dtype(INDEX_DTYPE.descr + [("image_index", np.int64)])
+
+
+def get_shard_file_path(directory, shard, kind):
+    """Return the path of the 'kind' images of the shard 'shard'."""
+    return os.path.join(directory, "shard_{:05d}_{}.npy".format(shard, kind))
+
+
+def is_shard_set(path):
+    """Return True if 'path' is a shard set directory."""
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE_NAME))
+
+
+class ShardWriter(object):
+    """
+    Write images in a (new) shard set.
+
+    All the images of a shard set must have the same camera layout.
+
+    Parameters
+    ----------
+    directory : str
+        The shard set directory (created if it doesn't exist).
+    shard_size : int
+        The number of images per shard.
+    """
+
+    def __init__(self, directory, shard_size=DEFAULT_SHARD_SIZE):
+        self.directory = directory
+        self.shard_size = shard_size
+        self.num_images = 0
+
+        self.simtel_file_list = []
+        self._simtel_file_index = {}
+
+        self._layout = None
+        self._layout_key = None
+        self._shards = None         # The mapped arrays of the current shard (key=kind)
+        self._index = np.zeros(shard_size, dtype=INDEX_DTYPE)
+
+        os.makedirs(directory, exist_ok=True)
+
+    def _open_shard(self, shard):
+        self._shards = {kind: np.lib.format.open_memmap(get_shard_file_path(self.directory, shard, kind),
+                                                         mode="w+",
+                                                         dtype=dtype,
+                                                         shape=(self.shard_size, self._layout["num_pixels"]))
+                        for kind, dtype in IMAGE_KINDS.items()}
+
+    def _close_shard(self):
+        if self._shards is not None:
+            for shard_array in self._shards.values():
+                shard_array.flush()
+        self._shards = None
+
+    def _trim_last_shard(self):
+        # The shards are allocated with shard_size rows: rewrite the last one
+        # with its used rows only
+        shard, num_rows = divmod(self.num_images, self.shard_size)
+
+        if num_rows == 0:
+            return
+
+        for kind in IMAGE_KINDS:
+            shard_file_path = get_shard_file_path(self.directory, shard, kind)
+            tmp_file_path = shard_file_path + ".tmp"
+
+            shard_array = np.load(shard_file_path, mmap_mode="r")
+            with open(tmp_file_path, "wb") as fd:
+                np.save(fd, shard_array[:num_rows])
+            del shard_array
+
+            os.replace(tmp_file_path, shard_file_path)
+
+    def add(self, image_dict):
+        """Append an image dictionary (as exported in JSON files by
+        event_image_to_json.py)."""
+
+        layout_key = geometry_cache.get_layout_key(image_dict["pixel_pos_x"], image_dict["pixel_pos_y"], image_dict["foclen"])
+
+        if self._layout is None:
+            self._layout_key = layout_key
+            self._layout = {"camera_id": image_dict["camera_id"],
+                            "pixel_type": image_dict["pixel_type"],
+                            "num_pixels": len(image_dict["pixel_pos_x"]),
+                            "foclen": float(image_dict["foclen"]),
+                            "pixel_pos_x": np.asarray(image_dict["pixel_pos_x"], dtype=np.float64).tolist(),
+                            "pixel_pos_y": np.asarray(image_dict["pixel_pos_y"], dtype=np.float64).tolist()}
+        elif layout_key != self._layout_key:
+            raise ValueError("Event {} telescope {}: all the images of a shard set should have the same camera layout.".format(image_dict["event_id"], image_dict["tel_id"]))
+
+        shard, row = divmod(self.num_images, self.shard_size)
+
+        if row == 0:
+            self._close_shard()
+            self._open_shard(shard)
+
+        for kind, shard_array in self._shards.items():
+            shard_array[row] = image_dict[kind]
+
+        simtel_file_path = image_dict.get("simtel_file")
+        if simtel_file_path not in self._simtel_file_index:
+            self._simtel_file_index[simtel_file_path] = len(self.simtel_file_list)
+            self.simtel_file_list.append(simtel_file_path)
+
+        if self.num_images == len(self._index):
+            self._index = np.resize(self._index, 2 * len(self._index))
+
+        self._index[self.num_images] = (self._simtel_file_index[simtel_file_path], image_dict["event_id"], image_dict["tel_id"])
+
+        self.num_images += 1
+
+    def close(self):
+        """Write the index and the manifest of the shard set.
+
+        Raises a ValueError if no image has been added (the camera layout of
+        the shard set is unknown)."""
+
+        self._close_shard()
+
+        if self.num_images == 0:
+            raise ValueError("{}: no image to write in the shard set.".format(self.directory))
+
+        self._trim_last_shard()
+
+        index = self._index[:self.num_images]
+        np.save(os.path.join(self.directory, INDEX_FILE_NAME), index)
+
+        lookup = np.empty(self.num_images, dtype=LOOKUP_DTYPE)
+        for name in INDEX_DTYPE.names:
+            lookup[name] = index[name]
+        lookup["image_index"] = np.arange(self.num_images)
+        lookup.sort(order=LOOKUP_DTYPE.names)
+        np.save(os.path.join(self.directory, LOOKUP_FILE_NAME), lookup)
+
+        manifest = {"version": SHARD_FORMAT_VERSION,
+                    "shard_size": self.shard_size,
+                    "num_images": self.num_images,
+                    "kinds": sorted(IMAGE_KINDS),
+                    "simtel_files": self.simtel_file_list,
+                    "layout": self._layout}
+
+        # Write a temporary file then rename it (the directory is a shard set
+        # once all its files are written)
+        tmp_fd, tmp_file_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+
+        with os.fdopen(tmp_fd, "w") as fd:
+            json.dump(manifest, fd, sort_keys=True, indent=4)
+
+        os.replace(tmp_file_path, os.path.join(self.directory, MANIFEST_FILE_NAME))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Don't write the manifest of an incomplete shard set
+            self._close_shard()
+
+
+class ShardSet(object):
+    """
+    A shard set opened with memory-mapped arrays (see the module
+    documentation).
+
+    Parameters
+    ----------
+    directory : str
+        The shard set directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+        with open(os.path.join(directory, MANIFEST_FILE_NAME), "r") as fd:
+            self.manifest = json.load(fd)
+
+        if self.manifest.get("version") != SHARD_FORMAT_VERSION:
+            raise ValueError("{}: unsupported shard set version.".format(directory))
+
+        self.shard_size = self.manifest["shard_size"]
+        self.num_images = self.manifest["num_images"]
+        self.num_shards = -(-self.num_images // self.shard_size)
+        self.layout = self.manifest["layout"]
+
+        if self.num_images == 0 or self.layout is None:
+            raise ValueError("{}: empty shard set.".format(directory))
+        self.simtel_file_list = self.manifest["simtel_files"]
+
+        self.index = np.load(os.path.join(directory, INDEX_FILE_NAME), mmap_mode="r")
+        self.lookup = np.load(os.path.join(directory, LOOKUP_FILE_NAME), mmap_mode="r")
+
+        self._shards = {}           # Shards already mapped (key=(shard, kind))
+
+    def __len__(self):
+        return self.num_images
+
+    def get_shard(self, shard, kind):
+        """Return the (mapped, read-only) 'kind' images of the shard 'shard'
+        (without the unused rows of the last shard)."""
+
+        if (shard, kind) not in self._shards:
+            shard_array = np.load(get_shard_file_path(self.directory, shard, kind), mmap_mode="r")
+            num_rows = min(self.shard_size, self.num_images - shard * self.shard_size)
+            self._shards[(shard, kind)] = shard_array[:num_rows]
+
+        return self._shards[(shard, kind)]
+
+    def iter_shards(self, kind):
+        """Iterate over the (mapped) 'kind' images of each shard."""
+        for shard in range(self.num_shards):
+            yield self.get_shard(shard, kind)
+
+    def get_image(self, image_index, kind):
+        """Return the 'kind' image of the image 'image_index' (a view of the
+        mapped shard)."""
+        shard, row = divmod(image_index, self.shard_size)
+        return self.get_shard(shard, kind)[row]
+
+    def locate(self, simtel_file_path, event_id, tel_id):
+        """Return the (shard, row) of an image (None if the image is not in
+        the shard set)."""
+
+        if simtel_file_path not in self.simtel_file_list:
+            return None
+
+        key = (self.simtel_file_list.index(simtel_file_path), event_id, tel_id)
+
+        # Binary search in the sorted lookup table (only a few pages of the
+        # mapped table are read)
+        position = int(np.searchsorted(self.lookup, np.array(key + (0,), dtype=LOOKUP_DTYPE)))
+
+        if position == len(self.lookup):
+            return None
+
+        file_index, entry_event_id, entry_tel_id, image_index = self.lookup[position]
+
+        if (file_index, entry_event_id, entry_tel_id) != key:
+            return None
+
+        return divmod(int(image_index), self.shard_size)
+
+    def get_pixels(self, kind, pixels):
+        """Return the 'kind' values of the 'pixels' pixels (list of pixel
+        indices) of all the images (image x pixel array).
+
+        Unlike the other methods, this copies the selected columns of all the
+        images in memory (num_images x len(pixels) values)."""
+        return np.concatenate([shard_array[:, pixels] for shard_array in self.iter_shards(kind)])
+
+    def mean(self, kind):
+        """Return the mean 'kind' image."""
+
+        image_sum = np.zeros(self.layout["num_pixels"])
+
+        for shard_array in self.iter_shards(kind):
+            image_sum += shard_array.sum(axis=0, dtype=np.float64)
+
+        return image_sum / self.num_images
+
+    def stats(self, kind):
+        """
+        Return the min, max, mean and standard deviation of each pixel of
+        the 'kind' images.
+
+        Returns
+        -------
+        tuple of numpy.array
+            The (min, max, mean, std) images.
+        """
+
+        num_pixels = self.layout["num_pixels"]
+
+        img_min = np.full(num_pixels, np.inf)
+        img_max = np.full(num_pixels, -np.inf)
+        image_sum = np.zeros(num_pixels)
+        image_sum2 = np.zeros(num_pixels)
+
+        for shard_array in self.iter_shards(kind):
+            np.minimum(img_min, shard_array.min(axis=0), out=img_min)
+            np.maximum(img_max, shard_array.max(axis=0), out=img_max)
+            image_sum += shard_array.sum(axis=0, dtype=np.float64)
+            image_sum2 += np.einsum("ij,ij->j", shard_array, shard_array, dtype=np.float64)
+
+        img_mean = image_sum / self.num_images
+        img_std = np.sqrt(np.maximum(image_sum2 / self.num_images - img_mean**2, 0.))
+
+        return img_min, img_max, img_mean, img_std
+
+    def get_image_dict(self, image_index):
+        """Return the metadata of the image 'image_index' as an image
+        dictionary (without images, see event_image_to_json.py)."""
+
+        file_index, event_id, tel_id = self.index[image_index]
+
+        image_dict = dict(self.layout)
+        image_dict.update({"event_id": int(event_id),
+                           "tel_id": int(tel_id),
+                           "simtel_file": self.simtel_file_list[file_index]})
+
+        return image_dict
+
+    def get_geometry(self):
+        """Return the CameraGeometry of the shard set (see
+        geometry_cache.py)."""
+        return geometry_cache.get_image_geometry(self.layout)
+
+
+def main():
+    """Parse command options (sys.argv) and convert JSON images to a shard
+    set."""
+
+    # PARSE OPTIONS ###########################################################
+
+    desc = "Convert images stored in JSON (or binary) files to a memory-mapped shard set."
+    parser = argparse.ArgumentParser(description=desc)
+
+    parser.add_argument("--output", "-o", required=True,
+                        metavar="DIRECTORY",
+                        help="The shard set directory")
+
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE,
+                        metavar="INTEGER",
+                        help="The number of images per shard (default: {})".format(DEFAULT_SHARD_SIZE))
+
+    parser.add_argument("fileargs", nargs="+", metavar="FILE",
+                        help="The JSON (or binary) files to convert")
+
+    args = parser.parse_args()
+
+    if is_shard_set(args.output):
+        parser.error("{} is already a shard set".format(args.output))
+
+    # WRITE THE SHARDS ########################################################
+
+    with ShardWriter(args.output, args.shard_size) as writer:
+        for json_file_path in args.fileargs:
+            writer.add(image_io.load_image_dict(json_file_path))
+
+    print("{} images written in {}".format(writer.num_images, args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -9,25 +9,22 @@ This script has been made to be used by shell scripts.
 
 import argparse
 
-import ctapipe
-from ctapipe.io.hessio import hessio_event_source
+import simtel_index
+import trigger_matrix
 
 
-def event_set_operations(simtel_file_path_list):
+def event_set_operations(simtel_file_path_list, jobs=1):
 
     event_set_dict = {}
 
-    # For each simtel file...
-    for simtel_file_path in simtel_file_path_list:
-
-        event_set = set()   # Set of events (or more exactly pairs (event_id, telescope_id))
-
-        source = hessio_event_source(simtel_file_path, allowed_tels=None, max_events=None)
+    # Trigger matrices of (event_id, telescope_id) pairs (see trigger_matrix.py)
+    # The simtel files are scanned by 'jobs' worker processes
+    event_set_list_per_file = simtel_index.map_simtel_files(trigger_matrix.load_trigger_matrix,
+                                                            simtel_file_path_list,
+                                                            jobs)
 
-        for event in source:
-            event_id = event.dl0.event_id
-            for telescope_id in event.trig.tels_with_trigger:
-                event_set.add((int(event_id), int(telescope_id)))
+    # For each simtel file...
+    for simtel_file_path, event_set in zip(simtel_file_path_list, event_set_list_per_file):
 
         if len(event_set) > 0:
             # Ignore empty simtel files
@@ -42,6 +39,10 @@ if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description="List (event, telescope) pairs commons to given simtel files.")
 
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        metavar="INTEGER",
+                        help="The number of files to scan in parallel (0 for all CPU cores)")
+
     parser.add_argument("fileargs", nargs="+", metavar="FILE",
                         help="The simtel files to process")
 
@@ -50,11 +51,12 @@ if __name__ == '__main__':
 
     # MAKE COMMON EVENTS SET ##################################################
 
-    event_set_dict = event_set_operations(simtel_file_path_list)
+    event_set_dict = event_set_operations(simtel_file_path_list, args.jobs)
 
-    event_set = set.intersection(*event_set_dict.values())
+    event_set = trigger_matrix.intersection(list(event_set_dict.values()))
+    event_pair_list = event_set.pairs()
 
     for simtel_file_path in event_set_dict.keys():
-        for event_id, telescope_id in event_set:
+        for event_id, telescope_id in event_pair_list:
             print(simtel_file_path, event_id, telescope_id)
 
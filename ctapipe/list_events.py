@@ -9,30 +9,20 @@ This script has been made to be used by shell scripts.
 
 import argparse
 
-import ctapipe
-from ctapipe.io.hessio import hessio_event_source
+import simtel_index
 
 
 def list_simtel_events(simtel_file_path):
 
-    # GET EVENT #############################################################
+    # GET EVENTS ############################################################
 
-    # hessio_event_source returns a Python generator that streams data from an
-    # EventIO/HESSIO MC data file (e.g. a standard CTA data file).
-    # This generator contains ctapipe.core.Container instances ("event").
-    #
-    # Parameters:
-    # - max_events: maximum number of events to read
-    # - allowed_tels: select only a subset of telescope, if None, all are read.
-    source = hessio_event_source(simtel_file_path,
-                                 allowed_tels=None,
-                                 max_events=None)
+    # simtel_index.iter_triggers only reads the central trigger block of each
+    # event (telescope data are not decoded).
 
     event_list = []   # List of events per telescope
 
-    for event in source:
-        event_id = event.dl0.event_id
-        for telescope_id in event.trig.tels_with_trigger:
+    for event_id, tels_with_trigger in simtel_index.iter_triggers(simtel_file_path):
+        for telescope_id in tels_with_trigger:
             event_list.append((int(event_id), int(telescope_id)))
 
     return event_list
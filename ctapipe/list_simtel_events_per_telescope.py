@@ -6,7 +6,8 @@ Print the list of triggered events per telescope of the given simtel file.
 """
 
 import argparse
-from ctapipe.io.hessio import hessio_event_source
+
+import simtel_index
 
 
 def list_simtel_events_per_telescope(simtel_file_path):
@@ -24,16 +25,16 @@ def list_simtel_events_per_telescope(simtel_file_path):
     file (for each item: key=telescope id, value=the list of triggered events).
     """
 
-    source = hessio_event_source(simtel_file_path, allowed_tels=None, max_events=None)
-
     events_per_tel_dict = {}   # List of events per telescope
 
-    for event in source:
-        triggered_telescopes_list = [int(tel_id) for tel_id in event.trig.tels_with_trigger]
+    # simtel_index.iter_triggers only reads the central trigger block of each
+    # event (telescope data are not decoded).
+    for event_id, tels_with_trigger in simtel_index.iter_triggers(simtel_file_path):
+        triggered_telescopes_list = [int(tel_id) for tel_id in tels_with_trigger]
         for telescope_id in triggered_telescopes_list:
             if telescope_id not in events_per_tel_dict:
                 events_per_tel_dict[telescope_id] = []
-            events_per_tel_dict[telescope_id].append(int(event.dl0.event_id))
+            events_per_tel_dict[telescope_id].append(int(event_id))
 
     return events_per_tel_dict
 
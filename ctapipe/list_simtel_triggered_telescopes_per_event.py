@@ -6,7 +6,8 @@ Print the list triggered telescopes per event of the given simtel file.
 """
 
 import argparse
-from ctapipe.io.hessio import hessio_event_source
+
+import simtel_index
 
 
 def list_simtel_triggered_telescopes_per_event(simtel_file_path):
@@ -24,12 +25,12 @@ def list_simtel_triggered_telescopes_per_event(simtel_file_path):
     file (for each item: key=event id, value=the list of triggered telescopes).
     """
 
-    source = hessio_event_source(simtel_file_path, allowed_tels=None, max_events=None)
-
     tels_per_event_dict = {}   # List of events per telescope
 
-    for event in source:
-        tels_per_event_dict[int(event.dl0.event_id)] = [int(tel) for tel in event.trig.tels_with_trigger]
+    # simtel_index.iter_triggers only reads the central trigger block of each
+    # event (telescope data are not decoded).
+    for event_id, tels_with_trigger in simtel_index.iter_triggers(simtel_file_path):
+        tels_per_event_dict[int(event_id)] = [int(tel) for tel in tels_with_trigger]
 
     return tels_per_event_dict
 
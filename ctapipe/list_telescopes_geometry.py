@@ -2,8 +2,12 @@
 # -*- coding: utf-8 -*-
 
 """
-Print the list of triggered telescopes ID and geometry of the given simtel
-file.
+Print the list of telescopes ID and geometry of the given simtel file and
+export it in ``<simtel_file>.cameras_geometry.json``
+(``{tel_id: [cam_id, pix_type]}``).
+
+The telescopes are read from the instrument description of the simtel file
+(events are not read) and classified once (see telescope_registry.py).
 
 Example of output:
 
@@ -27,38 +31,32 @@ Example of output:
 import argparse
 import json
 
-import ctapipe
-from ctapipe.io.hessio import hessio_event_source
-
-from ctapipe.instrument import camera
+import telescope_registry
 
 
 def list_telescopes_geometry(simtel_file_path):
-    """Print the list of triggered telescopes ID and geometry of the
+    """Print the list of telescopes ID and geometry of the
     'simtel_file_path' file.
 
+    The geometry of the telescopes is read from the telescope registry of
+    the simtel file (``<simtel_file>.telescope_registry.json``, see
+    telescope_registry.py), which is built on the first call.
+
     Parameters
     ----------
     simtel_file_path : str
         The path of the simtel file to process.
     """
 
-    source = hessio_event_source(simtel_file_path)
-
-    tel_id_set = set()
-
-    for event in source:
-        for tel_id in event.dl0.tels_with_data:
-            tel_id_set.add(int(tel_id))
+    registry = telescope_registry.load_registry(simtel_file_path)
 
     tel_geometry_dict = {}
 
-    for tel_id in tel_id_set:
-        x, y = event.inst.pixel_pos[tel_id]
-        foclen = event.inst.optical_foclen[tel_id]
-        geom = camera.CameraGeometry.guess(x, y, foclen)
-        tel_geometry_dict[tel_id] = [geom.cam_id, geom.pix_type]
-        print("Telescope {:03d}: {} ({} pixels)".format(tel_id, geom.cam_id, geom.pix_type))
+    for tel_id in sorted(registry):
+        cam_id = registry[tel_id]["camera_id"]
+        pix_type = registry[tel_id]["pixel_type"]
+        tel_geometry_dict[tel_id] = [cam_id, pix_type]
+        print("Telescope {:03d}: {} ({} pixels)".format(tel_id, cam_id, pix_type))
 
     return tel_geometry_dict
 
@@ -68,7 +66,7 @@ def main():
 
     # PARSE OPTIONS ###########################################################
 
-    desc = "Print the list of triggered telescopes ID and geometry of the given simtel file."
+    desc = "Print the list of telescopes ID and geometry of the given simtel file."
     parser = argparse.ArgumentParser(description=desc)
 
     parser.add_argument("fileargs", nargs=1, metavar="FILE",
@@ -82,9 +80,6 @@ def main():
 
     tel_geometry_dict = list_telescopes_geometry(simtel_file_path)
 
-    #for tel_id, (cam_id, pix_type) in tel_geometry_dict.items():
-    #    print("Telescope {:03d}: {} ({} pixels)".format(tel_id, cam_id, pix_type))
-
     # EXPORT CAMERAS GEOMETRY #############################
 
     output_file_path = simtel_file_path + ".cameras_geometry.json"
@@ -0,0 +1,552 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Basic calibration of dual-channel (high gain / low gain) MC images.
+
+Each pixel is calibrated with its high gain channel unless the high gain ADC
+value reaches the threshold (the channel saturates), in which case the low
+gain channel is used:
+
+    calibrated = (adc[0] - pedestal[0]) * gain[0]    if adc[0] < threshold
+                 (adc[1] - pedestal[1]) * gain[1]    otherwise
+
+The switch is computed with Numpy on whole images (or on stacks of images)
+and gives exactly the same values as a pixel per pixel computation.
+
+All the images of a telescope can also be calibrated in batches
+(``calibrate_stack()`` and ``calibrate_telescope_images()``): a 3D stack of
+ADC images (image x channel x pixel) is calibrated with broadcast operations
+into a preallocated (image x pixel) output buffer, optionally in float32.
+
+Pedestals and gains are constant within a run: they are read from pyhessio
+once per (run, telescope) and kept in a cache as read-only arrays. The cache
+is emptied when the source moves to a new run (i.e. when a new run key is
+given to ``get_mc_calibration_coeffs()``) or to a new simtel file (see
+``clear_cache()``).
+
+Images that are cropped after calibration (see image_crop.py) can be
+calibrated and cropped in one pass with a ``CropCalibrator``: only the pixels
+of the crop are calibrated and they are written directly in a caller supplied
+buffer (e.g. a slice of a preallocated cube), without per-image allocation.
+"""
+
+import numpy as np
+
+import image_crop
+import waveform
+
+DEFAULT_ADC_THRESHOLD = 3500.
+
+HIGH_GAIN = 0
+LOW_GAIN = 1
+
+_coeffs_cache = {}          # Calibration coefficients of the current run (key=telescope ID)
+_coeffs_cache_run_key = None
+_coeffs_cache_stats = {"hits": 0, "misses": 0}
+
+
+def get_run_key(event):
+    """Return the run key of 'event' (to be given to
+    ``get_mc_calibration_coeffs()``)."""
+    return int(event.dl0.run_id)
+
+
+def clear_cache():
+    """Empty the calibration coefficients cache.
+
+    This should be called each time a new simtel file is opened (two files
+    may contain the same run number)."""
+    global _coeffs_cache_run_key
+    _coeffs_cache.clear()
+    _coeffs_cache_run_key = None
+
+
+def get_mc_calibration_coeffs(tel_id, run_key=None):
+    """
+    Get the calibration coefficients of a telescope from the MC data file
+    currently read by pyhessio.
+
+    Parameters
+    ----------
+    tel_id : int
+        The ID of the telescope.
+    run_key : hashable
+        The run the current event belongs to (see ``get_run_key()``). The
+        coefficients are read from pyhessio on the first call for a given
+        (run_key, tel_id) and then taken from the cache. If None, the cache
+        is not used.
+
+    Returns
+    -------
+    tuple of Numpy array
+        The pedestal and the PE/DC ratios of each channel and pixel (2D
+        read-only arrays: channel x pixel).
+    """
+    global _coeffs_cache_run_key
+
+    if run_key is not None:
+        if run_key != _coeffs_cache_run_key:
+            clear_cache()
+            _coeffs_cache_run_key = run_key
+
+        if tel_id in _coeffs_cache:
+            _coeffs_cache_stats["hits"] += 1
+            return _coeffs_cache[tel_id]
+
+    _coeffs_cache_stats["misses"] += 1
+
+    # pyhessio (and ctapipe, see event_selection.py) are only imported by the
+    # functions that read simtel files: the calibration of arrays doesn't
+    # need them
+    import pyhessio
+
+    pedestal = np.array(pyhessio.get_pedestal(tel_id))
+    gains = np.array(pyhessio.get_calibration(tel_id))
+
+    # The same arrays are given to all callers
+    pedestal.setflags(write=False)
+    gains.setflags(write=False)
+
+    if run_key is not None:
+        _coeffs_cache[tel_id] = (pedestal, gains)
+
+    return pedestal, gains
+
+
+def get_cache_stats():
+    """Return the number of hits and misses of the calibration coefficients
+    cache."""
+    return _coeffs_cache_stats["hits"], _coeffs_cache_stats["misses"]
+
+
+def format_cache_stats():
+    """Return a string describing the hit rate of the calibration
+    coefficients cache."""
+    hits, misses = get_cache_stats()
+    num_calls = hits + misses
+    hit_rate = 100. * hits / num_calls if num_calls > 0 else 0.
+    return "Calibration cache: {:.1f}% hits ({}/{})".format(hit_rate, hits, num_calls)
+
+
+def get_adc_sums(event, tel_id):
+    """
+    Return the (channel x pixel) ADC array of the telescope 'tel_id' for the
+    (already read) 'event'.
+    """
+
+    adc_sums = event.dl0.tel[tel_id].adc_sums
+
+    if isinstance(adc_sums, dict):
+        return np.stack([adc_sums[channel] for channel in sorted(adc_sums)])
+
+    return np.asarray(adc_sums)
+
+
+def apply_channel_calibration(adcs, tel_id, run_key=None, channel=HIGH_GAIN):
+    """
+    Calibrate one channel of an image (without gain switch).
+
+    Parameters
+    ----------
+    adcs : Numpy array
+        The uncalibrated ADC signal of the channel: the ADC sums (1D array:
+        pixel) or the ADC samples (2D array: pixel x sample).
+    tel_id : int
+        The ID of the telescope.
+    run_key : hashable
+        The run of the event (see ``get_mc_calibration_coeffs()``).
+    channel : int
+        The channel of 'adcs'.
+
+    Returns
+    -------
+    Numpy array
+        The calibrated image (same shape as 'adcs').
+    """
+
+    pedestals, gains = get_mc_calibration_coeffs(tel_id, run_key)
+
+    adcs = np.asarray(adcs)
+
+    if adcs.ndim > 1:
+        # The pedestal is integrated over all the samples of the readout
+        return waveform.subtract_pedestal(adcs, pedestals[channel]) * gains[channel][:, np.newaxis]
+
+    return (adcs - pedestals[channel]) * gains[channel]
+
+
+def apply_gain_switch(adcs, pedestals, gains, adc_threshold=DEFAULT_ADC_THRESHOLD):
+    """
+    Calibrate dual-channel images.
+
+    Parameters
+    ----------
+    adcs : Numpy array
+        The uncalibrated ADC signal: one image (2D array: channel x pixel) or
+        a stack of images (3D array: image x channel x pixel).
+    pedestals : Numpy array
+        The pedestal of each channel and pixel (2D array: channel x pixel).
+    gains : Numpy array
+        The PE/DC ratios of each channel and pixel (2D array: channel x
+        pixel).
+    adc_threshold : float or Numpy array
+        The high gain ADC value from which the low gain channel is used (a
+        single value or one value per pixel).
+
+    Returns
+    -------
+    Numpy array
+        The calibrated image (1D array: pixel) or the stack of calibrated
+        images (2D array: image x pixel).
+    """
+
+    adcs = np.asarray(adcs)
+    pedestals = np.asarray(pedestals)
+    gains = np.asarray(gains)
+
+    if adcs.ndim not in (2, 3) or adcs.shape[-2] < 2:
+        raise ValueError("The ADC array should be a (2, num_pixels) or a (num_images, 2, num_pixels) array.")
+
+    high_gain_adcs = adcs[..., HIGH_GAIN, :]
+    low_gain_adcs = adcs[..., LOW_GAIN, :]
+
+    high_gain_image = (high_gain_adcs - pedestals[HIGH_GAIN]) * gains[HIGH_GAIN]
+    low_gain_image = (low_gain_adcs - pedestals[LOW_GAIN]) * gains[LOW_GAIN]
+
+    return np.where(high_gain_adcs < adc_threshold, high_gain_image, low_gain_image)
+
+
+def calibrate_stack(adcs, pedestals, gains, adc_threshold=DEFAULT_ADC_THRESHOLD, out=None, dtype=None):
+    """
+    Calibrate a stack of images of the same telescope in one pass.
+
+    With the default 'dtype', the result is the same as the one of
+    ``apply_gain_switch()``. Single channel images are calibrated without
+    gain switch.
+
+    Parameters
+    ----------
+    adcs : Numpy array
+        The uncalibrated ADC images (3D array: image x channel x pixel).
+    pedestals : Numpy array
+        The pedestal of each channel and pixel (2D array: channel x pixel).
+    gains : Numpy array
+        The PE/DC ratios of each channel and pixel (2D array: channel x
+        pixel).
+    adc_threshold : float or Numpy array
+        The high gain ADC value from which the low gain channel is used (a
+        single value or one value per pixel).
+    out : Numpy array
+        The (image x pixel) array where the calibrated images are written (a
+        new array is made if None).
+    dtype : Numpy dtype
+        The type of the calibrated images (e.g. ``np.float32``); the type of
+        'out' if it is given, otherwise the type ``apply_gain_switch()``
+        would return. The computation is made in this type.
+
+    Returns
+    -------
+    Numpy array
+        The calibrated images (2D array: image x pixel), i.e. 'out' if it is
+        given.
+    """
+
+    adcs = np.asarray(adcs)
+    pedestals = np.asarray(pedestals)
+    gains = np.asarray(gains)
+
+    if adcs.ndim != 3:
+        raise ValueError("The ADC array should be a (num_images, num_channels, num_pixels) array.")
+
+    if dtype is None:
+        if out is not None:
+            dtype = out.dtype
+        else:
+            dtype = np.result_type(adcs.dtype, pedestals.dtype, gains.dtype)
+
+    shape = (adcs.shape[0], adcs.shape[2])
+
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    elif (out.shape != shape) or (out.dtype != dtype):
+        raise ValueError("The output array should be a {} array of {}.".format(shape, np.dtype(dtype)))
+
+    pedestals = pedestals.astype(dtype, copy=False)
+    gains = gains.astype(dtype, copy=False)
+
+    high_gain_adcs = adcs[:, HIGH_GAIN, :]
+
+    np.subtract(high_gain_adcs, pedestals[HIGH_GAIN], out=out)
+    np.multiply(out, gains[HIGH_GAIN], out=out)
+
+    if adcs.shape[1] > 1:
+        # Saturated pixels are rare: the low gain channel is only computed
+        # where it is used
+        image_index, pixel_index = np.nonzero(high_gain_adcs >= adc_threshold)
+
+        if len(image_index) > 0:
+            low_gain_adcs = adcs[image_index, LOW_GAIN, pixel_index]
+            out[image_index, pixel_index] = (low_gain_adcs - pedestals[LOW_GAIN, pixel_index]) * gains[LOW_GAIN, pixel_index]
+
+    return out
+
+
+class CropCalibrator(object):
+    """
+    Calibrate (with the gain switch of ``apply_gain_switch()``) and crop
+    images in one pass.
+
+    The ADC channels are gathered with the grid map index and calibrated
+    directly into the output buffer; the coefficients of the cropped pixels
+    are computed once per run (i.e. each time new coefficients arrays are
+    given). The result is exactly the one of ``apply_gain_switch()``
+    followed by ``grid_map.crop()``.
+
+    Parameters
+    ----------
+    grid_map : image_crop.GridMap
+        The crop (e.g. ``image_crop.ASTRI_GRID_MAP`` or the grid map returned
+        by ``image_crop.get_grid_map()``).
+    fill_value : float
+        The value of the grid cells without pixel.
+    """
+
+    def __init__(self, grid_map=image_crop.ASTRI_GRID_MAP, fill_value=0):
+        self.grid_map = grid_map
+        self.fill_value = fill_value
+
+        self._index = grid_map.take_index
+        self._mask = grid_map.mask.ravel()
+        self._has_mask = bool(self._mask.any())
+
+        self._buffers = {}          # Scratch buffers (key=dtype)
+        self._saturated = np.empty(len(self._index), dtype=bool)
+
+        self._coeffs = None         # The (pedestals, gains) arrays of the current run
+        self._cropped_coeffs = None
+
+        self._threshold = None      # The current per-pixel threshold array
+        self._cropped_threshold = None
+
+    def _get_buffer(self, dtype):
+        """Return the scratch buffer of type 'dtype' (one value per grid
+        cell)."""
+        dtype = np.dtype(dtype)
+        if dtype not in self._buffers:
+            self._buffers[dtype] = np.empty(len(self._index), dtype=dtype)
+        return self._buffers[dtype]
+
+    def _get_flat_out(self, out):
+        if (out.shape != self.grid_map.shape) or not out.flags.c_contiguous:
+            raise ValueError("The output array should be a contiguous {} array.".format(self.grid_map.shape))
+        return out.reshape(-1)
+
+    def _get_cropped_coeffs(self, pedestals, gains):
+        if (self._coeffs is None) or (self._coeffs[0] is not pedestals) or (self._coeffs[1] is not gains):
+            self._coeffs = (pedestals, gains)
+            self._cropped_coeffs = (np.take(pedestals, self._index, axis=-1),
+                                    np.take(gains, self._index, axis=-1))
+        return self._cropped_coeffs
+
+    def _get_cropped_threshold(self, adc_threshold):
+        if np.ndim(adc_threshold) == 0:
+            return adc_threshold
+        if self._threshold is not adc_threshold:
+            self._threshold = adc_threshold
+            self._cropped_threshold = np.take(adc_threshold, self._index)
+        return self._cropped_threshold
+
+    def crop(self, image, out):
+        """
+        Crop the camera image 'image' (1D array, e.g. a photoelectron image)
+        into 'out' (a grid shaped array).
+
+        Returns
+        -------
+        Numpy array
+            'out'.
+        """
+
+        image = np.asarray(image)
+        flat_out = self._get_flat_out(out)
+
+        if flat_out.dtype == image.dtype:
+            np.take(image, self._index, out=flat_out)
+        else:
+            buffer = self._get_buffer(image.dtype)
+            np.take(image, self._index, out=buffer)
+            flat_out[...] = buffer
+
+        if self._has_mask:
+            flat_out[self._mask] = self.fill_value
+
+        return out
+
+    def calibrate(self, adcs, pedestals, gains, out, adc_threshold=DEFAULT_ADC_THRESHOLD):
+        """
+        Calibrate and crop one image into 'out'.
+
+        Parameters
+        ----------
+        adcs : sequence of Numpy array
+            The uncalibrated ADC signal of each channel (e.g.
+            ``event.dl0.tel[tel_id].adc_sums``: the channels are not stacked).
+        pedestals : Numpy array
+            The pedestal of each channel and pixel (2D array: channel x pixel).
+        gains : Numpy array
+            The PE/DC ratios of each channel and pixel (2D array: channel x
+            pixel).
+        out : Numpy array
+            The (grid shaped) array where the calibrated and cropped image is
+            written.
+        adc_threshold : float or Numpy array
+            The high gain ADC value from which the low gain channel is used (a
+            single value or one value per pixel of the camera).
+
+        Returns
+        -------
+        Numpy array
+            'out'.
+        """
+
+        flat_out = self._get_flat_out(out)
+        cropped_pedestals, cropped_gains = self._get_cropped_coeffs(pedestals, gains)
+
+        high_gain_adcs = np.asarray(adcs[HIGH_GAIN])
+        buffer = self._get_buffer(high_gain_adcs.dtype)
+        np.take(high_gain_adcs, self._index, out=buffer)
+
+        np.subtract(buffer, cropped_pedestals[HIGH_GAIN], out=flat_out)
+        np.multiply(flat_out, cropped_gains[HIGH_GAIN], out=flat_out)
+
+        if len(adcs) > 1:
+            np.greater_equal(buffer, self._get_cropped_threshold(adc_threshold), out=self._saturated)
+
+            # Saturated pixels are rare: the low gain channel is only read
+            # where it is used
+            if self._saturated.any():
+                cells = np.flatnonzero(self._saturated)
+                low_gain_adcs = np.asarray(adcs[LOW_GAIN])[self._index[cells]]
+                flat_out[cells] = (low_gain_adcs - cropped_pedestals[LOW_GAIN, cells]) * cropped_gains[LOW_GAIN, cells]
+
+        if self._has_mask:
+            flat_out[self._mask] = self.fill_value
+
+        return out
+
+
+def iter_adc_stacks(simtel_file_path, tel_id, chunk_size=None, selection=None):
+    """
+    Iterate over the ADC images of one telescope of a simtel file, by chunks.
+
+    Parameters
+    ----------
+    simtel_file_path : str
+        The path of the simtel file to read.
+    tel_id : int
+        The ID of the telescope.
+    chunk_size : int
+        The maximum number of images of each chunk (all the images are in one
+        chunk if None).
+    selection : event_selection.EventSelection
+        The events to read (all events if None).
+
+    Yields
+    ------
+    tuple
+        The event IDs (1D array), the ADC images (3D array: image x channel x
+        pixel), the pedestals and the gains (2D arrays: channel x pixel) of
+        each chunk.
+    """
+
+    import event_selection
+
+    clear_cache()
+
+    event_id_list = []
+    adcs_list = []
+
+    for event in event_selection.iter_selected_events(simtel_file_path, selection, allowed_tels=[tel_id]):
+
+        if tel_id not in event.dl0.tels_with_data:
+            continue
+
+        # The coefficients are the ones of the simtel file currently read by
+        # pyhessio: get them while the file is open (a simtel file contains
+        # one run)
+        pedestals, gains = get_mc_calibration_coeffs(tel_id, get_run_key(event))
+
+        event_id_list.append(int(event.dl0.event_id))
+        adcs_list.append(get_adc_sums(event, tel_id))
+
+        if (chunk_size is not None) and (len(event_id_list) == chunk_size):
+            yield np.array(event_id_list), np.array(adcs_list), pedestals, gains
+            event_id_list = []
+            adcs_list = []
+
+    if len(event_id_list) > 0:
+        yield np.array(event_id_list), np.array(adcs_list), pedestals, gains
+
+
+def calibrate_telescope_images(simtel_file_path,
+                               tel_id,
+                               adc_threshold=DEFAULT_ADC_THRESHOLD,
+                               dtype=np.float32,
+                               chunk_size=1000,
+                               selection=None):
+    """
+    Calibrate all the images of one telescope of a simtel file.
+
+    The output buffer is allocated once (its size is given by the event index
+    of the simtel file) and each chunk of 'chunk_size' images is calibrated
+    in it with ``calibrate_stack()``.
+
+    Parameters
+    ----------
+    simtel_file_path : str
+        The path of the simtel file to read.
+    tel_id : int
+        The ID of the telescope.
+    adc_threshold : float or Numpy array
+        The high gain ADC value from which the low gain channel is used.
+    dtype : Numpy dtype
+        The type of the calibrated images.
+    chunk_size : int
+        The number of images read and calibrated at once.
+    selection : event_selection.EventSelection
+        The events to read (all events if None).
+
+    Returns
+    -------
+    tuple of Numpy array
+        The event IDs (1D array) and the calibrated images (2D array: image x
+        pixel).
+    """
+
+    import event_selection
+
+    num_images = sum(1 for entry in event_selection.select_entries(simtel_file_path, selection)
+                     if tel_id in entry["tels_with_trigger"])
+
+    event_ids = np.empty(num_images, dtype=np.int64)
+    images = None
+    start = 0
+
+    for chunk_event_ids, adcs, pedestals, gains in iter_adc_stacks(simtel_file_path, tel_id, chunk_size, selection):
+        if images is None:
+            images = np.empty((num_images, adcs.shape[2]), dtype=dtype)
+
+        stop = start + len(chunk_event_ids)
+
+        if stop > num_images:
+            raise ValueError("{}: telescope {} has more images than the {} given by the event index (the index may be outdated).".format(simtel_file_path, tel_id, num_images))
+
+        event_ids[start:stop] = chunk_event_ids
+        calibrate_stack(adcs, pedestals, gains, adc_threshold, out=images[start:stop])
+        start = stop
+
+    if images is None:
+        images = np.empty((0, 0), dtype=dtype)
+
+    return event_ids[:start], images[:start]
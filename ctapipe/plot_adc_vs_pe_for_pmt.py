@@ -10,14 +10,15 @@ import argparse
 
 import ctapipe
 import ctapipe.visualization
-from ctapipe.io.hessio import hessio_event_source
 
 import numpy as np
 from matplotlib import pyplot as plt
 from matplotlib.colors import LogNorm
 
+import event_selection
 
-def plot_data(simtel_file_path_list, output_file_path, tel_num, pmt_id, channel=0, quiet=False):
+
+def plot_data(simtel_file_path_list, output_file_path, tel_num, pmt_id, channel=0, quiet=False, selection=None):
 
     adc_list = []
     pe_list = []
@@ -28,14 +29,14 @@ def plot_data(simtel_file_path_list, output_file_path, tel_num, pmt_id, channel=
 
         # GET EVENT #############################################################
 
-        # hessio_event_source returns a Python generator that streams data from an
-        # EventIO/HESSIO MC data file (e.g. a standard CTA data file).
-        # This generator contains ctapipe.core.Container instances ("event").
-        # 
+        # Only the events that match the selection predicates are decoded
+        # (see event_selection.py).
+        #
         # Parameters:
-        # - max_events: maximum number of events to read
         # - allowed_tels: select only a subset of telescope, if None, all are read.
-        source = hessio_event_source(simtel_file_path, allowed_tels=[tel_num])
+        source = event_selection.iter_selected_events(simtel_file_path,
+                                                      selection=selection,
+                                                      allowed_tels=[tel_num])
 
         for event in source:
             # Get ADC image
@@ -96,6 +97,8 @@ if __name__ == '__main__':
                         metavar="FILE",
                         help="The output file path")
 
+    event_selection.add_selection_arguments(parser)
+
     parser.add_argument("fileargs", nargs='+', metavar="FILES",
                         help="The simtel files to process")
 
@@ -106,6 +109,7 @@ if __name__ == '__main__':
     channel = args.channel
     quiet = args.quiet
     simtel_file_path_list = args.fileargs
+    selection = event_selection.get_selection(args)
 
     if args.output is None:
         output_file_path = "TEL{:03d}_PMT{}_CH{}_ADC_vs_PE.png".format(tel_num, pmt_id, channel)
@@ -114,5 +118,5 @@ if __name__ == '__main__':
 
     # DISPLAY IMAGES ##########################################################
 
-    plot_data(simtel_file_path_list, output_file_path, tel_num, pmt_id, channel, quiet)
+    plot_data(simtel_file_path_list, output_file_path, tel_num, pmt_id, channel, quiet, selection)
 
@@ -9,9 +9,13 @@ then
     exit 1
 fi
 
+# Read the calibration of all telescopes once (see calibration_table.py)
+CALIBRATION_FILE="${SIMTEL_FILE}.calibration.npz"
+./calibration_table.py -o "${CALIBRATION_FILE}" "${SIMTEL_FILE}" || exit 1
+
 for TELID in $(seq 1 125)
 do
     echo "$TELID"
-    ./plot_telescope_pedestal.py -t $TELID -q "${SIMTEL_FILE}" 2> /dev/null
-    ./plot_telescope_gain.py -t $TELID -q "${SIMTEL_FILE}" 2> /dev/null
+    ./plot_telescope_pedestal.py -t $TELID -q "${CALIBRATION_FILE}" 2> /dev/null
+    ./plot_telescope_gain.py -t $TELID -q "${CALIBRATION_FILE}" 2> /dev/null
 done
@@ -11,70 +11,36 @@ import argparse
 
 import ctapipe
 import ctapipe.visualization
-from ctapipe.io.hessio import hessio_event_source
-import pyhessio
 
 from matplotlib import pyplot as plt
 
-def get_mc_calibration_coeffs(tel_id):
-    """
-    Get the calibration coefficients from the MC data file to the
-    data. This is ahack (until we have a real data structure for the
-    calibrated data), it should move into `ctapipe.io.hessio_event_source`.
-
-    RETURNS
-    -------
-    (pedestal, gains) : arrays of the pedestal and pe/dc ratios.
-    """
-    pedestal = pyhessio.get_pedestal(tel_id)[0]
-    gains = pyhessio.get_calibration(tel_id)[0]
-
-    return pedestal, gains
-
-
-def apply_mc_calibration(adcs, tel_id):
-    """
-    Apply basic calibration
-    """
-    peds, gains = get_mc_calibration_coeffs(tel_id)
-
-    if adcs.ndim > 1:  # if it's per-sample need to correct the peds
-        # TODO ???
-        calibrated_image = ((adcs - peds[:, np.newaxis] / adcs.shape[1]) * gains[:, np.newaxis])
-    else:
-        calibrated_image = (adcs - peds) * gains
-
-    return calibrated_image
-
+import mc_calibration
+import simtel_index
+import telescope_registry
 
 def show_image(simtel_file_path, output_file_path, tel_num, event_id, channel=0, quiet=False):
 
     # GET EVENT #############################################################
 
-    # hessio_event_source returns a Python generator that streams data from an
-    # EventIO/HESSIO MC data file (e.g. a standard CTA data file).
-    # This generator contains ctapipe.core.Container instances ("event").
-    # 
-    # Parameters:
-    # - max_events: maximum number of events to read
-    # - allowed_tels: select only a subset of telescope, if None, all are read.
-    source = hessio_event_source(simtel_file_path, allowed_tels=[tel_num])
-
-    event = None
-
-    for ev in source:
-        if int(ev.dl0.event_id) == event_id:
-            event = ev
-            break
+    # The event is read through the simtel file's event index (see
+    # simtel_index.py): the events before it are not decoded.
+    event = simtel_index.get_event(simtel_file_path, event_id, allowed_tels=[tel_num])
 
     if event is None:
         raise Exception("Error: event '{}' not found for telescope '{}'.".format(event_id, tel_num))
 
+    plot_event_calibrated_image(event, output_file_path, tel_num, event_id, channel, quiet)
+
+
+def plot_event_calibrated_image(event, output_file_path, tel_num, event_id, channel=0, quiet=False):
+    """
+    Plot the calibrated image of the telescope 'tel_num' for the
+    (already read) 'event'.
+    """
+
     # INIT PLOT #############################################################
 
-    x, y = event.meta.pixel_pos[tel_num]
-    foclen = event.meta.optical_foclen[tel_num]
-    geom = ctapipe.io.CameraGeometry.guess(x, y, foclen)
+    geom = telescope_registry.get_event_camera_geometry(event, tel_num)
 
     disp = ctapipe.visualization.CameraDisplay(geom, title='CT%d' % tel_num)
     disp.enable_pixel_picker()
@@ -93,7 +59,7 @@ def show_image(simtel_file_path, output_file_path, tel_num, event_id, channel=0,
     # DISPLAY INTEGRATED EVENT ##############################################
 
     uncalibrated_image = event.dl0.tel[tel_num].adc_sums[channel]
-    calibrated_image = apply_mc_calibration(uncalibrated_image, tel_num)
+    calibrated_image = mc_calibration.apply_channel_calibration(uncalibrated_image, tel_num, mc_calibration.get_run_key(event), channel)
 
     # The image "event.dl0.tel[tel_num].adc_sums[channel]" is a 1D numpy array (dtype=int32)
     disp.image = calibrated_image
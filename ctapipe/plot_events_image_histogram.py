@@ -11,10 +11,11 @@ import argparse
 import sys
 
 import ctapipe
-from ctapipe.io.hessio import hessio_event_source
 
 from matplotlib import pyplot as plt
 
+import simtel_index
+
 
 # histogram types : [‘bar’ | ‘barstacked’ | ‘step’ | ‘stepfilled’]
 HISTOGRAM_TYPE = 'bar'
@@ -23,26 +24,23 @@ def show_image_histogram(simtel_file_path, output_file_path, tel_num, event_id,
 
     # GET EVENT #############################################################
 
-    # hessio_event_source returns a Python generator that streams data from an
-    # EventIO/HESSIO MC data file (e.g. a standard CTA data file).
-    # This generator contains ctapipe.core.Container instances ("event").
-    # 
-    # Parameters:
-    # - max_events: maximum number of events to read
-    # - allowed_tels: select only a subset of telescope, if None, all are read.
-    source = hessio_event_source(simtel_file_path, allowed_tels=[tel_num])
-
-    event = None
-
-    for ev in source:
-        if int(ev.dl0.event_id) == event_id:
-            event = ev
-            break
+    # The event is read through the simtel file's event index (see
+    # simtel_index.py): the events before it are not decoded.
+    event = simtel_index.get_event(simtel_file_path, event_id, allowed_tels=[tel_num])
 
     if event is None:
         print("Error: event '{}' not found for telescope '{}'.".format(event_id, tel_num))
         sys.exit(1)
 
+    plot_event_image_histogram(event, output_file_path, tel_num, event_id, channel, quiet)
+
+
+def plot_event_image_histogram(event, output_file_path, tel_num, event_id, channel=0, quiet=False):
+    """
+    Plot the histogram of the ADC image of the telescope 'tel_num' for the
+    (already read) 'event'.
+    """
+
     # GET TIME-VARYING EVENT ##################################################
 
     #data = event.dl0.tel[tel_num].adc_samples[channel]
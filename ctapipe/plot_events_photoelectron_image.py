@@ -11,39 +11,36 @@ import argparse
 
 import ctapipe
 import ctapipe.visualization
-from ctapipe.io.hessio import hessio_event_source
 
 from matplotlib import pyplot as plt
 
+import simtel_index
+import telescope_registry
+
 
 def show_photoelectron_image(simtel_file_path, output_file_path, tel_num, event_id, channel=0, quiet=False):
 
     # GET EVENT #############################################################
 
-    # hessio_event_source returns a Python generator that streams data from an
-    # EventIO/HESSIO MC data file (e.g. a standard CTA data file).
-    # This generator contains ctapipe.core.Container instances ("event").
-    # 
-    # Parameters:
-    # - max_events: maximum number of events to read
-    # - allowed_tels: select only a subset of telescope, if None, all are read.
-    source = hessio_event_source(simtel_file_path, allowed_tels=[tel_num])
-
-    event = None
-
-    for ev in source:
-        if int(ev.dl0.event_id) == event_id:
-            event = ev
-            break
+    # The event is read through the simtel file's event index (see
+    # simtel_index.py): the events before it are not decoded.
+    event = simtel_index.get_event(simtel_file_path, event_id, allowed_tels=[tel_num])
 
     if event is None:
         raise Exception("Error: event '{}' not found for telescope '{}'.".format(event_id, tel_num))
 
+    plot_event_photoelectron_image(event, output_file_path, tel_num, event_id, channel, quiet)
+
+
+def plot_event_photoelectron_image(event, output_file_path, tel_num, event_id, channel=0, quiet=False):
+    """
+    Plot the photoelectron image of the telescope 'tel_num' for the
+    (already read) 'event'.
+    """
+
     # INIT PLOT #############################################################
 
-    x, y = event.meta.pixel_pos[tel_num]
-    foclen = event.meta.optical_foclen[tel_num]
-    geom = ctapipe.io.CameraGeometry.guess(x, y, foclen)
+    geom = telescope_registry.get_event_camera_geometry(event, tel_num)
 
     disp = ctapipe.visualization.CameraDisplay(geom, title='CT%d' % tel_num)
     disp.enable_pixel_picker()
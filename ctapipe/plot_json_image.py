@@ -6,30 +6,27 @@ Display statistics about camera images.
 """
 
 import argparse
-import astropy
 
 import ctapipe
 import ctapipe.io
 import ctapipe.visualization
 
-import json
-
 from matplotlib import pyplot as plt
 import numpy as np
 
+import geometry_cache
+import image_io
+
 
 def plot_json_image(json_file_path, output_file_path=None, plot_photoelectron=False, quiet=False, plot_title=None):
 
-    with open(json_file_path, "r") as fd:
-        image_dict = json.load(fd)
+    # JSON or binary (".npz") file, see image_io.py
+    image_dict = image_io.load_image_dict(json_file_path)
 
     # GET THE TELESCOPE'S GEOMETRY ##########################################
 
-    x = astropy.units.quantity.Quantity(image_dict['pixel_pos_x']) * astropy.units.m
-    y = astropy.units.quantity.Quantity(image_dict['pixel_pos_y']) * astropy.units.m
-    foclen = image_dict['foclen'] * astropy.units.m
-
-    geom = ctapipe.io.CameraGeometry.guess(x, y, foclen)
+    # The geometry is resolved once per camera layout (see geometry_cache.py)
+    geom = geometry_cache.get_image_geometry(image_dict)
 
     # GET IMAGE #############################################################
 
@@ -76,7 +73,7 @@ if __name__ == '__main__':
 
     # PARSE OPTIONS ###########################################################
 
-    desc = "Display simulated camera images from a JSON file."
+    desc = "Display simulated camera images from a JSON file (or a binary '.npz' file)."
     parser = argparse.ArgumentParser(description=desc)
 
     parser.add_argument("--quiet", "-q", action="store_true",
@@ -91,10 +88,10 @@ if __name__ == '__main__':
 
     parser.add_argument("--output", "-o", default=None,
                         metavar="FILE",
-                        help="The output file path")
+                        help="The output file path (only if one JSON file is given)")
 
-    parser.add_argument("fileargs", nargs=1, metavar="FILE",
-                        help="The simtel file to process")
+    parser.add_argument("fileargs", nargs="+", metavar="FILE",
+                        help="The JSON (or binary) files to process")
 
     args = parser.parse_args()
 
@@ -103,9 +100,16 @@ if __name__ == '__main__':
     plot_title = args.title
     output_file_path = args.output
 
-    json_file_path = args.fileargs[0]
+    json_file_path_list = args.fileargs
+
+    if (output_file_path is not None) and (len(json_file_path_list) > 1):
+        parser.error("--output can only be used with one JSON file")
 
-    # DISPLAY IMAGE ###########################################################
+    # DISPLAY IMAGES ##########################################################
 
-    plot_json_image(json_file_path, output_file_path, plot_photoelectron, quiet, plot_title)
+    # The camera geometry of the images is built once per camera (see
+    # geometry_cache.py)
+    for json_file_path in json_file_path_list:
+        plot_json_image(json_file_path, output_file_path, plot_photoelectron, quiet, plot_title)
+        plt.close('all')
 
@@ -2,21 +2,23 @@
 # -*- coding: utf-8 -*-
 
 """
-Plot the mean of input images (stored in JSON files).
+Plot the mean of input images (stored in JSON or binary files, see
+image_io.py, or in a shard set, see image_shards.py).
 """
 
 import argparse
-import astropy
 
 import ctapipe
 import ctapipe.io
 import ctapipe.visualization
 
-import json
-
 import matplotlib.pyplot as plt
 import numpy as np
 
+import geometry_cache
+import image_io
+import image_shards
+
 def fetch_images(json_file_path_list):
 
     image_dict_list = []
@@ -24,9 +26,8 @@ def fetch_images(json_file_path_list):
     # For each json file...
     for json_file_path in json_file_path_list:
         print(json_file_path)
-        with open(json_file_path, "r") as fd:
-            image_dict = json.load(fd)
-            image_dict_list.append(image_dict)
+        image_dict = image_io.load_image_dict(json_file_path)    # JSON or binary file
+        image_dict_list.append(image_dict)
 
     return image_dict_list
 
@@ -35,7 +36,7 @@ if __name__ == '__main__':
 
     # PARSE OPTIONS ###########################################################
 
-    parser = argparse.ArgumentParser(description="Plot the mean of input images (stored in JSON files).")
+    parser = argparse.ArgumentParser(description="Plot the mean of input images (stored in JSON files or in a shard set).")
 
     parser.add_argument("--photoelectron", "-p", action="store_true",
                         help="Plot the photoelectron image")
@@ -48,7 +49,7 @@ if __name__ == '__main__':
                         help="Don't show the plot, just save it")
 
     parser.add_argument("fileargs", nargs="+", metavar="FILE",
-                        help="The JSON files to process")
+                        help="The JSON files (or the shard set directory) to process")
 
     args = parser.parse_args()
 
@@ -58,31 +59,42 @@ if __name__ == '__main__':
 
     json_file_path_list = args.fileargs
 
-    # FETCH IMAGES ############################################################
+    kind = "photoelectron_image" if process_photoelectron else "image"
 
-    image_dict_list = fetch_images(json_file_path_list)
+    if (len(json_file_path_list) == 1) and image_shards.is_shard_set(json_file_path_list[0]):
 
-    image_list = []
-    for image_dict in image_dict_list:
-        if process_photoelectron:
-            image_list.append(image_dict["photoelectron_image"])
-        else:
-            image_list.append(image_dict["image"])
+        # READ THE SHARD SET ##################################################
 
-    image_array = np.array(image_list)
+        # The mean is computed on the memory-mapped shards (the images are
+        # neither parsed nor copied)
+        shard_set = image_shards.ShardSet(json_file_path_list[0])
 
-    # MAKE STATISTICS #########################################################
+        image_mean = shard_set.mean(kind)
 
-    image_mean = np.mean(image_array, axis=0)
+        image_dict = shard_set.get_image_dict(0)
 
-    # GET THE TELESCOPE'S GEOMETRY ##########################################
+    else:
+
+        # FETCH IMAGES ########################################################
+
+        image_dict_list = fetch_images(json_file_path_list)
+
+        image_list = []
+        for image_dict in image_dict_list:
+            image_list.append(image_dict[kind])
 
-    image_dict = image_dict_list[0]
-    x = astropy.units.quantity.Quantity(image_dict['pixel_pos_x']) * astropy.units.m
-    y = astropy.units.quantity.Quantity(image_dict['pixel_pos_y']) * astropy.units.m
-    foclen = image_dict['foclen'] * astropy.units.m
+        image_array = np.array(image_list)
+
+        # MAKE STATISTICS #####################################################
+
+        image_mean = np.mean(image_array, axis=0)
+
+        image_dict = image_dict_list[0]
+
+    # GET THE TELESCOPE'S GEOMETRY ##########################################
 
-    geom = ctapipe.io.CameraGeometry.guess(x, y, foclen)
+    # The geometry is resolved once per camera layout (see geometry_cache.py)
+    geom = geometry_cache.get_image_geometry(image_dict)
 
     # INIT PLOT #############################################################
 
@@ -8,27 +8,20 @@ Display the pixel layout of the givent telescope as defined in a given simtel fi
 import argparse
 
 import ctapipe
-from ctapipe.io.hessio import hessio_event_source
 
 import numpy as np
 from matplotlib import pyplot as plt
 
+import simtel_instrument
 
-def plot_pixels_layout(simtel_file_path, tel_id):
 
-    source = hessio_event_source(simtel_file_path, allowed_tels=[tel_id])
+def plot_pixels_layout(simtel_file_path, tel_id):
 
-    for event in source:
-        #######################################################################
-        # CAUTION:                                                            #
-        # event.meta.optical_foclen and event.meta.tel_pos are only filled    #
-        # when source is traversed !                                          #
-        # The current value of these two variables is not the actual value    #
-        # for the current event but the cumulated value of past events !      #
-        #######################################################################
-        print("Event", event.dl0.event_id)
+    # The instrument description is read from the run header and camera
+    # settings blocks only (events are not read)
+    instrument = simtel_instrument.read_instrument(simtel_file_path)
 
-    (pos_x_list, pos_y_list) = event.meta.pixel_pos[tel_id]
+    (pos_x_list, pos_y_list) = instrument.pixel_pos[tel_id]
     pos_x_list = [float(pos.value) for pos in pos_x_list]
     pos_y_list = [float(pos.value) for pos in pos_y_list]
 
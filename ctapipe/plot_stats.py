@@ -2,7 +2,8 @@
 # -*- coding: utf-8 -*-
 
 """
-Make statistics on simtel images (stored in JSON files).
+Make statistics on simtel images (stored in JSON or binary files, see
+image_io.py, or in a shard set, see image_shards.py).
 """
 
 import argparse
@@ -12,11 +13,12 @@ import ctapipe
 import ctapipe.io
 import ctapipe.visualization
 
-import json
-
 import matplotlib.pyplot as plt
 import numpy as np
 
+import image_io
+import image_shards
+
 def fetch_images(json_file_path_list):
 
     image_dict_list = []
@@ -24,9 +26,8 @@ def fetch_images(json_file_path_list):
     # For each json file...
     for json_file_path in json_file_path_list:
         print(json_file_path)
-        with open(json_file_path, "r") as fd:
-            image_dict = json.load(fd)
-            image_dict_list.append(image_dict)
+        image_dict = image_io.load_image_dict(json_file_path)    # JSON or binary file
+        image_dict_list.append(image_dict)
 
     return image_dict_list
 
@@ -35,49 +36,68 @@ if __name__ == '__main__':
 
     # PARSE OPTIONS ###########################################################
 
-    parser = argparse.ArgumentParser(description="Make statistics on simtel images (stored in JSON files).")
+    parser = argparse.ArgumentParser(description="Make statistics on simtel images (stored in JSON files or in a shard set).")
 
     parser.add_argument("--photoelectron", "-p", action="store_true",
                         help="Plot the photoelectron image")
 
     parser.add_argument("fileargs", nargs="+", metavar="FILE",
-                        help="The JSON files to process")
+                        help="The JSON files (or the shard set directory) to process")
 
     args = parser.parse_args()
     process_photoelectron = args.photoelectron
     json_file_path_list = args.fileargs
 
-    # FETCH IMAGES ############################################################
+    kind = "photoelectron_image" if process_photoelectron else "image"
+
+    if (len(json_file_path_list) == 1) and image_shards.is_shard_set(json_file_path_list[0]):
+
+        # MAKE STATISTICS ON THE SHARD SET ####################################
+
+        # Statistics are accumulated shard by shard on the memory-mapped
+        # arrays. The median and the box plot need all the values of each
+        # pixel: the columns of the non-constant pixels of all the images are
+        # copied in memory (num_images x num_pixels values at most)
+        shard_set = image_shards.ShardSet(json_file_path_list[0])
+
+        img_min, img_max, img_mean, img_std = shard_set.stats(kind)
+
+        # Get pixels where variance != 0 (i.e. where min != max)
+        nonzero_pixels_mask = (img_min != img_max)
+        nonzero_pixels_index = np.nonzero(nonzero_pixels_mask)[0]
+        nonzero_image_array = shard_set.get_pixels(kind, nonzero_pixels_index)
+
+    else:
+
+        # FETCH IMAGES ########################################################
+
+        image_dict_list = fetch_images(json_file_path_list)
 
-    image_dict_list = fetch_images(json_file_path_list)
+        image_list = []
+        for image_dict in image_dict_list:
+            image_list.append(image_dict[kind])
 
-    image_list = []
-    for image_dict in image_dict_list:
-        if process_photoelectron:
-            image_list.append(image_dict["photoelectron_image"])
-        else:
-            image_list.append(image_dict["image"])
+        image_array = np.array(image_list)
 
-    image_array = np.array(image_list)
+        # MAKE STATISTICS #####################################################
 
-    # MAKE STATISTICS #########################################################
+        img_min = np.min(image_array, axis=0)
+        img_max = np.max(image_array, axis=0)
+        img_mean = np.mean(image_array, axis=0)
+        img_std = np.std(image_array, axis=0)
 
-    img_min = np.min(image_array, axis=0)
-    img_max = np.max(image_array, axis=0)
-    img_mean = np.mean(image_array, axis=0)
-    img_median = np.median(image_array, axis=0)
-    img_std = np.std(image_array, axis=0)
+        # Get pixels where variance != 0 (i.e. where min != max)
+        nonzero_pixels_mask = (img_min != img_max)
+        nonzero_pixels_index = np.nonzero(nonzero_pixels_mask)[0]
+        nonzero_image_array = image_array[:, nonzero_pixels_index]
 
-    # Get pixels where variance != 0 (i.e. where min != max)
-    nonzero_pixels_mask = (img_min != img_max)
-    nonzero_pixels_index = np.nonzero(nonzero_pixels_mask)[0]
-    nonzero_image_array = image_array[:, nonzero_pixels_index]
+    img_median = np.median(nonzero_image_array, axis=0)
 
     print("NON-ZERO IMAGES:", nonzero_image_array)
     print("NON-ZERO IMAGE MIN:", img_min[nonzero_pixels_index])
     print("NON-ZERO IMAGE MAX:", img_max[nonzero_pixels_index])
     print("NON-ZERO IMAGE MEAN:", img_mean[nonzero_pixels_index])
-    print("NON-ZERO IMAGE MEDIAN:", img_median[nonzero_pixels_index])
+    print("NON-ZERO IMAGE MEDIAN:", img_median)
     print("NON-ZERO IMAGE STD:", img_std[nonzero_pixels_index])
 
     # PLOT STATISTICS #########################################################
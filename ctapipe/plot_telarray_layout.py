@@ -8,53 +8,40 @@ Display the telarray layout defined in a given simtel file.
 import argparse
 
 import ctapipe
-from ctapipe.io.hessio import hessio_event_source
 
 import numpy as np
 from matplotlib import pyplot as plt
 
+import simtel_instrument
 
-def plot_telarray_layout(simtel_file_path, show_labels=False):
-
-    # GET EVENT ###############################################################
 
-    source = hessio_event_source(simtel_file_path)
+def plot_telarray_layout(simtel_file_path, show_labels=False):
 
-    for event in source:
-        #######################################################################
-        # WARNING:                                                            #
-        # event.meta.optical_foclen and event.meta.tel_pos are only filled    #
-        # when source is traversed !                                          #
-        # The current value of these two variables is not the actual value    #
-        # for the current event but the cumulated value of past events !      #
-        #######################################################################
+    # GET THE INSTRUMENT ######################################################
 
-        pass
-        #print("Event", event.dl0.event_id)
-        #print("tels_with_trigger", event.trig.tels_with_trigger)
-        #print("tels_with_data", event.dl0.tels_with_data)
-        #print("optical_foclen", event.meta.optical_foclen)
-        #print("tel_pos", event.meta.tel_pos)
+    # The instrument description is read from the run header and camera
+    # settings blocks only (events are not read)
+    instrument = simtel_instrument.read_instrument(simtel_file_path)
 
     # Print values
 
     print()
     print("optical_foclen:")
-    for telid, foclen in event.meta.optical_foclen.items():
+    for telid, foclen in instrument.optical_foclen.items():
         print(" - TEL {:03d}: {}".format(telid, foclen))
 
     print()
     print("tel_pos:")
-    for telid, position in event.meta.tel_pos.items():
+    for telid, position in instrument.tel_pos.items():
         print(" - TEL {:03d}: {}".format(telid, position))
 
     # Make a numpy array of telescopes position
 
     tel_list = []
-    for tel_id, tel_pos in event.meta.tel_pos.items():
+    for tel_id, tel_pos in instrument.tel_pos.items():
         tel_id = int(tel_id)
         tel_pos = [float(v.value) for v in tel_pos]
-        tel_foclen = float(event.meta.optical_foclen[tel_id].value)
+        tel_foclen = float(instrument.optical_foclen[tel_id].value)
         tel_list.append([tel_id, *tel_pos, tel_foclen])
 
     tel_array = np.array(tel_list)
@@ -11,49 +11,26 @@ import argparse
 
 import ctapipe
 import ctapipe.visualization
-from ctapipe.io.hessio import hessio_event_source
-import pyhessio
 
 from matplotlib import pyplot as plt
 
-def get_mc_calibration_coeffs(tel_id):
-    """
-    Get the calibration coefficients from the MC data file to the
-    data. This is ahack (until we have a real data structure for the
-    calibrated data), it should move into `ctapipe.io.hessio_event_source`.
-
-    RETURNS
-    -------
-    (pedestal, gains) : arrays of the pedestal and pe/dc ratios.
-    """
-    pedestal = pyhessio.get_pedestal(tel_id)[0]
-    gains = pyhessio.get_calibration(tel_id)[0]
-
-    return pedestal, gains
+import calibration_table
+import geometry_cache
 
 
 def show_gains_image(simtel_file_path, output_file_path, tel_num, quiet=False):
 
-    # GET EVENT #############################################################
-
-    # hessio_event_source returns a Python generator that streams data from an
-    # EventIO/HESSIO MC data file (e.g. a standard CTA data file).
-    # This generator contains ctapipe.core.Container instances ("event").
-    # 
-    # Parameters:
-    # - max_events: maximum number of events to read
-    # - allowed_tels: select only a subset of telescope, if None, all are read.
-    source = hessio_event_source(simtel_file_path, allowed_tels=[tel_num])
+    # GET CALIBRATION #######################################################
 
-    # TODO
-    for ev in source:
-        event = ev
+    # The calibration is read from a calibration table (see
+    # calibration_table.py) or from the simtel file (only its header blocks and
+    # its first event are decoded).
+    calibration = calibration_table.get_telescope_calibration(simtel_file_path, tel_num)
 
     # INIT PLOT #############################################################
 
-    x, y = event.meta.pixel_pos[tel_num]
-    foclen = event.meta.optical_foclen[tel_num]
-    geom = ctapipe.io.CameraGeometry.guess(x, y, foclen)
+    # The geometry is resolved once per camera layout (see geometry_cache.py)
+    geom = geometry_cache.get_geometry(calibration["pixel_pos_x"], calibration["pixel_pos_y"], calibration["foclen"])
 
     disp = ctapipe.visualization.CameraDisplay(geom, title='CT%d' % tel_num)
     disp.enable_pixel_picker()
@@ -63,7 +40,7 @@ def show_gains_image(simtel_file_path, output_file_path, tel_num, quiet=False):
 
     # DISPLAY INTEGRATED EVENT ##############################################
 
-    pedestal, gains = get_mc_calibration_coeffs(tel_num)
+    gains = calibration["gain"][0]
     disp.image = gains
 
     #disp.set_limits_minmax(0, 9000)
@@ -96,7 +73,7 @@ if __name__ == '__main__':
                         help="The output file path")
 
     parser.add_argument("fileargs", nargs=1, metavar="FILE",
-                        help="The simtel file to process")
+                        help="The simtel file (or calibration table) to process")
 
     args = parser.parse_args()
 
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Transcoding cache for gzip compressed simtel files.
+
+Reading a given event of a ``*.simtel.gz`` file means decompressing the file
+from its beginning (unless the gzip access points of the file are available,
+see simtel_eventio.py). This cache keeps an uncompressed copy of the hot
+simtel files in a cache directory:
+
+- the cache directory is ``$SIMTEL_CACHE_DIR`` (``~/.cache/simtel`` by
+  default);
+- the cache size budget is ``$SIMTEL_CACHE_SIZE`` (e.g. "20G"); the cache is
+  disabled if this variable is not set (or is 0);
+- a file is only copied once it has been opened ``$SIMTEL_CACHE_MIN_USES``
+  times (3 by default, see ``get_uncompressed_copy()``), or when it is
+  added explicitly with this script;
+- when the budget is exceeded, the least recently used copies are removed;
+  the budget is checked against the bytes actually written while a file is
+  decompressed (the size stored in gzip files is modulo 4GB), and copies
+  that don't fit are aborted.
+
+Copies are named after the path, the size and the modification time of the
+original file, thus they are never used once the original file has changed.
+
+Usage: ./simtel_cache.py [--size SIZE] FILE [FILE ...]    (add FILE to the cache)
+       ./simtel_cache.py --list
+       ./simtel_cache.py --clear
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "simtel")
+
+CACHE_FILE_EXTENSION = ".simtel"
+
+USES_FILE_NAME = "uses.json"   # Number of uses of the files not cached yet
+
+DEFAULT_MIN_USES = 3
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+SIZE_SUFFIXES = {"K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+_counted_files = set()  # Files whose use has already been counted by this process (cache file paths)
+
+
+def parse_size(size_str):
+    """Convert a size string (e.g. "500M", "20G" or "1024") to a number of
+    bytes."""
+    size_str = size_str.strip().upper()
+
+    if size_str == "":
+        return 0
+
+    if size_str[-1] in SIZE_SUFFIXES:
+        return int(float(size_str[:-1]) * SIZE_SUFFIXES[size_str[-1]])
+
+    return int(size_str)
+
+
+def get_cache_dir():
+    """Return the path of the cache directory."""
+    return os.environ.get("SIMTEL_CACHE_DIR", DEFAULT_CACHE_DIR)
+
+
+def get_cache_size():
+    """Return the cache size budget in bytes (0 if the cache is disabled)."""
+    return parse_size(os.environ.get("SIMTEL_CACHE_SIZE", "0"))
+
+
+def get_min_uses():
+    """Return the number of uses from which a file is copied in the cache."""
+    return int(os.environ.get("SIMTEL_CACHE_MIN_USES", DEFAULT_MIN_USES))
+
+
+def get_cache_file_path(simtel_file_path):
+    """Return the path of the cached (uncompressed) copy of
+    'simtel_file_path' (whether it exists or not)."""
+
+    stat = os.stat(simtel_file_path)
+    key = "{}:{}:{}".format(os.path.abspath(simtel_file_path), stat.st_size, stat.st_mtime)
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    basename = os.path.basename(simtel_file_path)
+    if basename.endswith(".gz"):
+        basename = basename[:-3]
+    if basename.endswith(CACHE_FILE_EXTENSION):
+        basename = basename[:-len(CACHE_FILE_EXTENSION)]
+
+    return os.path.join(get_cache_dir(), "{}_{}{}".format(basename, digest[:16], CACHE_FILE_EXTENSION))
+
+
+def list_cache_files():
+    """Return the (path, size, last use time) of the cached copies, the least
+    recently used first."""
+
+    cache_dir = get_cache_dir()
+
+    if not os.path.isdir(cache_dir):
+        return []
+
+    file_list = []
+
+    for file_name in os.listdir(cache_dir):
+        if file_name.endswith(CACHE_FILE_EXTENSION):
+            file_path = os.path.join(cache_dir, file_name)
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue            # Removed by another process
+            file_list.append((file_path, stat.st_size, stat.st_mtime))
+
+    return sorted(file_list, key=lambda item: item[2])
+
+
+def evict(cache_size, reserved_size=0):
+    """Remove the least recently used copies until the cache (plus
+    'reserved_size' bytes) fits in 'cache_size' bytes."""
+
+    file_list = list_cache_files()
+    total_size = sum(size for file_path, size, mtime in file_list) + reserved_size
+
+    for file_path, size, mtime in file_list:
+        if total_size <= cache_size:
+            break
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+        total_size -= size
+
+
+def _update_uses(cache_file_path, function):
+    """Apply 'function' to the number of uses of 'cache_file_path' (0 if it
+    is unknown, None removes the entry) and return the new value."""
+
+    uses_file_path = os.path.join(get_cache_dir(), USES_FILE_NAME)
+
+    try:
+        with open(uses_file_path, "r") as fd:
+            uses_dict = json.load(fd)
+    except (OSError, ValueError):
+        uses_dict = {}
+
+    key = os.path.basename(cache_file_path)
+    uses = function(uses_dict.get(key, 0))
+
+    if uses is None:
+        uses_dict.pop(key, None)
+    else:
+        uses_dict[key] = uses
+
+    # Write a temporary file then rename it (concurrent processes may lose
+    # a use, they never read a partial file)
+    os.makedirs(get_cache_dir(), exist_ok=True)
+    tmp_fd, tmp_file_path = tempfile.mkstemp(dir=get_cache_dir(), suffix=".tmp")
+
+    with os.fdopen(tmp_fd, "w") as fd:
+        json.dump(uses_dict, fd)
+
+    os.replace(tmp_file_path, uses_file_path)
+
+    return uses
+
+
+def _mark_too_large(cache_file_path, cache_size):
+    """Record that 'cache_file_path' doesn't fit in a 'cache_size' bytes
+    cache (its "number of uses" is then -cache_size)."""
+    _update_uses(cache_file_path, lambda uses: -cache_size)
+
+
+def lookup(simtel_file_path):
+    """
+    Return the path of the cached copy of 'simtel_file_path' or None if it is
+    not in the cache.
+
+    The copy is marked as used (for the LRU eviction).
+    """
+
+    cache_file_path = get_cache_file_path(simtel_file_path)
+
+    try:
+        os.utime(cache_file_path)       # Last use time
+    except OSError:
+        return None
+
+    return cache_file_path
+
+
+def add(simtel_file_path, cache_size=None):
+    """
+    Add an uncompressed copy of the 'simtel_file_path' gzip file to the cache.
+
+    Parameters
+    ----------
+    simtel_file_path : str
+        The path of the gzip compressed simtel file.
+    cache_size : int
+        The cache size budget in bytes (``get_cache_size()`` if None).
+
+    Returns
+    -------
+    str
+        The path of the cached copy (or None if it doesn't fit in the cache).
+    """
+
+    if cache_size is None:
+        cache_size = get_cache_size()
+
+    cache_file_path = lookup(simtel_file_path)
+
+    if cache_file_path is not None:
+        return cache_file_path
+
+    # The uncompressed size is stored (modulo 2**32) at the end of gzip
+    # files: it is only a lower bound of the space to reserve
+    with open(simtel_file_path, "rb") as fd:
+        fd.seek(-4, os.SEEK_END)
+        reserved_size = int.from_bytes(fd.read(4), "little")
+
+    cache_file_path = get_cache_file_path(simtel_file_path)
+
+    if reserved_size > cache_size:
+        _mark_too_large(cache_file_path, cache_size)
+        return None
+
+    cache_dir = get_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+
+    evict(cache_size, reserved_size)
+
+    # Write a temporary file then rename it so that concurrent readers never
+    # see a partial copy
+    tmp_fd, tmp_file_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+
+    try:
+        written_size = 0
+
+        with os.fdopen(tmp_fd, "wb") as output_fd:
+            with gzip.open(simtel_file_path, "rb") as input_fd:
+                while True:
+                    chunk = input_fd.read(COPY_CHUNK_SIZE)
+                    if len(chunk) == 0:
+                        break
+
+                    written_size += len(chunk)
+
+                    # Reserve more space as the copy grows (and give up as
+                    # soon as it can't fit in the cache)
+                    if written_size > reserved_size:
+                        reserved_size = min(2 * written_size, cache_size)
+                        if written_size > cache_size:
+                            _mark_too_large(cache_file_path, cache_size)
+                            return None
+                        evict(cache_size, reserved_size)
+
+                    output_fd.write(chunk)
+
+        os.replace(tmp_file_path, cache_file_path)
+    finally:
+        if os.path.exists(tmp_file_path):
+            os.remove(tmp_file_path)
+
+    _update_uses(cache_file_path, lambda uses: None)
+
+    return lookup(simtel_file_path)
+
+
+def get_uncompressed_copy(simtel_file_path):
+    """
+    Return the path of an uncompressed copy of the 'simtel_file_path' gzip
+    file, or None if the cache is disabled (or if the file is not cached:
+    not hot yet, or too large).
+
+    Files are added to the cache once they are "hot": the copy is made when
+    the ``get_min_uses()``-th process uses a given file (None is returned
+    before). One use is counted per file and per process, as one tool run
+    opens the same file several times (index, instrument, events). Files
+    that don't fit in the cache are not tried again (unless the cache size
+    budget is increased).
+    """
+
+    cache_size = get_cache_size()
+
+    if cache_size <= 0:
+        return None
+
+    try:
+        cache_file_path = lookup(simtel_file_path)
+
+        if cache_file_path is not None:
+            return cache_file_path
+
+        cache_file_path = get_cache_file_path(simtel_file_path)
+
+        if cache_file_path in _counted_files:
+            return None
+
+        _counted_files.add(cache_file_path)
+
+        def count_use(uses):
+            if (uses < 0) and (-uses >= cache_size):
+                return uses             # Too large for this budget
+            return max(uses, 0) + 1
+
+        uses = _update_uses(cache_file_path, count_use)
+
+        if (uses < 0) or (uses < get_min_uses()):
+            return None
+
+        return add(simtel_file_path, cache_size)
+    except OSError as e:
+        print("Warning: cannot cache {} ({})".format(simtel_file_path, e), file=sys.stderr)
+        return None
+
+
+def main():
+    """Parse command options (sys.argv) and manage the cache."""
+
+    # PARSE OPTIONS ###########################################################
+
+    desc = "Manage the cache of uncompressed simtel files."
+    parser = argparse.ArgumentParser(description=desc)
+
+    parser.add_argument("--size", "-s", default=None,
+                        metavar="SIZE",
+                        help="The cache size budget (e.g. 20G, default: $SIMTEL_CACHE_SIZE)")
+
+    parser.add_argument("--list", "-l", action="store_true",
+                        help="List the cached files (the least recently used first)")
+
+    parser.add_argument("--clear", action="store_true",
+                        help="Remove all the cached files")
+
+    parser.add_argument("fileargs", nargs="*", metavar="FILE",
+                        help="The gzip compressed simtel files to add to the cache")
+
+    args = parser.parse_args()
+
+    if args.size is None:
+        cache_size = get_cache_size()
+    else:
+        cache_size = parse_size(args.size)
+
+    # MANAGE THE CACHE ########################################################
+
+    if args.clear:
+        evict(0)
+
+        uses_file_path = os.path.join(get_cache_dir(), USES_FILE_NAME)
+        if os.path.isfile(uses_file_path):
+            os.remove(uses_file_path)
+
+    for simtel_file_path in args.fileargs:
+        cache_file_path = add(simtel_file_path, cache_size)
+        if cache_file_path is None:
+            print("{}: doesn't fit in the cache".format(simtel_file_path))
+        else:
+            print("{}: {}".format(simtel_file_path, cache_file_path))
+
+    if args.list:
+        for file_path, size, mtime in list_cache_files():
+            print("{} {}".format(size, file_path))
+
+
+if __name__ == '__main__':
+    main()
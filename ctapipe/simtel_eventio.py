@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Minimal EventIO reader for simtel files.
+
+This module walks the EventIO block structure of a simtel file (optionally
+gzip compressed) without decoding it with pyhessio. It is used to index
+simtel files (see ``simtel_index.py``): each top level block header is read
+and the block payload is skipped, except for the few small blocks we need to
+look at (e.g. the central trigger block of each event).
+
+Only little-endian files are supported (i.e. all CTA simtel files).
+
+Gzip compressed files are read:
+
+- from their uncompressed copy if it is in the transcoding cache (see
+  simtel_cache.py);
+- otherwise with the (optional) ``indexed_gzip`` package if it is installed:
+  the access points (checkpoints of the decompressor state, every
+  ``GZIP_INDEX_SPACING`` bytes) made while the file is indexed are saved next
+  to it (``<simtel_file>.gzidx``) so that a reader can resume decompression
+  near any event instead of decompressing the file from its beginning;
+- otherwise with the standard ``gzip`` module (seeking is then slow).
+
+See the "eventio" and "hessio" documentation in the sim_telarray package for
+the description of the format.
+"""
+
+import gzip
+import os
+import struct
+import sys
+
+try:
+    import indexed_gzip
+except ImportError:
+    indexed_gzip = None
+
+import simtel_cache
+
+# The EventIO synchronisation marker (0xD41F8A37) that starts each top level
+# block of a little-endian file.
+SYNC_MARKER = b'\x37\x8a\x1f\xd4'
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Distance (in uncompressed bytes) between two gzip access points (each access
+# point takes 32KB in the ".gzidx" file)
+GZIP_INDEX_SPACING = 4 * 1024 * 1024
+
+# EventIO block types used in simtel files (see hessio's io_hess.h)
+TYPE_RUNHEADER = 2000
+TYPE_MC_RUNHEADER = 2001
+TYPE_CAMSETTINGS = 2002
+TYPE_CENTRAL_EVENT = 2009
+TYPE_EVENT = 2010
+TYPE_MC_SHOWER = 2020
+TYPE_MC_EVENT = 2021
+
+
+class BlockHeader(object):
+    """
+    The header of an EventIO block.
+
+    Attributes
+    ----------
+    type : int
+        The block type (e.g. 2010 for an event).
+    version : int
+        The version of the block format.
+    ident : int
+        The block identifier (e.g. the event ID for an event block).
+    offset : int
+        The (uncompressed) position of the first byte of the block, header
+        included.
+    data_offset : int
+        The (uncompressed) position of the first byte of the block payload.
+    length : int
+        The length of the block payload (in bytes).
+    only_sub_objects : bool
+        True if the payload only contains sub-blocks.
+    """
+
+    def __init__(self, block_type, version, ident, offset, data_offset, length, only_sub_objects):
+        self.type = block_type
+        self.version = version
+        self.ident = ident
+        self.offset = offset
+        self.data_offset = data_offset
+        self.length = length
+        self.only_sub_objects = only_sub_objects
+
+    @property
+    def end(self):
+        """The position of the first byte after the block."""
+        return self.data_offset + self.length
+
+    @property
+    def size(self):
+        """The size of the block (header included)."""
+        return self.end - self.offset
+
+
+def get_gzip_index_file_path(simtel_file_path):
+    """Return the path of the gzip access points file of the
+    'simtel_file_path' file."""
+    return simtel_file_path + ".gzidx"
+
+
+def _open_indexed_gzip_file(simtel_file_path):
+    gzip_index_file_path = get_gzip_index_file_path(simtel_file_path)
+
+    if os.path.isfile(gzip_index_file_path) and \
+       os.path.getmtime(gzip_index_file_path) >= os.path.getmtime(simtel_file_path):
+        return indexed_gzip.IndexedGzipFile(simtel_file_path,
+                                            spacing=GZIP_INDEX_SPACING,
+                                            index_file=gzip_index_file_path)
+
+    return indexed_gzip.IndexedGzipFile(simtel_file_path, spacing=GZIP_INDEX_SPACING)
+
+
+def open_simtel_file(simtel_file_path):
+    """
+    Open a simtel file for binary reading.
+
+    Gzip compressed files are transparently decompressed: in this case offsets
+    used by ``seek()`` and ``tell()`` are positions in the uncompressed stream.
+
+    Parameters
+    ----------
+    simtel_file_path : str
+        The path of the simtel file to open.
+
+    Returns
+    -------
+    file object
+        A binary file object.
+    """
+    fd = open(simtel_file_path, "rb")
+
+    if fd.read(2) == GZIP_MAGIC:
+        fd.close()
+
+        cache_file_path = simtel_cache.get_uncompressed_copy(simtel_file_path)
+
+        if cache_file_path is not None:
+            fd = open(cache_file_path, "rb")
+        elif indexed_gzip is not None:
+            fd = _open_indexed_gzip_file(simtel_file_path)
+        else:
+            fd = gzip.open(simtel_file_path, "rb")
+    else:
+        fd.seek(0)
+
+    return fd
+
+
+def save_gzip_index(fd, simtel_file_path):
+    """
+    Save the gzip access points made while reading 'fd' (a file object
+    returned by ``open_simtel_file()``) next to the 'simtel_file_path' file.
+
+    Nothing is done if 'fd' is not read with ``indexed_gzip``.
+    """
+    if (indexed_gzip is None) or not isinstance(fd, indexed_gzip.IndexedGzipFile):
+        return
+
+    try:
+        fd.export_index(get_gzip_index_file_path(simtel_file_path))
+    except (OSError, indexed_gzip.ZranError) as e:
+        print("Warning: cannot save the gzip index ({})".format(e), file=sys.stderr)
+
+
+def _read_exactly(fd, size):
+    data = fd.read(size)
+    if len(data) != size:
+        raise EOFError("Truncated EventIO block.")
+    return data
+
+
+def read_header(fd, top_level=True):
+    """
+    Read the EventIO block header at the current position of ``fd``.
+
+    Parameters
+    ----------
+    fd : file object
+        The simtel file (see ``open_simtel_file()``).
+    top_level : bool
+        Top level blocks start with a synchronisation marker, sub-blocks
+        don't.
+
+    Returns
+    -------
+    BlockHeader
+        The block header or None if the end of the file has been reached.
+    """
+    offset = fd.tell()
+
+    if top_level:
+        marker = fd.read(4)
+        if len(marker) == 0:
+            return None
+        if marker != SYNC_MARKER:
+            raise ValueError("Invalid EventIO synchronisation marker at byte {} (big-endian files are not supported).".format(offset))
+
+    type_word, ident, length_word = struct.unpack("<IiI", _read_exactly(fd, 12))
+
+    block_type = type_word & 0xffff
+    extended = bool(type_word & (1 << 17))
+    version = (type_word >> 20) & 0xfff
+
+    length = length_word & 0x3fffffff
+    only_sub_objects = bool(length_word & (1 << 30))
+
+    if extended:
+        extension, = struct.unpack("<I", _read_exactly(fd, 4))
+        length |= (extension & 0xfff) << 30
+
+    return BlockHeader(block_type, version, ident, offset, fd.tell(), length, only_sub_objects)
+
+
+def iter_blocks(fd):
+    """
+    Iterate over the top level blocks of a simtel file.
+
+    The file position is moved to the end of each block before the next one is
+    read, thus the caller may read (a part of) the payload of the yielded
+    blocks.
+
+    Parameters
+    ----------
+    fd : file object
+        The simtel file (see ``open_simtel_file()``).
+
+    Yields
+    ------
+    BlockHeader
+        The header of each top level block.
+    """
+    fd.seek(0)
+
+    while True:
+        header = read_header(fd, top_level=True)
+        if header is None:
+            break
+        yield header
+        fd.seek(header.end)
+
+
+def iter_sub_blocks(fd, header):
+    """
+    Iterate over the sub-blocks of a block.
+
+    Parameters
+    ----------
+    fd : file object
+        The simtel file (see ``open_simtel_file()``).
+    header : BlockHeader
+        The header of the parent block.
+
+    Yields
+    ------
+    BlockHeader
+        The header of each sub-block.
+    """
+    position = header.data_offset
+
+    while position < header.end:
+        fd.seek(position)
+        sub_header = read_header(fd, top_level=False)
+        yield sub_header
+        position = sub_header.end
+
+
+def read_payload(fd, header):
+    """
+    Read the whole payload of a block.
+
+    Parameters
+    ----------
+    fd : file object
+        The simtel file (see ``open_simtel_file()``).
+    header : BlockHeader
+        The header of the block to read.
+
+    Returns
+    -------
+    bytes
+        The block payload.
+    """
+    fd.seek(header.data_offset)
+    return _read_exactly(fd, header.length)
+
+
+def parse_central_event(payload, version):
+    """
+    Get the list of triggered telescopes from a central trigger block
+    (type 2009).
+
+    Parameters
+    ----------
+    payload : bytes
+        The payload of the central trigger block.
+    version : int
+        The version of the central trigger block.
+
+    Returns
+    -------
+    list of int
+        The ID of the triggered telescopes.
+    """
+    # cpu_time (2 x int32), gps_time (2 x int32), teltrg_pattern (int32),
+    # teldata_pattern (int32)
+    teltrg_pattern, = struct.unpack_from("<i", payload, 16)
+
+    if version < 1:
+        # Only the first 32 telescopes can be described by the pattern
+        return [bit + 1 for bit in range(32) if teltrg_pattern & (1 << bit)]
+
+    num_teltrg, = struct.unpack_from("<h", payload, 24)
+    teltrg_list = struct.unpack_from("<{}h".format(num_teltrg), payload, 26)
+
+    return list(teltrg_list)
+
+
+def parse_runheader(payload, version):
+    """
+    Get the telescope positions from a run header block (type 2000).
+
+    Parameters
+    ----------
+    payload : bytes
+        The payload of the run header block.
+    version : int
+        The version of the run header block.
+
+    Returns
+    -------
+    dict
+        The position (x, y, z) of each telescope (in meters, key=telescope ID).
+    """
+    # run, time, run_type, tracking_mode (4 x int32)
+    offset = 16
+
+    if version >= 2:
+        offset += 4             # reverse_flag (int32)
+
+    offset += 5 * 4             # direction (2 x float), offset_fov (2 x float), conv_depth (float)
+
+    if version >= 1:
+        offset += 2 * 4         # conv_ref_pos (2 x float)
+
+    num_tel, = struct.unpack_from("<i", payload, offset)
+    offset += 4
+
+    tel_id_list = struct.unpack_from("<{}h".format(num_tel), payload, offset)
+    offset += 2 * num_tel
+
+    tel_pos_list = struct.unpack_from("<{}f".format(3 * num_tel), payload, offset)
+
+    return {tel_id: tel_pos_list[3*index:3*index+3] for index, tel_id in enumerate(tel_id_list)}
+
+
+def parse_camsettings(payload, version):
+    """
+    Get the focal length and the pixels position from a camera settings block
+    (type 2002, the block ident is the telescope ID).
+
+    Parameters
+    ----------
+    payload : bytes
+        The payload of the camera settings block.
+    version : int
+        The version of the camera settings block.
+
+    Returns
+    -------
+    tuple
+        The focal length (in meters) and the x and y position of each pixel
+        (two tuples of floats, in meters).
+    """
+    num_pixels, focal_length = struct.unpack_from("<if", payload, 0)
+    offset = 8
+
+    if version > 0:
+        offset += 4             # effective focal length (float)
+
+    pixel_pos_x = struct.unpack_from("<{}f".format(num_pixels), payload, offset)
+    offset += 4 * num_pixels
+
+    pixel_pos_y = struct.unpack_from("<{}f".format(num_pixels), payload, offset)
+
+    return focal_length, pixel_pos_x, pixel_pos_y
+
+
+def parse_mc_shower(payload, version):
+    """
+    Get the primary particle, its energy and its direction from a MC shower
+    block (type 2020, the block ident is the shower number).
+
+    Parameters
+    ----------
+    payload : bytes
+        The payload of the MC shower block.
+    version : int
+        The version of the MC shower block.
+
+    Returns
+    -------
+    tuple
+        The primary particle ID, the energy (in TeV), the azimuth and the
+        altitude (in radians) of the primary particle.
+    """
+    primary_id, energy, azimuth, altitude = struct.unpack_from("<ifff", payload, 0)
+
+    return primary_id, energy, azimuth, altitude
+
+
+def parse_mc_event(payload, version):
+    """
+    Get the core position from a MC event block (type 2021, the block ident
+    is the event ID).
+
+    Parameters
+    ----------
+    payload : bytes
+        The payload of the MC event block.
+    version : int
+        The version of the MC event block.
+
+    Returns
+    -------
+    tuple
+        The shower number and the x and y position of the shower core (in
+        meters).
+    """
+    shower_num, core_x, core_y = struct.unpack_from("<iff", payload, 0)
+
+    return shower_num, core_x, core_y
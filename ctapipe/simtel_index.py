@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Build (and use) a byte-offset event index for simtel files.
+
+Looking for a given event with ``hessio_event_source`` means decoding every
+event that comes before it in the simtel file. This module builds (once) an
+index that gives, for each event, its position in the simtel file and the list
+of its triggered telescopes. The index is saved next to the simtel file
+(``<simtel_file>.index.json``) and is rebuilt when the simtel file changes
+(size or modification time). It also keeps the MC truth of each event (energy,
+direction and core position) so that events can be selected without decoding
+them (see ``event_selection.py``).
+
+``get_event()`` then copies the run header blocks and the blocks of the
+requested event in a (small) temporary simtel file and decodes it with
+``hessio_event_source``: only the requested event is decoded. The calibration
+coefficients of its telescopes are read while this file is open and kept in
+the cache of mc_calibration.py.
+
+Usage: ./simtel_index.py FILE [FILE ...]    (pre-build the index of FILE)
+"""
+
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+from ctapipe.io.hessio import hessio_event_source
+
+import mc_calibration
+import simtel_eventio
+
+INDEX_FORMAT_VERSION = 2
+
+# Blocks that belong to events (everything before the first one of these
+# blocks is the "header" of the simtel file: run header, camera settings,
+# calibration, ...)
+EVENT_BLOCK_TYPES = (simtel_eventio.TYPE_MC_SHOWER,
+                     simtel_eventio.TYPE_MC_EVENT,
+                     simtel_eventio.TYPE_EVENT)
+
+_index_cache = {}   # Indexes already loaded by this process (key=simtel file path)
+_entry_cache = {}   # Index entries by event ID (key=simtel file path)
+
+
+def get_index_file_path(simtel_file_path):
+    """Return the path of the index file of the 'simtel_file_path' file."""
+    return simtel_file_path + ".index.json"
+
+
+def _get_file_signature(simtel_file_path):
+    stat = os.stat(simtel_file_path)
+    return stat.st_size, stat.st_mtime
+
+
+def _read_event_triggers(fd, header):
+    """Return the event ID and the list of triggered telescopes of the event
+    block 'header' (only the central trigger sub-block is read)."""
+
+    for sub_header in simtel_eventio.iter_sub_blocks(fd, header):
+        if sub_header.type == simtel_eventio.TYPE_CENTRAL_EVENT:
+            payload = simtel_eventio.read_payload(fd, sub_header)
+            tels_with_trigger = simtel_eventio.parse_central_event(payload, sub_header.version)
+            return sub_header.ident, tels_with_trigger
+
+    return header.ident, []
+
+
+def build_event_index(simtel_file_path):
+    """
+    Scan the 'simtel_file_path' file and make its event index.
+
+    Only block headers, MC shower, MC event and central trigger blocks are
+    read (telescope data are skipped).
+
+    Parameters
+    ----------
+    simtel_file_path : str
+        The path of the simtel file to index.
+
+    Returns
+    -------
+    dict
+        The event index. The "header" item gives the position and size of the
+        run header blocks. The "events" item is a list of dictionaries (one per
+        event) containing the event ID, the position and the size of the event
+        blocks, the position and size of the MC shower block of the event, the
+        list of triggered telescopes and the MC truth of the event ("mc" item:
+        a dictionary containing the "energy" in TeV, the "alt" and "az" in
+        radians and the "core_x" and "core_y" in meters, or None if the file
+        contains no MC block).
+    """
+
+    size, mtime = _get_file_signature(simtel_file_path)
+
+    event_list = []
+    header_size = None
+    group_offset = None     # Position of the first block of the current event
+    shower = None           # Position and size of the current MC shower block
+    mc_shower = None        # Energy and direction of the current MC shower
+    mc_core = None          # Core position of the current MC event
+
+    with simtel_eventio.open_simtel_file(simtel_file_path) as fd:
+        for header in simtel_eventio.iter_blocks(fd):
+
+            if header.type in EVENT_BLOCK_TYPES and header_size is None:
+                header_size = header.offset
+
+            if header_size is None:
+                continue
+
+            if header.type == simtel_eventio.TYPE_MC_SHOWER:
+                # The MC shower block may be shared by several events (shower
+                # reuse) thus it is stored apart
+                shower = [header.offset, header.size]
+                group_offset = header.end
+
+                payload = simtel_eventio.read_payload(fd, header)
+                primary_id, energy, az, alt = simtel_eventio.parse_mc_shower(payload, header.version)
+                mc_shower = {"energy": energy, "alt": alt, "az": az}
+                continue
+
+            if group_offset is None:
+                group_offset = header.offset
+
+            if header.type == simtel_eventio.TYPE_MC_EVENT:
+                payload = simtel_eventio.read_payload(fd, header)
+                shower_num, core_x, core_y = simtel_eventio.parse_mc_event(payload, header.version)
+                mc_core = {"core_x": core_x, "core_y": core_y}
+
+            if header.type == simtel_eventio.TYPE_EVENT:
+                event_id, tels_with_trigger = _read_event_triggers(fd, header)
+
+                if mc_shower is not None and mc_core is not None:
+                    mc = dict(mc_shower, **mc_core)
+                else:
+                    mc = None
+
+                event_list.append({"event_id": int(event_id),
+                                   "offset": group_offset,
+                                   "size": header.end - group_offset,
+                                   "shower": shower,
+                                   "tels_with_trigger": [int(tel_id) for tel_id in tels_with_trigger],
+                                   "mc": mc})
+
+                group_offset = None
+                mc_core = None
+
+        if header_size is None:
+            header_size = fd.tell()
+
+        # The whole file has been decompressed: keep the gzip access points
+        # made on the way (if any) for later random accesses
+        simtel_eventio.save_gzip_index(fd, simtel_file_path)
+
+    index = {"version": INDEX_FORMAT_VERSION,
+             "simtel_file": os.path.basename(simtel_file_path),
+             "size": size,
+             "mtime": mtime,
+             "header": [0, header_size],
+             "events": event_list}
+
+    return index
+
+
+def _is_up_to_date(index, simtel_file_path):
+    return (index.get("version") == INDEX_FORMAT_VERSION) and \
+           ((index["size"], index["mtime"]) == _get_file_signature(simtel_file_path))
+
+
+def load_event_index(simtel_file_path, rebuild=False):
+    """
+    Get the event index of the 'simtel_file_path' file.
+
+    The index is read from ``<simtel_file>.index.json`` if this file is up to
+    date (and readable), otherwise it is (re)built and saved (if the simtel
+    file directory is writable).
+
+    Parameters
+    ----------
+    simtel_file_path : str
+        The path of the simtel file.
+    rebuild : bool
+        Force the index to be rebuilt.
+
+    Returns
+    -------
+    dict
+        The event index (see ``build_event_index()``).
+    """
+
+    index = _index_cache.get(simtel_file_path)
+
+    if (not rebuild) and (index is not None) and _is_up_to_date(index, simtel_file_path):
+        return index
+
+    index_file_path = get_index_file_path(simtel_file_path)
+    index = None
+
+    if (not rebuild) and os.path.isfile(index_file_path):
+        try:
+            with open(index_file_path, "r") as fd:
+                index = json.load(fd)
+        except ValueError:
+            index = None        # Corrupted index file
+        if (not isinstance(index, dict)) or not _is_up_to_date(index, simtel_file_path):
+            index = None
+
+    if index is None:
+        index = build_event_index(simtel_file_path)
+        try:
+            # Write a temporary file then rename it (concurrent processes
+            # never read a partial index)
+            tmp_fd, tmp_file_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(index_file_path)), suffix=".tmp")
+            try:
+                with os.fdopen(tmp_fd, "w") as fd:
+                    json.dump(index, fd)
+                os.replace(tmp_file_path, index_file_path)
+            finally:
+                if os.path.exists(tmp_file_path):
+                    os.remove(tmp_file_path)
+        except OSError as e:
+            print("Warning: cannot save the event index ({})".format(e), file=sys.stderr)
+
+    _index_cache[simtel_file_path] = index
+    _entry_cache[simtel_file_path] = {entry["event_id"]: entry for entry in index["events"]}
+
+    return index
+
+
+def get_event_entry(simtel_file_path, event_id):
+    """
+    Return the index entry of the event 'event_id' (or None if the event is not
+    in the 'simtel_file_path' file).
+    """
+
+    load_event_index(simtel_file_path)
+
+    return _entry_cache[simtel_file_path].get(event_id)
+
+
+def iter_triggers(simtel_file_path):
+    """
+    Iterate over the events of a simtel file without decoding them.
+
+    This "trigger-only" scan reads the central trigger block of each event and
+    skips telescope data (ADC sums, samples, MC photoelectrons, ...). Its
+    result is kept in the event index thus subsequent scans of the same file
+    only read the index.
+
+    Parameters
+    ----------
+    simtel_file_path : str
+        The path of the simtel file to scan.
+
+    Yields
+    ------
+    tuple
+        The event ID and the list of triggered telescopes of each event (in
+        the simtel file order).
+    """
+
+    index = load_event_index(simtel_file_path)
+
+    for entry in index["events"]:
+        yield entry["event_id"], entry["tels_with_trigger"]
+
+
+def _copy_range(input_fd, output_fd, offset, size):
+    input_fd.seek(offset)
+    while size > 0:
+        chunk = input_fd.read(min(size, 1024 * 1024))
+        if len(chunk) == 0:
+            raise EOFError("Unexpected end of simtel file.")
+        output_fd.write(chunk)
+        size -= len(chunk)
+
+
+def write_event_file(simtel_file_path, entry_list, output_file_path):
+    """
+    Write a (small) simtel file containing the header blocks of
+    'simtel_file_path' and the blocks of the events listed in 'entry_list'.
+
+    Parameters
+    ----------
+    simtel_file_path : str
+        The path of the simtel file to read.
+    entry_list : list of dict
+        The index entries of the events to copy (see ``build_event_index()``).
+    output_file_path : str
+        The path of the simtel file to write.
+    """
+
+    index = load_event_index(simtel_file_path)
+
+    with simtel_eventio.open_simtel_file(simtel_file_path) as input_fd:
+        with open(output_file_path, "wb") as output_fd:
+            _copy_range(input_fd, output_fd, *index["header"])
+
+            current_shower = None
+
+            for entry in sorted(entry_list, key=lambda entry: entry["offset"]):
+                if (entry["shower"] is not None) and (entry["shower"] != current_shower):
+                    _copy_range(input_fd, output_fd, *entry["shower"])
+                    current_shower = entry["shower"]
+
+                _copy_range(input_fd, output_fd, entry["offset"], entry["size"])
+
+
+def get_event(simtel_file_path, event_id, allowed_tels=None):
+    """
+    Read one event of a simtel file without decoding the events before it.
+
+    Parameters
+    ----------
+    simtel_file_path : str
+        The path of the simtel file to read.
+    event_id : int
+        The ID of the event to read.
+    allowed_tels : list of int
+        Select only a subset of telescope, if None, all are read
+        (see ``hessio_event_source``).
+
+    Returns
+    -------
+    ctapipe.core.Container
+        The event (or None if it is not in the 'simtel_file_path' file).
+
+    Notes
+    -----
+    pyhessio only gives the calibration coefficients of the file it is
+    reading, and the temporary file is closed when this function returns:
+    the coefficients of the telescopes of the event are read before and put
+    in the mc_calibration.py cache, thus ``get_mc_calibration_coeffs(tel_id,
+    get_run_key(event))`` works on the returned event.
+    """
+
+    entry = get_event_entry(simtel_file_path, event_id)
+
+    if entry is None:
+        return None
+
+    event = None
+    tmp_dir = tempfile.mkdtemp(prefix="simtel_event_")
+
+    try:
+        tmp_file_path = os.path.join(tmp_dir, "EV{:05d}.simtel".format(event_id))
+        write_event_file(simtel_file_path, [entry], tmp_file_path)
+
+        # The cached coefficients may come from another simtel file
+        mc_calibration.clear_cache()
+
+        # Let the source be completely consumed so that the file is closed
+        for ev in hessio_event_source(tmp_file_path, allowed_tels=allowed_tels):
+            if int(ev.dl0.event_id) == event_id:
+                event = ev
+
+                # Read the calibration while the file is open
+                run_key = mc_calibration.get_run_key(ev)
+                for tel_id in ev.dl0.tels_with_data:
+                    mc_calibration.get_mc_calibration_coeffs(int(tel_id), run_key)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return event
+
+
+def map_simtel_files(function, simtel_file_path_list, jobs=1):
+    """
+    Apply 'function' to each simtel file of 'simtel_file_path_list', using a
+    pool of 'jobs' worker processes.
+
+    Parameters
+    ----------
+    function : callable
+        A (picklable) function taking a simtel file path.
+    simtel_file_path_list : list of str
+        The simtel files to process.
+    jobs : int
+        The number of worker processes (all CPU cores if 0, no worker process
+        if 1).
+
+    Returns
+    -------
+    list
+        The results of 'function', in the 'simtel_file_path_list' order
+        (whatever the order in which files are processed).
+    """
+
+    if jobs == 0:
+        jobs = multiprocessing.cpu_count()
+
+    jobs = min(jobs, len(simtel_file_path_list))
+
+    if jobs <= 1:
+        return [function(simtel_file_path) for simtel_file_path in simtel_file_path_list]
+
+    with multiprocessing.Pool(jobs) as pool:
+        # chunksize=1: files have very different sizes
+        return pool.map(function, simtel_file_path_list, chunksize=1)
+
+
+def main():
+    """Parse command options (sys.argv) and build the index of the given
+    simtel files."""
+
+    # PARSE OPTIONS ###########################################################
+
+    desc = "Build the event index of the given simtel files."
+    parser = argparse.ArgumentParser(description=desc)
+
+    parser.add_argument("--force", "-f", action="store_true",
+                        help="Rebuild the index even if it is up to date")
+
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        metavar="INTEGER",
+                        help="The number of files to process in parallel (0 for all CPU cores)")
+
+    parser.add_argument("fileargs", nargs="+", metavar="FILE",
+                        help="The simtel files to process")
+
+    args = parser.parse_args()
+
+    # BUILD THE INDEXES #######################################################
+
+    load_function = functools.partial(load_event_index, rebuild=args.force)
+    index_list = map_simtel_files(load_function, args.fileargs, args.jobs)
+
+    for simtel_file_path, index in zip(args.fileargs, index_list):
+        print("{}: {} events".format(simtel_file_path, len(index["events"])))
+
+
+if __name__ == '__main__':
+    main()
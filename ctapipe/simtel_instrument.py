@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Read the instrument description (telescopes position, focal length and
+pixels position) of a simtel file without reading its events.
+
+With hessio_event_source, ``event.meta.pixel_pos``, ``event.meta.optical_foclen``
+and ``event.meta.tel_pos`` are only filled when the source is traversed. This
+module reads them directly from the run header block and the camera settings
+blocks that are at the beginning of the simtel file: events are never read.
+
+Usage: ./simtel_instrument.py FILE
+"""
+
+import argparse
+
+import astropy.units as u
+import numpy as np
+
+import simtel_eventio
+
+# The instrument description is stored before the first of these blocks
+EVENT_BLOCK_TYPES = (simtel_eventio.TYPE_MC_SHOWER,
+                     simtel_eventio.TYPE_MC_EVENT,
+                     simtel_eventio.TYPE_EVENT)
+
+
+class Instrument(object):
+    """
+    The instrument description of a simtel file.
+
+    Attributes have the same content as the ``event.meta`` attributes of
+    the same name filled by hessio_event_source.
+
+    Attributes
+    ----------
+    tel_pos : dict
+        The position (x, y, z) of each telescope (key=telescope ID, value=a
+        Quantity array in meters).
+    optical_foclen : dict
+        The focal length of each telescope (key=telescope ID, value=a
+        Quantity in meters).
+    pixel_pos : dict
+        The pixels position of each telescope (key=telescope ID, value=a
+        tuple of two Quantity arrays (x and y) in meters).
+    """
+
+    def __init__(self):
+        self.tel_pos = {}
+        self.optical_foclen = {}
+        self.pixel_pos = {}
+
+    @property
+    def tel_ids(self):
+        """The sorted list of telescope IDs."""
+        return sorted(set(self.tel_pos) | set(self.pixel_pos))
+
+
+def read_instrument(simtel_file_path):
+    """
+    Read the instrument description of the 'simtel_file_path' file.
+
+    Only the blocks stored before the first event are read.
+
+    Parameters
+    ----------
+    simtel_file_path : str
+        The path of the simtel file to read.
+
+    Returns
+    -------
+    Instrument
+        The instrument description.
+    """
+
+    instrument = Instrument()
+
+    with simtel_eventio.open_simtel_file(simtel_file_path) as fd:
+        for header in simtel_eventio.iter_blocks(fd):
+
+            if header.type in EVENT_BLOCK_TYPES:
+                break
+
+            if header.type == simtel_eventio.TYPE_RUNHEADER:
+                payload = simtel_eventio.read_payload(fd, header)
+                tel_pos_dict = simtel_eventio.parse_runheader(payload, header.version)
+
+                for tel_id, tel_pos in tel_pos_dict.items():
+                    instrument.tel_pos[int(tel_id)] = np.array(tel_pos, dtype=np.float64) * u.m
+
+            elif header.type == simtel_eventio.TYPE_CAMSETTINGS:
+                payload = simtel_eventio.read_payload(fd, header)
+                foclen, pixel_pos_x, pixel_pos_y = simtel_eventio.parse_camsettings(payload, header.version)
+
+                tel_id = int(header.ident)
+                instrument.optical_foclen[tel_id] = float(foclen) * u.m
+                instrument.pixel_pos[tel_id] = (np.array(pixel_pos_x, dtype=np.float64) * u.m,
+                                                np.array(pixel_pos_y, dtype=np.float64) * u.m)
+
+    return instrument
+
+
+def main():
+    """Parse command options (sys.argv) and print the instrument description
+    of the given simtel file."""
+
+    # PARSE OPTIONS ###########################################################
+
+    desc = "Print the instrument description of the given simtel file."
+    parser = argparse.ArgumentParser(description=desc)
+
+    parser.add_argument("fileargs", nargs=1, metavar="FILE",
+                        help="The simtel file to process")
+
+    args = parser.parse_args()
+    simtel_file_path = args.fileargs[0]
+
+    # PRINT THE INSTRUMENT ####################################################
+
+    instrument = read_instrument(simtel_file_path)
+
+    for tel_id in instrument.tel_ids:
+        print("Telescope {:03d}: position={} foclen={} num_pixels={}".format(tel_id,
+                                                                            instrument.tel_pos.get(tel_id),
+                                                                            instrument.optical_foclen.get(tel_id),
+                                                                            len(instrument.pixel_pos.get(tel_id, ([],))[0])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+The camera of each telescope of a simtel file.
+
+``ctapipe.io.CameraGeometry.guess()`` identifies a camera with a pixel
+neighbour analysis, which is expensive. This registry classifies the
+telescopes of a simtel file once: ``CameraGeometry.guess()`` is called once
+per distinct camera layout (pixels position and focal length) of the
+instrument description, and the result is saved in
+``<simtel_file>.telescope_registry.json``:
+
+    {"version": 1, "size": ..., "mtime": ...,
+     "telescopes": {"1": {"camera_id": "LSTCam",
+                          "pixel_type": "hexagonal",
+                          "num_pixels": 1855,
+                          "foclen": 28.0,
+                          "layout": "<sha1 of the pixels position and focal length>"},
+                    ...}}
+
+The registry is rebuilt when the simtel file changes. Camera geometries
+(``CameraGeometry`` objects) are resolved once per layout by the geometry
+cache (see geometry_cache.py and, for tools working on already read events,
+``get_event_camera_geometry()``).
+
+Telescope filters can be given as camera types (e.g. ``--camera ASTRI``),
+see ``add_camera_argument()`` and ``resolve_tel_ids()``.
+
+Usage: ./telescope_registry.py [--camera CAM_ID[,CAM_ID...]] [--rebuild] FILE [FILE ...]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import geometry_cache
+import simtel_instrument
+
+REGISTRY_FORMAT_VERSION = 1
+
+_registry_cache = {}    # Registries already loaded by this process (key=simtel file path)
+
+
+def get_registry_file_path(simtel_file_path):
+    """Return the path of the registry file of the 'simtel_file_path' file."""
+    return simtel_file_path + ".telescope_registry.json"
+
+
+def _get_file_signature(simtel_file_path):
+    stat = os.stat(simtel_file_path)
+    return stat.st_size, stat.st_mtime
+
+
+def build_registry(simtel_file_path):
+    """
+    Classify the telescopes of the 'simtel_file_path' file.
+
+    Only the instrument description of the file is read (see
+    simtel_instrument.py).
+
+    Returns
+    -------
+    dict
+        The registry (see the module documentation).
+    """
+
+    instrument = simtel_instrument.read_instrument(simtel_file_path)
+    size, mtime = _get_file_signature(simtel_file_path)
+
+    telescopes = {}
+
+    for tel_id in sorted(instrument.pixel_pos):
+        x, y = instrument.pixel_pos[tel_id]
+        foclen = instrument.optical_foclen[tel_id]
+
+        layout = geometry_cache.get_layout_key(x, y, foclen)
+        geom = geometry_cache.get_geometry(x, y, foclen)
+
+        telescopes[str(tel_id)] = {"camera_id": geom.cam_id,
+                                   "pixel_type": geom.pix_type,
+                                   "num_pixels": len(x),
+                                   "foclen": float(foclen.value),
+                                   "layout": layout}
+
+    return {"version": REGISTRY_FORMAT_VERSION,
+            "size": size,
+            "mtime": mtime,
+            "telescopes": telescopes}
+
+
+def _is_up_to_date(registry, simtel_file_path):
+    return (registry.get("version") == REGISTRY_FORMAT_VERSION) and \
+           ((registry["size"], registry["mtime"]) == _get_file_signature(simtel_file_path))
+
+
+def load_registry(simtel_file_path, rebuild=False):
+    """
+    Get the camera of each telescope of the 'simtel_file_path' file.
+
+    The registry is read from ``<simtel_file>.telescope_registry.json`` if this
+    file is up to date, otherwise it is (re)built and saved (if the simtel
+    file directory is writable).
+
+    Parameters
+    ----------
+    simtel_file_path : str
+        The path of the simtel file.
+    rebuild : bool
+        Force the registry to be rebuilt.
+
+    Returns
+    -------
+    dict
+        The camera description of each telescope (key=telescope ID,
+        value=a dictionary with the "camera_id", "pixel_type", "num_pixels",
+        "foclen" and "layout" items).
+    """
+
+    registry = _registry_cache.get(simtel_file_path)
+
+    if (not rebuild) and (registry is not None) and _is_up_to_date(registry, simtel_file_path):
+        return registry["tel_dict"]
+
+    registry_file_path = get_registry_file_path(simtel_file_path)
+    registry = None
+
+    if (not rebuild) and os.path.isfile(registry_file_path):
+        try:
+            with open(registry_file_path, "r") as fd:
+                registry = json.load(fd)
+        except ValueError:
+            registry = None     # Corrupted registry file
+        if (not isinstance(registry, dict)) or not _is_up_to_date(registry, simtel_file_path):
+            registry = None
+
+    if registry is None:
+        registry = build_registry(simtel_file_path)
+        try:
+            with open(registry_file_path, "w") as fd:
+                json.dump(registry, fd, sort_keys=True, indent=4)
+        except OSError as e:
+            print("Warning: cannot save the telescope registry ({})".format(e), file=sys.stderr)
+
+    registry["tel_dict"] = {int(tel_id): camera for tel_id, camera in registry["telescopes"].items()}
+    _registry_cache[simtel_file_path] = registry
+
+    return registry["tel_dict"]
+
+
+def get_camera(simtel_file_path, tel_id):
+    """Return the camera description (see ``load_registry()``) of the
+    telescope 'tel_id'."""
+
+    try:
+        return load_registry(simtel_file_path)[tel_id]
+    except KeyError:
+        raise ValueError("Telescope {} is not defined in {}.".format(tel_id, simtel_file_path))
+
+
+def get_event_camera_geometry(event, tel_id):
+    """
+    Return the ``CameraGeometry`` of the telescope 'tel_id' from the
+    instrument description of the (already read) 'event'.
+
+    Telescopes that have the same camera layout share the same object (see
+    geometry_cache.py).
+    """
+
+    x, y = event.meta.pixel_pos[tel_id]
+
+    return geometry_cache.get_geometry(x, y, event.meta.optical_foclen[tel_id])
+
+
+def resolve_tel_ids(simtel_file_path, tel_id_list=None, cam_id_list=None):
+    """
+    Return the sorted list of the telescopes of 'simtel_file_path' that are
+    in 'tel_id_list' and that have a camera in 'cam_id_list' (a None list
+    doesn't filter).
+    """
+
+    registry = load_registry(simtel_file_path)
+
+    tel_ids = sorted(registry)
+
+    if tel_id_list is not None:
+        tel_id_set = set(tel_id_list)
+        tel_ids = [tel_id for tel_id in tel_ids if tel_id in tel_id_set]
+
+    if cam_id_list is not None:
+        cam_id_set = set(cam_id_list)
+        tel_ids = [tel_id for tel_id in tel_ids if registry[tel_id]["camera_id"] in cam_id_set]
+
+    return tel_ids
+
+
+def parse_camera_list(cam_id_list_str):
+    """Convert a "CAM_ID,CAM_ID,..." string to a list of camera IDs (None
+    if 'cam_id_list_str' is None)."""
+
+    if cam_id_list_str is None:
+        return None
+
+    return [cam_id.strip() for cam_id in cam_id_list_str.split(",") if cam_id.strip() != ""]
+
+
+def add_camera_argument(parser):
+    """Add the ``--camera`` option to the argparse 'parser' (see
+    ``parse_camera_list()``)."""
+
+    parser.add_argument("--camera", default=None,
+                        metavar="STRING LIST",
+                        help="Only process the telescopes that have one of these cameras (camera IDs separated by a comma, e.g. ASTRI)")
+
+
+def main():
+    """Parse command options (sys.argv) and print the camera of each
+    telescope of the given simtel files."""
+
+    # PARSE OPTIONS ###########################################################
+
+    desc = "Print (and save) the camera of each telescope of the given simtel files."
+    parser = argparse.ArgumentParser(description=desc)
+
+    add_camera_argument(parser)
+
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Rebuild the registry even if it is up to date")
+
+    parser.add_argument("fileargs", nargs="+", metavar="FILE",
+                        help="The simtel files to process")
+
+    args = parser.parse_args()
+
+    cam_id_list = parse_camera_list(args.camera)
+
+    # PRINT THE REGISTRY ######################################################
+
+    for simtel_file_path in args.fileargs:
+        registry = load_registry(simtel_file_path, rebuild=args.rebuild)
+
+        if len(args.fileargs) > 1:
+            print(simtel_file_path)
+
+        for tel_id in resolve_tel_ids(simtel_file_path, cam_id_list=cam_id_list):
+            camera = registry[tel_id]
+            print("Telescope {:03d}: {} ({} pixels)".format(tel_id, camera["camera_id"], camera["pixel_type"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests of mc_calibration.py (run with pytest).
+"""
+
+import numpy as np
+import pytest
+
+import image_crop
+import mc_calibration
+
+
+def make_images(num_pixels=2368, seed=0):
+    rng = np.random.RandomState(seed)
+    adcs = rng.randint(0, 5000, size=(2, num_pixels)).astype(np.uint16)
+    pedestals = rng.uniform(200., 400., size=(2, num_pixels))
+    gains = rng.uniform(0.01, 0.2, size=(2, num_pixels))
+    return adcs, pedestals, gains
+
+
+# A grid with cells without pixel
+MASKED_GRID_MAP = image_crop.GridMap([[-1, 0, 1],
+                                      [2, 3, -1],
+                                      [4, -1, 5]])
+
+
+@pytest.mark.parametrize("grid_map", [image_crop.ASTRI_GRID_MAP, MASKED_GRID_MAP])
+def test_crop_calibrator_per_pixel_threshold(grid_map):
+    num_pixels = int(grid_map.take_index.max()) + 1
+    adcs, pedestals, gains = make_images(num_pixels)
+
+    # A per-pixel threshold that switches about half of the pixels
+    adc_threshold = np.random.RandomState(1).uniform(0., 5000., size=num_pixels)
+
+    expected = grid_map.crop(mc_calibration.apply_gain_switch(adcs, pedestals, gains, adc_threshold))
+
+    calibrator = mc_calibration.CropCalibrator(grid_map)
+    out = np.empty(grid_map.shape)
+
+    calibrator.calibrate(adcs, pedestals, gains, out, adc_threshold)
+    np.testing.assert_array_equal(out, expected)
+
+    # A new threshold array is taken into account
+    calibrator.calibrate(adcs, pedestals, gains, out, adc_threshold / 2.)
+    expected = grid_map.crop(mc_calibration.apply_gain_switch(adcs, pedestals, gains, adc_threshold / 2.))
+    np.testing.assert_array_equal(out, expected)
+
+
+def test_crop_calibrator_scalar_threshold():
+    grid_map = image_crop.ASTRI_GRID_MAP
+    adcs, pedestals, gains = make_images(int(grid_map.take_index.max()) + 1)
+
+    expected = grid_map.crop(mc_calibration.apply_gain_switch(adcs, pedestals, gains))
+
+    out = np.empty(grid_map.shape)
+    mc_calibration.CropCalibrator(grid_map).calibrate(adcs, pedestals, gains, out)
+
+    np.testing.assert_array_equal(out, expected)
+
+
+class FakeEvent(object):
+    """An event with the ADC sums of one telescope (as read by
+    hessio_event_source: one array per channel)."""
+
+    def __init__(self, tel_id, adc_sums):
+        tel = type("Tel", (object,), {"adc_sums": adc_sums})()
+        dl0 = type("DL0", (object,), {"tel": {tel_id: tel}})()
+        self.dl0 = dl0
+
+
+def test_calibrate_stack_with_channel_dict():
+    adcs, pedestals, gains = make_images()
+
+    # The channels of adc_sums are given in a dict
+    events = [FakeEvent(1, {channel: adcs[channel] + i for channel in range(2)}) for i in range(3)]
+
+    stack = np.array([mc_calibration.get_adc_sums(event, 1) for event in events])
+    assert stack.shape == (3, 2, adcs.shape[1])
+
+    out = mc_calibration.calibrate_stack(stack, pedestals, gains)
+
+    for i, image in enumerate(out):
+        np.testing.assert_array_equal(image, mc_calibration.apply_gain_switch(adcs + i, pedestals, gains))
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Event x telescope trigger matrix of simtel files.
+
+A trigger matrix is a boolean array with one row per event and one column per
+telescope (True if the telescope has triggered for the event). It is built
+with the trigger-only scan of ``simtel_index.py`` and saved next to the simtel
+file (``<simtel_file>.trigger_matrix.npz``, one bit per (event, telescope)
+pair). It is rebuilt when the simtel file changes (size or modification time).
+
+Set operations on (event_id, tel_id) pairs of several simtel files are done
+with vectorized bitwise operations on aligned trigger matrices.
+"""
+
+import os
+import sys
+import tempfile
+import zipfile
+
+import numpy as np
+
+import simtel_index
+
+
+class TriggerMatrix(object):
+    """
+    Event x telescope trigger matrix.
+
+    Attributes
+    ----------
+    event_ids : numpy.array
+        The (sorted) event IDs, one per row of ``matrix``.
+    tel_ids : numpy.array
+        The (sorted) telescope IDs, one per column of ``matrix``.
+    matrix : numpy.array
+        The 2D boolean trigger matrix.
+    """
+
+    def __init__(self, event_ids, tel_ids, matrix):
+        self.event_ids = np.asarray(event_ids, dtype=np.int64)
+        self.tel_ids = np.asarray(tel_ids, dtype=np.int64)
+        self.matrix = np.asarray(matrix, dtype=np.bool_).reshape(len(self.event_ids), len(self.tel_ids))
+
+    def __len__(self):
+        """Return the number of (event_id, tel_id) pairs."""
+        return int(np.count_nonzero(self.matrix))
+
+    def num_events_per_telescope(self):
+        """Return the number of triggered events of each telescope (a
+        dictionary: key=telescope id, value=number of events)."""
+        counts = np.count_nonzero(self.matrix, axis=0)
+        return {int(tel_id): int(count) for tel_id, count in zip(self.tel_ids, counts) if count > 0}
+
+    def multiplicity(self):
+        """Return the number of triggered telescopes of each event (a 1D
+        array aligned with ``event_ids``)."""
+        return np.count_nonzero(self.matrix, axis=1)
+
+    def pairs(self):
+        """Return the list of (event_id, tel_id) pairs (sorted by event ID
+        then by telescope ID)."""
+        rows, cols = np.nonzero(self.matrix)
+        return list(zip(self.event_ids[rows].tolist(), self.tel_ids[cols].tolist()))
+
+    def align(self, event_ids, tel_ids):
+        """Return the trigger matrix reindexed on the given (sorted) 'event_ids'
+        and 'tel_ids' (which must contain the IDs of this matrix)."""
+        aligned_matrix = np.zeros((len(event_ids), len(tel_ids)), dtype=np.bool_)
+        rows = np.searchsorted(event_ids, self.event_ids)
+        cols = np.searchsorted(tel_ids, self.tel_ids)
+        aligned_matrix[np.ix_(rows, cols)] = self.matrix
+        return aligned_matrix
+
+
+def get_trigger_matrix_file_path(simtel_file_path):
+    """Return the path of the trigger matrix file of the 'simtel_file_path'
+    file."""
+    return simtel_file_path + ".trigger_matrix.npz"
+
+
+def build_trigger_matrix(simtel_file_path):
+    """
+    Make the trigger matrix of the 'simtel_file_path' file (using the
+    trigger-only scan of ``simtel_index.iter_triggers()``).
+
+    Parameters
+    ----------
+    simtel_file_path : str
+        The path of the simtel file.
+
+    Returns
+    -------
+    TriggerMatrix
+        The trigger matrix of the simtel file.
+    """
+
+    trigger_list = list(simtel_index.iter_triggers(simtel_file_path))
+
+    event_ids = np.array([event_id for event_id, tels_with_trigger in trigger_list], dtype=np.int64)
+    tel_ids = np.unique(np.array([tel_id for event_id, tels_with_trigger in trigger_list
+                                         for tel_id in tels_with_trigger], dtype=np.int64))
+
+    matrix = np.zeros((len(event_ids), len(tel_ids)), dtype=np.bool_)
+
+    for row, (event_id, tels_with_trigger) in enumerate(trigger_list):
+        matrix[row, np.searchsorted(tel_ids, tels_with_trigger)] = True
+
+    # Event IDs are monotone within a simtel file but sort them anyway
+    order = np.argsort(event_ids, kind="mergesort")
+
+    return TriggerMatrix(event_ids[order], tel_ids, matrix[order])
+
+
+def _read_trigger_matrix(matrix_file_path, stat):
+    """Return the trigger matrix saved in 'matrix_file_path', or None if it
+    is out of date (see 'stat', the ``os.stat()`` of the simtel file) or
+    unreadable."""
+
+    try:
+        with np.load(matrix_file_path) as data:
+            if (int(data["size"]) == stat.st_size) and (float(data["mtime"]) == stat.st_mtime):
+                tel_ids = data["tel_ids"]
+                matrix = np.unpackbits(data["bits"], axis=1)[:, :len(tel_ids)]
+                return TriggerMatrix(data["event_ids"], tel_ids, matrix)
+    except (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile):
+        pass                    # Corrupted trigger matrix file
+
+    return None
+
+
+def load_trigger_matrix(simtel_file_path, rebuild=False):
+    """
+    Get the trigger matrix of the 'simtel_file_path' file.
+
+    The matrix is read from ``<simtel_file>.trigger_matrix.npz`` if this file
+    is up to date (and readable), otherwise it is (re)built and saved (if the
+    simtel file directory is writable).
+
+    Parameters
+    ----------
+    simtel_file_path : str
+        The path of the simtel file.
+    rebuild : bool
+        Force the trigger matrix to be rebuilt.
+
+    Returns
+    -------
+    TriggerMatrix
+        The trigger matrix of the simtel file.
+    """
+
+    stat = os.stat(simtel_file_path)
+    matrix_file_path = get_trigger_matrix_file_path(simtel_file_path)
+
+    if (not rebuild) and os.path.isfile(matrix_file_path):
+        trigger_matrix = _read_trigger_matrix(matrix_file_path, stat)
+        if trigger_matrix is not None:
+            return trigger_matrix
+
+    trigger_matrix = build_trigger_matrix(simtel_file_path)
+
+    try:
+        # Write a temporary file then rename it (concurrent processes never
+        # read a partial trigger matrix)
+        tmp_fd, tmp_file_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(matrix_file_path)), suffix=".tmp")
+        try:
+            with os.fdopen(tmp_fd, "wb") as fd:
+                np.savez_compressed(fd,
+                                    event_ids=trigger_matrix.event_ids,
+                                    tel_ids=trigger_matrix.tel_ids,
+                                    bits=np.packbits(trigger_matrix.matrix, axis=1),
+                                    size=stat.st_size,
+                                    mtime=stat.st_mtime)
+            os.replace(tmp_file_path, matrix_file_path)
+        finally:
+            if os.path.exists(tmp_file_path):
+                os.remove(tmp_file_path)
+    except OSError as e:
+        print("Warning: cannot save the trigger matrix ({})".format(e), file=sys.stderr)
+
+    return trigger_matrix
+
+
+def _align_all(trigger_matrix_list):
+    event_ids = np.unique(np.concatenate([tm.event_ids for tm in trigger_matrix_list]))
+    tel_ids = np.unique(np.concatenate([tm.tel_ids for tm in trigger_matrix_list]))
+    return event_ids, tel_ids, (tm.align(event_ids, tel_ids) for tm in trigger_matrix_list)
+
+
+def union(trigger_matrix_list):
+    """Return the (event_id, tel_id) pairs that are in at least one of the
+    given trigger matrices (as a TriggerMatrix)."""
+    event_ids, tel_ids, aligned_matrices = _align_all(trigger_matrix_list)
+
+    result = np.zeros((len(event_ids), len(tel_ids)), dtype=np.bool_)
+    for aligned_matrix in aligned_matrices:
+        result |= aligned_matrix
+
+    return TriggerMatrix(event_ids, tel_ids, result)
+
+
+def intersection(trigger_matrix_list):
+    """Return the (event_id, tel_id) pairs that are in all the given trigger
+    matrices (as a TriggerMatrix)."""
+    event_ids, tel_ids, aligned_matrices = _align_all(trigger_matrix_list)
+
+    result = np.ones((len(event_ids), len(tel_ids)), dtype=np.bool_)
+    for aligned_matrix in aligned_matrices:
+        result &= aligned_matrix
+
+    return TriggerMatrix(event_ids, tel_ids, result)
+
+
+def difference(trigger_matrix_list):
+    """Return the (event_id, tel_id) pairs that are in at least one of the
+    given trigger matrices but not in all of them (as a TriggerMatrix)."""
+    event_ids, tel_ids, aligned_matrices = _align_all(trigger_matrix_list)
+
+    in_any = np.zeros((len(event_ids), len(tel_ids)), dtype=np.bool_)
+    in_all = np.ones((len(event_ids), len(tel_ids)), dtype=np.bool_)
+    for aligned_matrix in aligned_matrices:
+        in_any |= aligned_matrix
+        in_all &= aligned_matrix
+
+    return TriggerMatrix(event_ids, tel_ids, in_any & ~in_all)
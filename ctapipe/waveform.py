@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Time-resolved (per sample) processing of simtel camera readouts.
+
+``event.dl0.tel[tel_id].adc_samples`` gives, for each channel, the ADC value
+of each pixel at each time sample. This module stacks them in a (channel x
+pixel x sample) array, subtracts the pedestal of each sample and extracts the
+charge and the pulse time of all the pixels at once with one of these
+integration methods:
+
+- fixed window: the samples of a given window are summed;
+- sliding window: the window (of a given width) with the largest sum is
+  searched for each pixel;
+- neighbour peak: the window is centered on the peak of the sum of the
+  waveforms of the neighbour pixels (less sensitive to noise for faint
+  pixels).
+
+Window sums are computed with a cumulative sum along the samples axis, thus
+there is no Python loop over samples or pixels. Times are given in samples.
+"""
+
+import numpy as np
+import scipy.sparse
+
+DEFAULT_WINDOW_WIDTH = 7        # Samples
+
+
+def get_waveforms(event, tel_id):
+    """
+    Return the (channel x pixel x sample) ADC array of the telescope 'tel_id'
+    for the (already read) 'event'.
+    """
+
+    adc_samples = event.dl0.tel[tel_id].adc_samples
+
+    if isinstance(adc_samples, dict):
+        return np.array([adc_samples[channel] for channel in sorted(adc_samples)])
+
+    return np.asarray(adc_samples)
+
+
+def subtract_pedestal(waveforms, pedestals):
+    """
+    Subtract the pedestal of each sample from the waveforms.
+
+    Parameters
+    ----------
+    waveforms : numpy.array
+        The ADC waveforms (channel x pixel x sample, or pixel x sample).
+    pedestals : numpy.array
+        The pedestal of each pixel (channel x pixel, or pixel) integrated
+        over all the samples of the readout (as given by pyhessio).
+
+    Returns
+    -------
+    numpy.array
+        The pedestal subtracted waveforms.
+    """
+
+    waveforms = np.asarray(waveforms)
+    num_samples = waveforms.shape[-1]
+
+    return waveforms - np.asarray(pedestals)[..., np.newaxis] / num_samples
+
+
+def peak_times(waveforms):
+    """Return the sample of the maximum of each waveform (channel x pixel
+    array)."""
+    return np.argmax(waveforms, axis=-1)
+
+
+def _cumulative_sums(waveforms):
+    """Return the cumulative sums of the waveforms and of the waveforms
+    weighted by the sample index (both start with a 0 sample)."""
+
+    samples = np.arange(waveforms.shape[-1])
+    zeros = np.zeros(waveforms.shape[:-1] + (1,))
+
+    charge_sums = np.concatenate([zeros, np.cumsum(waveforms, axis=-1, dtype=np.float64)], axis=-1)
+    time_sums = np.concatenate([zeros, np.cumsum(waveforms * samples, axis=-1, dtype=np.float64)], axis=-1)
+
+    return charge_sums, time_sums
+
+
+def _integrate_windows(waveforms, starts, width):
+    """Return the charge and the (charge weighted) time of the windows
+    [start, start + width) of each waveform ('starts' is an array of the
+    waveforms shape without the sample axis, or a scalar)."""
+
+    charge_sums, time_sums = _cumulative_sums(waveforms)
+
+    starts = np.broadcast_to(starts, waveforms.shape[:-1])[..., np.newaxis]
+    stops = starts + width
+
+    charges = (np.take_along_axis(charge_sums, stops, axis=-1) - np.take_along_axis(charge_sums, starts, axis=-1))[..., 0]
+    weighted_times = (np.take_along_axis(time_sums, stops, axis=-1) - np.take_along_axis(time_sums, starts, axis=-1))[..., 0]
+
+    # The time of windows without (positive) charge is the window center
+    times = starts[..., 0] + (width - 1) / 2.
+    np.divide(weighted_times, charges, out=times, where=charges > 0)
+
+    return charges, times
+
+
+def _check_window(waveforms, width):
+    num_samples = np.asarray(waveforms).shape[-1]
+    if not 0 < width <= num_samples:
+        raise ValueError("The integration window width should be in [1, {}].".format(num_samples))
+
+
+def integrate_fixed_window(waveforms, start, width):
+    """
+    Integrate the samples [start, start + width) of each waveform.
+
+    Parameters
+    ----------
+    waveforms : numpy.array
+        The pedestal subtracted waveforms (channel x pixel x sample).
+    start : int
+        The first sample of the window.
+    width : int
+        The number of samples of the window.
+
+    Returns
+    -------
+    tuple of numpy.array
+        The charge and the pulse time (charge weighted mean sample in the
+        window) of each pixel (channel x pixel arrays).
+    """
+
+    _check_window(waveforms, width)
+
+    if not 0 <= start <= np.asarray(waveforms).shape[-1] - width:
+        raise ValueError("The integration window is out of the readout.")
+
+    return _integrate_windows(np.asarray(waveforms), start, width)
+
+
+def integrate_sliding_window(waveforms, width):
+    """
+    Integrate, for each waveform, the window of 'width' samples that has the
+    largest sum.
+
+    Returns
+    -------
+    tuple of numpy.array
+        The charge and the pulse time of each pixel (channel x pixel arrays).
+    """
+
+    _check_window(waveforms, width)
+
+    waveforms = np.asarray(waveforms)
+    charge_sums, time_sums = _cumulative_sums(waveforms)
+
+    window_sums = charge_sums[..., width:] - charge_sums[..., :-width]
+    starts = np.argmax(window_sums, axis=-1)
+
+    return _integrate_windows(waveforms, starts, width)
+
+
+def make_neighbour_matrix(neighbours, num_pixels=None):
+    """
+    Make the (pixel x pixel) sparse adjacency matrix of a camera.
+
+    Parameters
+    ----------
+    neighbours : list of list of int
+        The neighbours of each pixel (e.g. ``geom.neighbors`` of a
+        ``ctapipe.io.CameraGeometry``).
+    num_pixels : int
+        The number of pixels (``len(neighbours)`` if None).
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix
+        The adjacency matrix.
+    """
+
+    if num_pixels is None:
+        num_pixels = len(neighbours)
+
+    rows = [pixel for pixel, pixel_neighbours in enumerate(neighbours) for neighbour in pixel_neighbours]
+    cols = [neighbour for pixel_neighbours in neighbours for neighbour in pixel_neighbours]
+
+    return scipy.sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(num_pixels, num_pixels))
+
+
+def integrate_neighbour_peak(waveforms, neighbour_matrix, width, offset=None):
+    """
+    Integrate each waveform in a window placed on the peak of the sum of the
+    waveforms of its neighbour pixels.
+
+    Parameters
+    ----------
+    waveforms : numpy.array
+        The pedestal subtracted waveforms (channel x pixel x sample).
+    neighbour_matrix : scipy.sparse matrix
+        The (pixel x pixel) adjacency matrix of the camera (see
+        ``make_neighbour_matrix()``).
+    width : int
+        The number of samples of the window.
+    offset : int
+        The number of samples of the window before the peak (``width // 2``
+        if None).
+
+    Returns
+    -------
+    tuple of numpy.array
+        The charge and the pulse time of each pixel (channel x pixel arrays).
+    """
+
+    _check_window(waveforms, width)
+
+    waveforms = np.asarray(waveforms)
+    num_channels, num_pixels, num_samples = waveforms.shape
+
+    if offset is None:
+        offset = width // 2
+
+    # Sum the neighbour waveforms of all pixels with one sparse product
+    # (pixel x (channel, sample))
+    flat_waveforms = waveforms.transpose(1, 0, 2).reshape(num_pixels, -1)
+    neighbour_waveforms = (neighbour_matrix @ flat_waveforms).reshape(num_pixels, num_channels, num_samples).transpose(1, 0, 2)
+
+    starts = np.clip(peak_times(neighbour_waveforms) - offset, 0, num_samples - width)
+
+    return _integrate_windows(waveforms, starts, width)
@@ -7,6 +7,7 @@ import argparse
 from astropy.io import fits
 
 import os
+import tempfile
 
 import numpy as np
 import matplotlib.pyplot as plt
@@ -19,16 +20,42 @@ def get_image_array_from_fits_file(file_path):
     
     hdu_list = fits.open(file_path)   # open the FITS file
 
-    if len(hdu_list) != 1:
-        raise Exception("The FITS file should contain only one HDU.")
+    # The image is the first HDU that contains data: tile-compressed FITS
+    # files (see ctapipe/fits_io.py) have an empty primary HDU
+    image_hdu_list = [hdu for hdu in hdu_list
+                      if isinstance(hdu, (fits.PrimaryHDU, fits.ImageHDU, fits.CompImageHDU)) and (hdu.data is not None)]
 
-    image_array = hdu_list[0].data    # "hdu.data" is a Numpy Array
+    if len(image_hdu_list) == 0:
+        raise Exception("The FITS file should contain an image.")
+
+    image_array = np.array(image_hdu_list[0].data)    # "hdu.data" is a Numpy Array
 
     hdu_list.close()
 
     return image_array
 
 
+def make_mr_transform_input_file(file_path, image_array):
+    """
+    Return the path of a FITS file mr_transform can read for 'file_path'.
+
+    mr_transform reads the primary HDU of its input file: if the image of
+    'file_path' is not in the primary HDU (e.g. tile-compressed files), it is
+    written (uncompressed) in a temporary file that the caller has to remove.
+    """
+
+    with fits.open(file_path) as hdu_list:
+        if hdu_list[0].header.get("NAXIS", 0) > 0:
+            return file_path
+
+    fd, tmp_file_path = tempfile.mkstemp(suffix=".fits")
+
+    with os.fdopen(fd, "wb") as tmp_file:
+        fits.PrimaryHDU(image_array).writeto(tmp_file)
+
+    return tmp_file_path
+
+
 def save_image(img, output_file_path):
     """
     img should be a 2D numpy array.
@@ -77,10 +104,15 @@ def main():
 
     # EXECUTE MR_TRANSFORM ########################################################
 
+    mr_input_file_path = make_mr_transform_input_file(input_file_path, input_img)
+
     # TODO: improve the following lines
-    cmd = 'mr_transform -n{} "{}" out'.format(number_of_scales, input_file_path)
+    cmd = 'mr_transform -n{} "{}" out'.format(number_of_scales, mr_input_file_path)
     os.system(cmd)
 
+    if mr_input_file_path != input_file_path:
+        os.remove(mr_input_file_path)
+
     # TODO: improve the following lines
     cmd = "mv out.mr {}".format(MR_OUTPUT_FILE_PATH)
     os.system(cmd)